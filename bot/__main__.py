@@ -1,47 +1,139 @@
+import argparse
 import asyncio
+import contextlib
 import logging
+import signal
 
-from aiogram.types import BotCommand
+# Modules are imported where they are used: a worker does not load the
+# background jobs, and --profile-startup can time every import
 
-from bot.db.engine import init_db
-from bot.loader import create_bot, create_dispatcher
-from bot.services.llm import close_session
 
-
-async def main() -> None:
+def _setup_logging() -> None:
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
     )
+
+
+async def worker_main(index: int) -> None:
+    _setup_logging()
+    # Ctrl+C and a service manager's SIGTERM reach the whole process group;
+    # the front process decides when workers stop by closing their stdin
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from bot.loader import create_bot, create_dispatcher
+    from bot.workers import run_worker
+
+    await run_worker(index, create_bot(), create_dispatcher())
+
+
+async def main() -> None:
+    _setup_logging()
     logger = logging.getLogger(__name__)
 
-    logger.info("Initializing database...")
-    await init_db()
+    from bot.config import settings
+    from bot.db.engine import init_db
+    from bot.loader import create_bot, create_dispatcher
+    from bot.services import lifecycle, quota
+    from bot.services.analytics import analytics_loop
+    from bot.services.archive import archival_loop
+    from bot.services.backup import backup_loop
+    from bot.services.llm import keepalive_loop
+    from bot.services.reminders import reminder_loop
+    from bot.services.replies import recovery_loop
+    from bot.services.reset import purge_loop
+    from bot.services.search import fts_backfill_loop
+    from bot.startup import set_commands
+    from bot.workers import run_front
 
+    lifecycle.install_signal_handlers()
     bot = create_bot()
-    dp = create_dispatcher()
+    # Opens connections to the LLM hosts while the database is prepared
+    http_task = asyncio.create_task(keepalive_loop())
+    logger.info("Initializing database...")
+    await asyncio.gather(init_db(), set_commands(bot))
+
+    archive_task = asyncio.create_task(archival_loop())
+    recovery_task = asyncio.create_task(recovery_loop(bot))
+    reminder_task = asyncio.create_task(reminder_loop(bot))
+    search_task = asyncio.create_task(fts_backfill_loop())
+    purge_task = asyncio.create_task(purge_loop())
+    quota_task = asyncio.create_task(quota.quota_loop())
+    analytics_task = (
+        asyncio.create_task(analytics_loop())
+        if settings.analytics_interval_hours > 0
+        else None
+    )
+    backup_task = (
+        asyncio.create_task(backup_loop())
+        if settings.backup_interval_hours > 0
+        else None
+    )
+
+    dp = None
+    if settings.workers > 0:
+        logger.info("Starting FreePsy bot with %d workers...", settings.workers)
+        serving = asyncio.create_task(run_front(bot))
+    else:
+        logger.info("Starting FreePsy bot...")
+        dp = create_dispatcher()
+        serving = asyncio.create_task(
+            dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+        )
+    lifecycle.set_state(lifecycle.SERVING)
 
     try:
-        await bot.set_my_commands([
-            BotCommand(command="start", description="Начать диалог"),
-            BotCommand(command="help", description="Список команд"),
-            BotCommand(command="mood", description="Записать настроение"),
-            BotCommand(command="diary", description="Дневник за неделю"),
-            BotCommand(command="breathe", description="Дыхательная техника"),
-            BotCommand(command="ground", description="Техника заземления"),
-            BotCommand(command="reset", description="Очистить историю"),
-        ])
-        logger.info("Bot commands menu set.")
-    except Exception:
-        logger.warning("Failed to set bot commands menu, continuing anyway.", exc_info=True)
-
-    logger.info("Starting FreePsy bot...")
-    try:
-        await dp.start_polling(bot)
+        await lifecycle.serve(serving)
+        # Stop taking updates; handlers already running carry on
+        lifecycle.set_state(lifecycle.DRAINING)
+        if dp is not None:
+            if not serving.done():
+                await dp.stop_polling()
+        else:
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+        await lifecycle.drain(settings.shutdown_timeout)
     finally:
-        await close_session()
-        await bot.session.close()
+        serving.cancel()
+        http_task.cancel()
+        archive_task.cancel()
+        recovery_task.cancel()
+        reminder_task.cancel()
+        search_task.cancel()
+        purge_task.cancel()
+        quota_task.cancel()
+        if analytics_task is not None:
+            analytics_task.cancel()
+        if backup_task is not None:
+            backup_task.cancel()
+        await lifecycle.close(bot)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bot")
+    # Set by the front process when it spawns workers
+    parser.add_argument("--worker", type=int, metavar="INDEX", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print import and startup timings and exit",
+    )
+    return parser.parse_args()
+
+
+async def profile_main() -> None:
+    from bot.startup import profile_startup
+
+    print(await profile_startup())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = _parse_args()
+    if args.profile_startup:
+        asyncio.run(profile_main())
+    elif args.worker is not None:
+        asyncio.run(worker_main(args.worker))
+    else:
+        asyncio.run(main())
@@ -1,10 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace, MISSING
 import os
 
 from dotenv import load_dotenv
 
-load_dotenv()
-
 
 @dataclass(frozen=True)
 class Settings:
@@ -12,9 +10,52 @@ class Settings:
     openrouter_api_key: str
     default_model: str = "stepfun/step-3.5-flash:free"
     db_path: str = "data/freepsy.db"
+    # Conversation messages older than this are moved to the compressed archive
+    archive_after_days: int = 90
+    # Scheduled analytics export; 0 disables it (admins can still run /analytics)
+    analytics_interval_hours: int = 0
+    # Online backups; 0 disables the schedule (admins can still run /backup)
+    backup_interval_hours: int = 24
+    backup_keep: int = 7
+    # Empty means a "backups" directory next to the database
+    backup_dir: str = ""
+    # Worker processes for updates, partitioned by user_id; 0 runs everything
+    # in one process
+    workers: int = 0
+    # Seconds a stopping bot waits for replies in progress (see
+    # bot/services/lifecycle.py); keep the deploy's stop timeout above it
+    shutdown_timeout: float = 30.0
+    # Split per-user tables over this many files next to DB_PATH (see
+    # bot/db/shards.py); change it with `python -m bot.tools.reshard`
+    shards: int = 0
+    # Load shedding: under pressure ordinary turns get a smaller history and
+    # this model (empty keeps the current one). A threshold of 0 turns its
+    # signal off
+    fallback_model: str = ""
+    load_max_in_flight: int = 20
+    load_max_latency: float = 45.0  # seconds, moving average of LLM calls
+    load_max_queue_wait: float = 20.0  # seconds from message to LLM call
+    # More LLM endpoints next to OPENROUTER_API_KEY, see bot/services/endpoints.py:
+    # comma-separated OpenRouter keys, and `url|api_key|max_concurrency|model`
+    # entries for other OpenAI-compatible servers
+    extra_api_keys: str = ""
+    llm_endpoints: str = ""
+
+
+def _env_overrides() -> dict:
+    """Optional settings can be overridden by env vars named in upper case."""
+    overrides = {}
+    for f in fields(Settings):
+        if f.default is MISSING:
+            continue
+        value = os.getenv(f.name.upper())
+        if value is not None:
+            overrides[f.name] = f.type(value)
+    return overrides
 
 
 def get_settings() -> Settings:
+    load_dotenv()
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not token:
@@ -24,7 +65,30 @@ def get_settings() -> Settings:
     return Settings(
         telegram_bot_token=token,
         openrouter_api_key=api_key,
+        **_env_overrides(),
     )
 
 
-settings = get_settings()
+class _LazySettings:
+    """Reads .env and the environment on first attribute access, so modules
+    can be imported (by tools, benchmarks, the startup profiler) without a
+    configured bot.
+    """
+
+    _settings: Settings | None = None
+
+    def __getattr__(self, name: str):
+        if self._settings is None:
+            _LazySettings._settings = get_settings()
+        return getattr(self._settings, name)
+
+
+settings: Settings = _LazySettings()  # type: ignore[assignment]
+
+
+def replace_settings(**changes) -> None:
+    """Change settings for the rest of the process; the startup profiler
+    points DB_PATH at a scratch copy this way.
+    """
+    current = _LazySettings._settings or get_settings()
+    _LazySettings._settings = replace(current, **changes)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Callable
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Called with (pages_copied, pages_total) after every step
+ProgressCallback = Callable[[int, int], object]
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _step_copy(
+    src: sqlite3.Connection,
+    dst: sqlite3.Connection,
+    pages: int,
+    sleep: float,
+    max_restarts: int,
+    progress: ProgressCallback | None,
+) -> None:
+    last_remaining: int | None = None
+    restarts = 0
+
+    def on_step(status: int, remaining: int, total: int) -> None:
+        nonlocal last_remaining, restarts
+        # A write by another connection makes SQLite start over from page 1.
+        # Under a write between every pair of steps the count never grows, it
+        # just stays put, so a step without progress counts too; one that
+        # got SQLITE_BUSY or SQLITE_LOCKED is retried and does not.
+        if (
+            status == sqlite3.SQLITE_OK
+            and last_remaining is not None
+            and remaining >= last_remaining
+        ):
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts
+        last_remaining = remaining
+        if progress is not None:
+            progress(total - remaining, total)
+        # backup() itself only sleeps after SQLITE_BUSY/LOCKED, never
+        # between steps that succeeded
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    src.backup(dst, pages=pages, progress=on_step, sleep=sleep)
+
+
+def _copy(
+    src_path: str,
+    dest_path: str,
+    pages: int,
+    sleep: float,
+    max_restarts: int,
+    progress: ProgressCallback | None,
+) -> None:
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dest_path)
+    try:
+        try:
+            _step_copy(src, dst, pages, sleep, max_restarts, progress)
+        except _TooManyRestarts:
+            # Writes keep invalidating the copy. A single pass holds one WAL
+            # read snapshot for its whole duration, which does not block writers.
+            logger.info("Backup restarted %d times, finishing in one pass", max_restarts)
+            _step_copy(src, dst, -1, 0, 0, progress)
+        # A snapshot is a standalone file — no -wal/-shm companions
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+
+async def copy_database(
+    dest_path: str,
+    *,
+    source: str | None = None,
+    pages: int = -1,
+    sleep: float = 0.0,
+    max_restarts: int = 10,
+    progress: ProgressCallback | None = None,
+) -> None:
+    """Consistent copy of the live database (or of the `source` file, such as
+    a shard) via SQLite's online backup API.
+
+    Runs on its own connection in a worker thread. With `pages` > 0 the copy
+    is made in steps of that many pages, sleeping `sleep` seconds in between;
+    the source is not read-locked between steps.
+    """
+    await asyncio.to_thread(
+        _copy, source or settings.db_path, dest_path, pages, sleep, max_restarts, progress
+    )
+
+
+def _integrity_check(path: str) -> str:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "\n".join(r[0] for r in rows)
+
+
+async def integrity_check(path: str) -> str:
+    """PRAGMA integrity_check of a database file; returns 'ok' when healthy."""
+    return await asyncio.to_thread(_integrity_check, path)
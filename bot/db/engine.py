@@ -1,28 +1,147 @@
+import logging
 import os
 
 import aiosqlite
 
 from bot.config import settings
-from bot.db.models import SCHEMA
+from bot.db.models import (
+    MIGRATIONS,
+    SCHEMA,
+    SCHEMA_VERSION,
+    SHARD_MIGRATIONS,
+    SHARD_SCHEMA,
+)
+from bot.db.repositories.mood import ensure_daily_rollups
+from bot.db.repositories.settings import get_setting
+from bot.db.shards import INSTALL_KEY, LAYOUT_KEY, Database, open_connection, user_dbs
 
-_db_path = settings.db_path
+logger = logging.getLogger(__name__)
 
 
-async def get_db() -> aiosqlite.Connection:
-    db = await aiosqlite.connect(_db_path)
-    db.row_factory = aiosqlite.Row
-    await db.execute("PRAGMA busy_timeout=5000")
-    await db.execute("PRAGMA journal_mode=WAL")
-    await db.execute("PRAGMA foreign_keys=ON")
-    return db
+async def get_db() -> Database:
+    return await open_connection(Database(settings.db_path))
 
 
-async def init_db() -> None:
-    os.makedirs(os.path.dirname(_db_path), exist_ok=True)
+async def checkpoint() -> None:
+    """Move the WAL into the database file and truncate it, so a stopped bot
+    leaves self-contained files behind.
+    """
     db = await get_db()
     try:
-        for statement in SCHEMA:
-            await db.execute(statement)
+        for conn in [db, *(c for c in await user_dbs(db) if c is not db)]:
+            cursor = await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            busy, wal_pages, copied = await cursor.fetchone()
+            if busy:
+                logger.info(
+                    "WAL checkpoint: %d of %d pages copied, a reader is still open",
+                    copied, wal_pages,
+                )
+            else:
+                logger.info("WAL checkpointed (%d pages)", copied)
+    finally:
+        await db.close()
+
+
+async def _migrate(
+    db: aiosqlite.Connection, migrations: dict[int, list[str]], marker: str
+) -> int:
+    """Bring the schema to SCHEMA_VERSION. Returns the version the database
+    was at, 0 for a new one.
+
+    `marker` is a table every existing database of this kind has.
+    """
+    cursor = await db.execute("PRAGMA user_version")
+    found = version = (await cursor.fetchone())[0]
+    if version == SCHEMA_VERSION:
+        return found
+    if version == 0:
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (marker,)
+        )
+        if await cursor.fetchone() is None:
+            # Fresh database — the schema creates the current layout
+            return 0
+        found = version = 1
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info("Migrating database schema to version %d...", target)
+        await db.execute("BEGIN")
+        try:
+            for statement in migrations.get(target, ()):
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {target}")
+        except Exception:
+            await db.rollback()
+            raise
         await db.commit()
+    return found
+
+
+async def _enable_incremental_vacuum(db: aiosqlite.Connection) -> None:
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    if (await cursor.fetchone())[0] == 2:
+        return
+    # Switching an existing database needs a one-time full rewrite
+    logger.info("Enabling incremental auto-vacuum (one-time VACUUM)...")
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    await db.execute("VACUUM")
+
+
+async def _prepare(
+    db: aiosqlite.Connection,
+    schema: list[str],
+    migrations: dict[int, list[str]],
+    marker: str,
+    fresh: tuple[tuple[str, tuple], ...] = (),
+) -> None:
+    """Migrate or create one database file; `fresh` statements run only
+    when it is created.
+    """
+    await _enable_incremental_vacuum(db)
+    found = await _migrate(db, migrations, marker)
+    if found == SCHEMA_VERSION:
+        # Every change to SCHEMA comes with a SCHEMA_VERSION bump, so a
+        # current database has nothing to create
+        return
+    # One transaction with the version, so a half-created schema is
+    # never taken for a current one
+    await db.execute("BEGIN")
+    try:
+        for statement in schema:
+            await db.execute(statement)
+        if found == 0:
+            for statement, params in fresh:
+                await db.execute(statement, params)
+        await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    await ensure_daily_rollups(db)
+
+
+async def init_db() -> None:
+    os.makedirs(os.path.dirname(settings.db_path), exist_ok=True)
+    db = await get_db()
+    try:
+        await _prepare(db, SCHEMA, MIGRATIONS, "users", fresh=((
+            "INSERT INTO bot_settings (key, value) VALUES (?, ?)",
+            (LAYOUT_KEY, str(settings.shards)),
+        ),))
+        shards = int(await get_setting(db, LAYOUT_KEY, "0"))
+        if shards != settings.shards:
+            raise RuntimeError(
+                f"The database is laid out in {shards} shards, but SHARDS is "
+                f"{settings.shards}. Stop the bot and run "
+                f"`python -m bot.tools.reshard {settings.shards}`."
+            )
+        if await get_setting(db, INSTALL_KEY) is not None:
+            raise RuntimeError(
+                "Resharding was interrupted. Stop the bot and run "
+                f"`python -m bot.tools.reshard {settings.shards}` again."
+            )
+        for conn in await user_dbs(db):
+            if conn is not db:
+                await _prepare(conn, SHARD_SCHEMA, SHARD_MIGRATIONS, "conversation_messages")
     finally:
         await db.close()
@@ -1,14 +1,65 @@
-SCHEMA = [
-    """
+from bot.utils.timezones import DEFAULT_UTC_OFFSET, LANGUAGE_UTC_OFFSETS
+
+# Tables shared by all users; with SHARDS set they stay in DB_PATH
+_GLOBAL_SCHEMA = [
+    f"""
     CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY,
         username TEXT,
         first_name TEXT,
         language_code TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        is_blocked INTEGER DEFAULT 0
+        is_blocked INTEGER DEFAULT 0,
+        utc_offset INTEGER NOT NULL DEFAULT {DEFAULT_UTC_OFFSET}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bot_settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS processed_updates (
+        update_id INTEGER PRIMARY KEY,
+        chat_id INTEGER,
+        message_id INTEGER,
+        seen_at INTEGER NOT NULL
     )
     """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_processed_updates_seen
+    ON processed_updates(seen_at)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_usage (
+        user_id INTEGER NOT NULL,
+        minute INTEGER NOT NULL,
+        tokens INTEGER NOT NULL,
+        PRIMARY KEY (user_id, minute)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_token_usage_minute
+    ON token_usage(minute, tokens)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reminders (
+        user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+        chat_id INTEGER NOT NULL,
+        local_time INTEGER NOT NULL,
+        next_fire_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_reminders_next_fire
+    ON reminders(next_fire_at)
+    """,
+]
+
+# Tables holding per-user rows; with SHARDS set they live in the shard files
+_USER_SCHEMA = [
     """
     CREATE TABLE IF NOT EXISTS conversation_messages (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,9 +70,38 @@ SCHEMA = [
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """,
+    # Ids follow insertion order, so (user_id, id) keeps a user's rows in
+    # time order without the ties of second-resolution created_at
     """
     CREATE INDEX IF NOT EXISTS idx_conv_user_id
-    ON conversation_messages(user_id, created_at)
+    ON conversation_messages(user_id, id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversation_archive (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id),
+        first_message_id INTEGER NOT NULL,
+        last_message_id INTEGER NOT NULL,
+        message_count INTEGER NOT NULL,
+        first_created_at TIMESTAMP,
+        last_created_at TIMESTAMP,
+        payload BLOB NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_archive_user_id
+    ON conversation_archive(user_id, first_message_id)
+    """,
+    # /reset hides a user's messages up to message_id and archive blocks up
+    # to archive_id at once; the rows are deleted later in small batches
+    """
+    CREATE TABLE IF NOT EXISTS history_resets (
+        user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+        message_id INTEGER NOT NULL,
+        archive_id INTEGER NOT NULL,
+        reset_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
     """,
     """
     CREATE TABLE IF NOT EXISTS mood_entries (
@@ -29,18 +109,29 @@ SCHEMA = [
         user_id INTEGER NOT NULL REFERENCES users(user_id),
         score INTEGER NOT NULL CHECK(score BETWEEN 1 AND 10),
         note TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        local_at TEXT
     )
     """,
     """
     CREATE INDEX IF NOT EXISTS idx_mood_user_id
-    ON mood_entries(user_id, created_at)
+    ON mood_entries(user_id, id)
     """,
     """
-    CREATE TABLE IF NOT EXISTS bot_settings (
-        key TEXT PRIMARY KEY,
-        value TEXT NOT NULL
-    )
+    CREATE INDEX IF NOT EXISTS idx_mood_user_local
+    ON mood_entries(user_id, local_at)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mood_daily (
+        user_id INTEGER NOT NULL REFERENCES users(user_id),
+        day TEXT NOT NULL,
+        entries INTEGER NOT NULL,
+        score_sum INTEGER NOT NULL,
+        score_min INTEGER NOT NULL,
+        score_max INTEGER NOT NULL,
+        score_sq_sum INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
     """,
     """
     CREATE TABLE IF NOT EXISTS crisis_events (
@@ -51,4 +142,219 @@ SCHEMA = [
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id),
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        reply_message_id INTEGER,
+        model TEXT NOT NULL,
+        crisis INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'pending'
+            CHECK(state IN ('pending', 'running', 'replied', 'done', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_until TIMESTAMP,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_llm_jobs_state
+    ON llm_jobs(state, lease_until)
+    """,
+]
+
+
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+
+def _fts_index(name: str, table: str, column: str) -> list[str]:
+    """External-content FTS5 index over `table.column`, kept in sync by
+    triggers. Rows still waiting for the backfill (see `fts_backfill`) are
+    left to it, because FTS5 must never be asked to delete a row it does not
+    have.
+
+    The indexed `owner` column ('u' || user_id) lets a search MATCH only the
+    user's own rows. `table` has no such column, so the index reads its
+    content through a view that adds it.
+    """
+    not_pending = f"""
+        NOT EXISTS (
+            SELECT 1 FROM fts_backfill
+            WHERE name = '{name}' AND old.id BETWEEN next_id AND until_id
+        )"""
+    return [
+        f"""
+        CREATE VIEW IF NOT EXISTS {name}_fts_content AS
+        SELECT id, {column}, 'u' || user_id AS owner FROM {table}
+        """,
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5(
+            {column}, owner, content='{name}_fts_content', content_rowid='id',
+            tokenize='{FTS_TOKENIZER}'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_fts_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {name}_fts(rowid, {column}, owner)
+            VALUES (new.id, new.{column}, 'u' || new.user_id);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_fts_delete AFTER DELETE ON {table}
+        WHEN {not_pending}
+        BEGIN
+            INSERT INTO {name}_fts({name}_fts, rowid, {column}, owner)
+            VALUES ('delete', old.id, old.{column}, 'u' || old.user_id);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_fts_update AFTER UPDATE OF {column} ON {table}
+        WHEN {not_pending}
+        BEGIN
+            INSERT INTO {name}_fts({name}_fts, rowid, {column}, owner)
+            VALUES ('delete', old.id, old.{column}, 'u' || old.user_id);
+            INSERT INTO {name}_fts(rowid, {column}, owner)
+            VALUES (new.id, new.{column}, 'u' || new.user_id);
+        END
+        """,
+    ]
+
+
+def _fts_rebuild(name: str, table: str) -> list[str]:
+    """Drop the `name` index and leave all of `table` to the backfill; the
+    schema then creates the index again, empty.
+    """
+    return [
+        f"DROP TRIGGER IF EXISTS {name}_fts_insert",
+        f"DROP TRIGGER IF EXISTS {name}_fts_delete",
+        f"DROP TRIGGER IF EXISTS {name}_fts_update",
+        f"DROP TABLE IF EXISTS {name}_fts",
+        f"DELETE FROM fts_backfill WHERE name = '{name}'",
+        f"""
+        INSERT INTO fts_backfill (name, next_id, until_id)
+        SELECT '{name}', min(id), max(id) FROM {table}
+        HAVING count(*) > 0
+        """,
+    ]
+
+
+# Full-text search. A database that had rows before the indexes existed gets
+# an fts_backfill row per index: ids next_id..until_id are not indexed yet
+_FTS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS fts_backfill (
+        name TEXT PRIMARY KEY,
+        next_id INTEGER NOT NULL,
+        until_id INTEGER NOT NULL
+    )
+    """,
+    *_fts_index("conversation", "conversation_messages", "content"),
+    *_fts_index("mood", "mood_entries", "note"),
+    # Archived messages. Their text is compressed in the blocks, so the index
+    # keeps no copy of it (contentless) and is filled by the archiver, not by
+    # triggers: see bot/db/repositories/archive_index.py
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS archive_fts USING fts5(
+        content, owner, content='', tokenize='{FTS_TOKENIZER}'
+    )
+    """,
+]
+
+_USER_SCHEMA += _FTS_SCHEMA
+
+# The whole database in one file, the default layout
+SCHEMA = _GLOBAL_SCHEMA + _USER_SCHEMA
+
+# A shard file (SHARDS > 0) has only the per-user tables. Their users rows
+# are in the main database, out of reach of a foreign key.
+SHARD_SCHEMA = [s.replace(" REFERENCES users(user_id)", "") for s in _USER_SCHEMA]
+
+# PRAGMA user_version of a database created from SCHEMA above, and of a
+# shard file created from SHARD_SCHEMA.
+# Databases from before versioning report 0 and are treated as version 1.
+# init_db skips SCHEMA for databases at this version: any change to SCHEMA
+# must bump it and add a migration (to SHARD_MIGRATIONS too if it touches
+# per-user tables).
+SCHEMA_VERSION = 7
+
+_offset_by_language = " ".join(
+    f"WHEN '{code}' THEN {offset}" for code, offset in LANGUAGE_UTC_OFFSETS.items()
+)
+
+# Version 4 orders the per-user indexes by id instead of created_at
+_USER_INDEXES_BY_ID = [
+    "DROP INDEX IF EXISTS idx_conv_user_id",
+    "CREATE INDEX idx_conv_user_id ON conversation_messages(user_id, id)",
+    "DROP INDEX IF EXISTS idx_mood_user_id",
+    "CREATE INDEX idx_mood_user_id ON mood_entries(user_id, id)",
+]
+
+# Version 6 adds the owner column to the search indexes, which are rebuilt
+_FTS_BY_OWNER = [
+    *_fts_rebuild("conversation", "conversation_messages"),
+    *_fts_rebuild("mood", "mood_entries"),
+]
+
+# Version 7 indexes archived messages; the schema creates archive_fts and
+# the backfill fills it from the blocks already there
+_ARCHIVE_FTS = [
+    """
+    INSERT INTO fts_backfill (name, next_id, until_id)
+    SELECT 'archive', min(id), max(id) FROM conversation_archive
+    HAVING count(*) > 0
+    """,
 ]
+
+# Statements that bring a database from version N-1 to N; run before SCHEMA
+MIGRATIONS: dict[int, list[str]] = {
+    2: [
+        f"""
+        ALTER TABLE users
+        ADD COLUMN utc_offset INTEGER NOT NULL DEFAULT {DEFAULT_UTC_OFFSET}
+        """,
+        f"""
+        UPDATE users SET utc_offset = CASE lower(substr(language_code, 1, 2))
+            {_offset_by_language} ELSE {DEFAULT_UTC_OFFSET} END
+        """,
+        "ALTER TABLE mood_entries ADD COLUMN local_at TEXT",
+        """
+        UPDATE mood_entries SET local_at = datetime(
+            created_at,
+            (SELECT utc_offset FROM users WHERE users.user_id = mood_entries.user_id)
+            || ' minutes'
+        )
+        """,
+        # Rollups were bucketed by UTC day; SCHEMA recreates the table empty
+        # and init_db rebuilds it by local day
+        "DROP TABLE IF EXISTS mood_daily",
+    ],
+    3: [
+        *_FTS_SCHEMA,
+        """
+        INSERT INTO fts_backfill (name, next_id, until_id)
+        SELECT 'conversation', min(id), max(id) FROM conversation_messages
+        HAVING count(*) > 0
+        """,
+        """
+        INSERT INTO fts_backfill (name, next_id, until_id)
+        SELECT 'mood', min(id), max(id) FROM mood_entries
+        HAVING count(*) > 0
+        """,
+    ],
+    4: _USER_INDEXES_BY_ID,
+    6: _FTS_BY_OWNER,
+    7: _ARCHIVE_FTS,
+}
+
+# The same for shard files, which first appeared at version 3; a version
+# without an entry changes nothing there
+SHARD_MIGRATIONS: dict[int, list[str]] = {
+    4: _USER_INDEXES_BY_ID,
+    6: _FTS_BY_OWNER,
+    7: _ARCHIVE_FTS,
+}
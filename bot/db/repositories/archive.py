@@ -0,0 +1,140 @@
+import asyncio
+from typing import AsyncIterator
+
+import aiosqlite
+
+from bot.db.repositories.archive_index import INDEX, ROWID_STRIDE, entries, pack, unpack
+from bot.db.repositories.conversation import LIVE_BLOCKS, LIVE_MESSAGES
+from bot.db.shards import user_db, user_dbs
+
+
+async def get_users_with_messages(db: aiosqlite.Connection) -> list[int]:
+    user_ids = []
+    for conn in await user_dbs(db):
+        cursor = await conn.execute("SELECT DISTINCT user_id FROM conversation_messages")
+        user_ids += [r[0] for r in await cursor.fetchall()]
+    return user_ids
+
+
+async def get_archive_boundary(
+    db: aiosqlite.Connection,
+    user_id: int,
+    max_age_days: int,
+    budget: int,
+) -> int | None:
+    """Highest message id that is older than `max_age_days` or outside the
+    newest `budget` tokens of history. Everything up to it can be archived.
+    """
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        f"""
+        SELECT MAX(id)
+        FROM (
+            SELECT id, created_at,
+                   SUM(tokens_est) OVER (ORDER BY id DESC) AS newer_tokens
+            FROM conversation_messages
+            WHERE user_id = ? AND {LIVE_MESSAGES}
+        )
+        WHERE newer_tokens > ? OR created_at < datetime('now', ?)
+        """,
+        (user_id, user_id, budget, f"-{max_age_days} days"),
+    )
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def archive_block(
+    db: aiosqlite.Connection,
+    user_id: int,
+    up_to_id: int,
+    limit: int,
+) -> int:
+    """Move up to `limit` oldest messages (id <= up_to_id) into one compressed
+    archive block, which keeps them searchable. Returns the number of
+    messages moved.
+    """
+    db = await user_db(db, user_id)
+    limit = min(limit, ROWID_STRIDE)
+    cursor = await db.execute(
+        f"""
+        SELECT id, role, content, tokens_est, created_at
+        FROM conversation_messages
+        WHERE user_id = ? AND {LIVE_MESSAGES} AND id <= ?
+        ORDER BY id ASC
+        LIMIT ?
+        """,
+        (user_id, user_id, up_to_id, limit),
+    )
+    rows = [dict(r) for r in await cursor.fetchall()]
+    if not rows:
+        return 0
+
+    payload = await asyncio.to_thread(pack, rows)
+    first, last = rows[0], rows[-1]
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute(
+            f"""
+            DELETE FROM conversation_messages
+            WHERE user_id = ? AND {LIVE_MESSAGES} AND id BETWEEN ? AND ?
+            """,
+            (user_id, user_id, first["id"], last["id"]),
+        )
+        if cursor.rowcount != len(rows):
+            # /reset came in while the block was packed
+            await db.rollback()
+            return 0
+        cursor = await db.execute(
+            """
+            INSERT INTO conversation_archive (
+                user_id, first_message_id, last_message_id, message_count,
+                first_created_at, last_created_at, payload
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                user_id, first["id"], last["id"], len(rows),
+                first["created_at"], last["created_at"], payload,
+            ),
+        )
+        await db.executemany(INDEX, entries(cursor.lastrowid, user_id, rows))
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    return len(rows)
+
+
+async def iter_archived_messages(
+    db: aiosqlite.Connection,
+    user_id: int,
+) -> AsyncIterator[dict]:
+    """Yield archived messages oldest first, decompressing one block at a time."""
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        f"""
+        SELECT id FROM conversation_archive
+        WHERE user_id = ? AND {LIVE_BLOCKS}
+        ORDER BY first_message_id ASC
+        """,
+        (user_id, user_id),
+    )
+    block_ids = [r[0] for r in await cursor.fetchall()]
+    for block_id in block_ids:
+        cursor = await db.execute(
+            "SELECT payload FROM conversation_archive WHERE id = ?", (block_id,)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            continue
+        for message in await asyncio.to_thread(unpack, row[0]):
+            yield message
+
+
+async def incremental_vacuum(db: aiosqlite.Connection, pages: int) -> int:
+    """Return up to `pages` free pages to the filesystem. Returns pages left."""
+    # The pragma frees one page per step, so it has to be fetched to the end
+    cursor = await db.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+    await cursor.fetchall()
+    cursor = await db.execute("PRAGMA freelist_count")
+    return (await cursor.fetchone())[0]
@@ -0,0 +1,64 @@
+"""Archive block payloads and the search index over the messages in them.
+
+`archive_fts` is contentless: the text stays compressed in the blocks, and
+the index holds only its words. An entry's rowid is the block id times
+ROWID_STRIDE plus the message's place in the block. FTS5 removes such an
+entry only when given the text it was indexed with, so a block is unpacked
+before it is deleted.
+"""
+import asyncio
+import json
+import zlib
+
+import aiosqlite
+
+# More than the messages of any block
+ROWID_STRIDE = 1 << 16
+
+INDEX = "INSERT INTO archive_fts (rowid, content, owner) VALUES (?, ?, ?)"
+UNINDEX = (
+    "INSERT INTO archive_fts (archive_fts, rowid, content, owner) "
+    "VALUES ('delete', ?, ?, ?)"
+)
+
+_COMPRESSION_LEVEL = 6
+
+
+def pack(rows: list[dict]) -> bytes:
+    raw = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, _COMPRESSION_LEVEL)
+
+
+def unpack(payload: bytes) -> list[dict]:
+    return json.loads(zlib.decompress(payload))
+
+
+def entries(block_id: int, user_id: int, messages: list[dict]) -> list[tuple[int, str, str]]:
+    """(rowid, content, owner) of each message of a block, for INDEX or UNINDEX."""
+    owner = f"u{user_id}"
+    return [
+        (block_id * ROWID_STRIDE + place, message["content"], owner)
+        for place, message in enumerate(messages)
+    ]
+
+
+async def unindex_blocks(db: aiosqlite.Connection, block_ids: list[int]) -> None:
+    """Remove the entries of blocks about to be deleted, in the caller's
+    transaction. Blocks the backfill has not reached yet have none.
+    """
+    if not block_ids:
+        return
+    cursor = await db.execute(
+        f"""
+        SELECT id, user_id, payload FROM conversation_archive
+        WHERE id IN ({", ".join("?" * len(block_ids))})
+          AND NOT EXISTS (
+              SELECT 1 FROM fts_backfill
+              WHERE name = 'archive' AND conversation_archive.id BETWEEN next_id AND until_id
+          )
+        """,
+        block_ids,
+    )
+    for block_id, user_id, payload in await cursor.fetchall():
+        messages = await asyncio.to_thread(unpack, payload)
+        await db.executemany(UNINDEX, entries(block_id, user_id, messages))
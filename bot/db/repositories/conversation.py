@@ -1,5 +1,15 @@
+from typing import AsyncIterator
+
 import aiosqlite
 
+from bot.db.repositories.archive_index import unindex_blocks
+from bot.db.shards import user_db, user_dbs
+
+# A user's messages and archive blocks that /reset has not hidden; each
+# takes the user id as its parameter
+LIVE_MESSAGES = "id > COALESCE((SELECT message_id FROM history_resets WHERE user_id = ?), 0)"
+LIVE_BLOCKS = "id > COALESCE((SELECT archive_id FROM history_resets WHERE user_id = ?), 0)"
+
 
 def estimate_tokens(text: str) -> int:
     return max(1, len(text.encode("utf-8")) // 4)
@@ -10,9 +20,10 @@ async def add_message(
     user_id: int,
     role: str,
     content: str,
-) -> None:
+) -> int:
     tokens_est = estimate_tokens(content)
-    await db.execute(
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
         """
         INSERT INTO conversation_messages (user_id, role, content, tokens_est)
         VALUES (?, ?, ?, ?)
@@ -20,32 +31,165 @@ async def add_message(
         (user_id, role, content, tokens_est),
     )
     await db.commit()
+    return cursor.lastrowid
 
 
 async def get_messages(
     db: aiosqlite.Connection,
     user_id: int,
+    up_to_id: int | None = None,
 ) -> list[dict]:
+    """A user's live messages, optionally only those up to `up_to_id`."""
+    db = await user_db(db, user_id)
     cursor = await db.execute(
-        """
-        SELECT role, content, tokens_est, created_at
+        f"""
+        SELECT id, role, content, tokens_est, created_at
         FROM conversation_messages
-        WHERE user_id = ?
-        ORDER BY created_at ASC
+        WHERE user_id = ? AND {LIVE_MESSAGES} AND (? IS NULL OR id <= ?)
+        ORDER BY id ASC
         """,
-        (user_id,),
+        (user_id, user_id, up_to_id, up_to_id),
     )
     rows = await cursor.fetchall()
     return [dict(r) for r in rows]
 
 
-async def delete_messages(
+async def get_message(
+    db: aiosqlite.Connection, user_id: int, message_id: int
+) -> dict | None:
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        f"""
+        SELECT id, user_id, role, content, created_at FROM conversation_messages
+        WHERE id = ? AND user_id = ? AND {LIVE_MESSAGES}
+        """,
+        (message_id, user_id, user_id),
+    )
+    row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+async def iter_messages(
     db: aiosqlite.Connection,
     user_id: int,
-) -> int:
+    batch_size: int = 500,
+) -> AsyncIterator[dict]:
+    """Stream a user's messages oldest first without loading them all at once."""
+    db = await user_db(db, user_id)
     cursor = await db.execute(
-        "DELETE FROM conversation_messages WHERE user_id = ?",
-        (user_id,),
+        f"""
+        SELECT id, role, content, tokens_est, created_at
+        FROM conversation_messages
+        WHERE user_id = ? AND {LIVE_MESSAGES}
+        ORDER BY id ASC
+        """,
+        (user_id, user_id),
     )
+    while rows := await cursor.fetchmany(batch_size):
+        for row in rows:
+            yield dict(row)
+
+
+async def delete_messages(
+    db: aiosqlite.Connection,
+    user_id: int,
+) -> int:
+    """Hide a user's whole history, live and archived, right away.
+
+    Only the reset mark is written here; `purge_step` deletes the rows
+    later. Returns the number of messages hidden.
+    """
+    db = await user_db(db, user_id)
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute(
+            f"""
+            SELECT count(*), max(id) FROM conversation_messages
+            WHERE user_id = ? AND {LIVE_MESSAGES}
+            """,
+            (user_id, user_id),
+        )
+        messages, message_id = await cursor.fetchone()
+        cursor = await db.execute(
+            f"""
+            SELECT COALESCE(sum(message_count), 0), max(id) FROM conversation_archive
+            WHERE user_id = ? AND {LIVE_BLOCKS}
+            """,
+            (user_id, user_id),
+        )
+        archived, archive_id = await cursor.fetchone()
+        if messages or archive_id is not None:
+            await db.execute(
+                """
+                INSERT INTO history_resets (user_id, message_id, archive_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    message_id = max(message_id, excluded.message_id),
+                    archive_id = max(archive_id, excluded.archive_id),
+                    reset_at = CURRENT_TIMESTAMP
+                """,
+                (user_id, message_id or 0, archive_id or 0),
+            )
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    return messages + archived
+
+
+async def purge_step(db: aiosqlite.Connection, messages: int, blocks: int) -> int:
+    """Delete up to `messages` hidden messages and `blocks` archive blocks
+    in every database file, one short transaction each, and drop the reset
+    marks that have nothing left behind them.
+
+    Returns the number of rows deleted (0 when done).
+    """
+    deleted = 0
+    for conn in await user_dbs(db):
+        deleted += await _purge_step(conn, messages, blocks)
+    return deleted
+
+
+async def _purge_step(db: aiosqlite.Connection, messages: int, blocks: int) -> int:
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        deleted = 0
+        while not deleted:
+            cursor = await db.execute(
+                "SELECT user_id, message_id, archive_id FROM history_resets LIMIT 1"
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                break
+            user_id, message_id, archive_id = row
+            cursor = await db.execute(
+                """
+                DELETE FROM conversation_messages WHERE id IN (
+                    SELECT id FROM conversation_messages
+                    WHERE user_id = ? AND id <= ?
+                    LIMIT ?
+                )
+                """,
+                (user_id, message_id, messages),
+            )
+            deleted_messages = cursor.rowcount
+            cursor = await db.execute(
+                """
+                SELECT id FROM conversation_archive
+                WHERE user_id = ? AND id <= ?
+                LIMIT ?
+                """,
+                (user_id, archive_id, blocks),
+            )
+            block_ids = [r[0] for r in await cursor.fetchall()]
+            await unindex_blocks(db, block_ids)
+            marks = ", ".join("?" * len(block_ids))
+            await db.execute(f"DELETE FROM conversation_archive WHERE id IN ({marks})", block_ids)
+            deleted = deleted_messages + len(block_ids)
+            if deleted_messages < messages and len(block_ids) < blocks:
+                await db.execute("DELETE FROM history_resets WHERE user_id = ?", (user_id,))
+    except Exception:
+        await db.rollback()
+        raise
     await db.commit()
-    return cursor.rowcount
+    return deleted
@@ -0,0 +1,211 @@
+"""Durable "generate a reply" jobs.
+
+States: pending -> running -> replied (reply saved) -> done (reply delivered).
+A running or replied job is owned by whoever holds an unexpired lease; once
+the lease runs out, any process may claim it again.
+
+Jobs live next to their messages, in the user's shard; functions that act
+on a job take the job row to find it.
+"""
+import aiosqlite
+
+from bot.db.repositories.conversation import estimate_tokens
+from bot.db.shards import user_db, user_dbs
+
+
+def _lease(seconds: int) -> str:
+    return f"+{seconds} seconds"
+
+
+async def create_job(
+    db: aiosqlite.Connection,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    model: str,
+    crisis: bool,
+    owner: str,
+    lease_seconds: int,
+) -> dict:
+    """Record a job that the caller runs right away, already leased to it."""
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        """
+        INSERT INTO llm_jobs (
+            user_id, chat_id, message_id, model, crisis,
+            state, attempts, lease_owner, lease_until
+        )
+        VALUES (?, ?, ?, ?, ?, 'running', 1, ?, datetime('now', ?))
+        RETURNING *
+        """,
+        (user_id, chat_id, message_id, model, int(crisis), owner, _lease(lease_seconds)),
+    )
+    row = await cursor.fetchone()
+    await db.commit()
+    return dict(row)
+
+
+async def claim_jobs(
+    db: aiosqlite.Connection,
+    owner: str,
+    lease_seconds: int,
+    max_attempts: int,
+    limit: int,
+) -> list[dict]:
+    """Lease up to `limit` pending jobs or jobs whose lease has expired.
+
+    Jobs that already used up their attempts are marked failed instead.
+    """
+    jobs: list[dict] = []
+    for conn in await user_dbs(db):
+        if len(jobs) >= limit:
+            break
+        jobs += await _claim_jobs(conn, owner, lease_seconds, max_attempts, limit - len(jobs))
+    return jobs
+
+
+async def _claim_jobs(
+    db: aiosqlite.Connection,
+    owner: str,
+    lease_seconds: int,
+    max_attempts: int,
+    limit: int,
+) -> list[dict]:
+    await db.execute(
+        """
+        UPDATE llm_jobs
+        SET state = 'failed', error = 'too many attempts', updated_at = CURRENT_TIMESTAMP
+        WHERE state IN ('pending', 'running', 'replied')
+          AND attempts >= ?
+          AND (lease_until IS NULL OR lease_until < datetime('now'))
+        """,
+        (max_attempts,),
+    )
+    cursor = await db.execute(
+        """
+        UPDATE llm_jobs
+        SET state = CASE WHEN state = 'replied' THEN 'replied' ELSE 'running' END,
+            attempts = attempts + 1,
+            lease_owner = ?,
+            lease_until = datetime('now', ?),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT id FROM llm_jobs
+            WHERE state = 'pending'
+               OR (state IN ('running', 'replied') AND lease_until < datetime('now'))
+            ORDER BY id
+            LIMIT ?
+        )
+        RETURNING *
+        """,
+        (owner, _lease(lease_seconds), limit),
+    )
+    rows = await cursor.fetchall()
+    await db.commit()
+    return [dict(r) for r in rows]
+
+
+async def renew_lease(
+    db: aiosqlite.Connection, job: dict, owner: str, lease_seconds: int
+) -> bool:
+    db = await user_db(db, job["user_id"])
+    cursor = await db.execute(
+        """
+        UPDATE llm_jobs SET lease_until = datetime('now', ?)
+        WHERE id = ? AND lease_owner = ? AND state IN ('running', 'replied')
+        """,
+        (_lease(lease_seconds), job["id"], owner),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def save_reply(
+    db: aiosqlite.Connection, job: dict, owner: str, content: str
+) -> int | None:
+    """Store the assistant reply and move the job to 'replied' atomically.
+
+    Returns the new message id, or None if the job is no longer ours.
+    """
+    db = await user_db(db, job["user_id"])
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute(
+            """
+            UPDATE llm_jobs SET state = 'replied', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND state = 'running'
+            """,
+            (job["id"], owner),
+        )
+        if cursor.rowcount == 0:
+            await db.rollback()
+            return None
+        cursor = await db.execute(
+            """
+            INSERT INTO conversation_messages (user_id, role, content, tokens_est)
+            VALUES (?, 'assistant', ?, ?)
+            """,
+            (job["user_id"], content, estimate_tokens(content)),
+        )
+        reply_id = cursor.lastrowid
+        await db.execute(
+            "UPDATE llm_jobs SET reply_message_id = ? WHERE id = ?",
+            (reply_id, job["id"]),
+        )
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    return reply_id
+
+
+async def finish_job(
+    db: aiosqlite.Connection,
+    job: dict,
+    owner: str,
+    state: str = "done",
+    error: str | None = None,
+) -> None:
+    db = await user_db(db, job["user_id"])
+    await db.execute(
+        """
+        UPDATE llm_jobs
+        SET state = ?, error = ?, lease_owner = NULL, lease_until = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND lease_owner = ?
+        """,
+        (state, error, job["id"], owner),
+    )
+    await db.commit()
+
+
+async def release_job(
+    db: aiosqlite.Connection, job: dict, owner: str, error: str
+) -> None:
+    """Give a job back after an error so it is retried later."""
+    db = await user_db(db, job["user_id"])
+    await db.execute(
+        """
+        UPDATE llm_jobs
+        SET state = CASE WHEN state = 'replied' THEN 'replied' ELSE 'pending' END,
+            error = ?, lease_until = datetime('now'), updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND lease_owner = ?
+        """,
+        (error, job["id"], owner),
+    )
+    await db.commit()
+
+
+async def prune_jobs(db: aiosqlite.Connection, max_age_days: int) -> int:
+    pruned = 0
+    for conn in await user_dbs(db):
+        cursor = await conn.execute(
+            """
+            DELETE FROM llm_jobs
+            WHERE state IN ('done', 'failed') AND updated_at < datetime('now', ?)
+            """,
+            (f"-{max_age_days} days",),
+        )
+        await conn.commit()
+        pruned += cursor.rowcount
+    return pruned
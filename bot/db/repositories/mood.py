@@ -1,5 +1,24 @@
+from typing import AsyncIterator
+
 import aiosqlite
 
+from bot.db.shards import user_db
+from bot.utils.timezones import DEFAULT_UTC_OFFSET
+
+_PERIOD_FORMATS = {
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+
+async def _local_shift(db: aiosqlite.Connection, user_id: int) -> str:
+    """SQL modifier shifting 'now' (UTC) to the user's local time. Read from
+    the main database, which may not be the one with the user's entries.
+    """
+    cursor = await db.execute("SELECT utc_offset FROM users WHERE user_id = ?", (user_id,))
+    row = await cursor.fetchone()
+    return f"{row[0] if row else DEFAULT_UTC_OFFSET} minutes"
+
 
 async def add_entry(
     db: aiosqlite.Connection,
@@ -7,12 +26,31 @@ async def add_entry(
     score: int,
     note: str | None = None,
 ) -> None:
+    shift = await _local_shift(db, user_id)
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        """
+        INSERT INTO mood_entries (user_id, score, note, local_at)
+        VALUES (?, ?, ?, datetime('now', ?))
+        """,
+        (user_id, score, note, shift),
+    )
+    # Keep the daily rollup in step with the raw entry (same transaction)
     await db.execute(
         """
-        INSERT INTO mood_entries (user_id, score, note)
-        VALUES (?, ?, ?)
+        INSERT INTO mood_daily
+            (user_id, day, entries, score_sum, score_min, score_max, score_sq_sum)
+        SELECT user_id, date(local_at), 1, score, score, score, score * score
+        FROM mood_entries
+        WHERE id = ?
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            entries = entries + 1,
+            score_sum = score_sum + excluded.score_sum,
+            score_min = MIN(score_min, excluded.score_min),
+            score_max = MAX(score_max, excluded.score_max),
+            score_sq_sum = score_sq_sum + excluded.score_sq_sum
         """,
-        (user_id, score, note),
+        (cursor.lastrowid,),
     )
     await db.commit()
 
@@ -22,14 +60,111 @@ async def get_entries_range(
     user_id: int,
     days: int = 7,
 ) -> list[dict]:
+    """Entries from the last `days` local calendar days, today included."""
+    shift = await _local_shift(db, user_id)
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        """
+        SELECT score, note, local_at
+        FROM mood_entries
+        WHERE user_id = ? AND local_at >= date('now', ?, ?)
+        ORDER BY local_at ASC
+        """,
+        (user_id, shift, f"-{days - 1} days"),
+    )
+    rows = await cursor.fetchall()
+    return [dict(r) for r in rows]
+
+
+async def iter_entries(
+    db: aiosqlite.Connection,
+    user_id: int,
+    batch_size: int = 500,
+) -> AsyncIterator[dict]:
+    db = await user_db(db, user_id)
     cursor = await db.execute(
         """
-        SELECT score, note, created_at
+        SELECT id, score, note, created_at, local_at
         FROM mood_entries
-        WHERE user_id = ? AND created_at >= datetime('now', ?)
-        ORDER BY created_at ASC
+        WHERE user_id = ?
+        ORDER BY id ASC
+        """,
+        (user_id,),
+    )
+    while rows := await cursor.fetchmany(batch_size):
+        for row in rows:
+            yield dict(row)
+
+
+async def get_daily_range(
+    db: aiosqlite.Connection,
+    user_id: int,
+    days: int = 7,
+) -> list[dict]:
+    """Daily rollups for the last `days` local calendar days, today included."""
+    shift = await _local_shift(db, user_id)
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        """
+        SELECT day, entries, score_sum, score_min, score_max, score_sq_sum
+        FROM mood_daily
+        WHERE user_id = ? AND day >= date('now', ?, ?)
+        ORDER BY day ASC
+        """,
+        (user_id, shift, f"-{days - 1} days"),
+    )
+    rows = await cursor.fetchall()
+    return [dict(r) for r in rows]
+
+
+async def get_period_range(
+    db: aiosqlite.Connection,
+    user_id: int,
+    days: int,
+    period: str = "week",
+) -> list[dict]:
+    """Daily rollups merged into weekly or monthly buckets."""
+    shift = await _local_shift(db, user_id)
+    db = await user_db(db, user_id)
+    cursor = await db.execute(
+        """
+        SELECT strftime(?, day) AS period,
+               SUM(entries) AS entries,
+               SUM(score_sum) AS score_sum,
+               MIN(score_min) AS score_min,
+               MAX(score_max) AS score_max,
+               SUM(score_sq_sum) AS score_sq_sum
+        FROM mood_daily
+        WHERE user_id = ? AND day >= date('now', ?, ?)
+        GROUP BY 1
+        ORDER BY 1 ASC
         """,
-        (user_id, f"-{days} days"),
+        (_PERIOD_FORMATS[period], user_id, shift, f"-{days - 1} days"),
     )
     rows = await cursor.fetchall()
     return [dict(r) for r in rows]
+
+
+async def rebuild_daily_rollups(db: aiosqlite.Connection) -> None:
+    await db.execute("DELETE FROM mood_daily")
+    await db.execute(
+        """
+        INSERT INTO mood_daily
+            (user_id, day, entries, score_sum, score_min, score_max, score_sq_sum)
+        SELECT user_id, date(local_at), COUNT(*), SUM(score),
+               MIN(score), MAX(score), SUM(score * score)
+        FROM mood_entries
+        GROUP BY user_id, date(local_at)
+        """
+    )
+    await db.commit()
+
+
+async def ensure_daily_rollups(db: aiosqlite.Connection) -> None:
+    """Backfill rollups for databases created before the rollup table existed."""
+    cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM mood_daily)")
+    has_rollups = (await cursor.fetchone())[0]
+    cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM mood_entries)")
+    has_entries = (await cursor.fetchone())[0]
+    if has_entries and not has_rollups:
+        await rebuild_daily_rollups(db)
@@ -0,0 +1,116 @@
+"""Daily mood check-in reminders.
+
+`local_time` is minutes after the user's local midnight; `next_fire_at` is
+the unix time it next falls on, kept current by whoever sends the reminder.
+`updated_at` lets the scheduler notice rows changed by other processes.
+"""
+import aiosqlite
+
+from bot.utils.timezones import next_local_time
+
+
+async def get_reminder(db: aiosqlite.Connection, user_id: int) -> dict | None:
+    cursor = await db.execute("SELECT * FROM reminders WHERE user_id = ?", (user_id,))
+    row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+async def set_reminder(
+    db: aiosqlite.Connection,
+    user_id: int,
+    chat_id: int,
+    local_time: int,
+    utc_offset: int,
+    now: int,
+) -> int:
+    """Create or move a user's reminder. Returns its next fire time."""
+    next_fire_at = next_local_time(local_time, utc_offset, now)
+    await db.execute(
+        """
+        INSERT INTO reminders (user_id, chat_id, local_time, next_fire_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            chat_id = excluded.chat_id,
+            local_time = excluded.local_time,
+            next_fire_at = excluded.next_fire_at,
+            updated_at = excluded.updated_at
+        """,
+        (user_id, chat_id, local_time, next_fire_at, now),
+    )
+    await db.commit()
+    return next_fire_at
+
+
+async def reschedule_reminder(
+    db: aiosqlite.Connection, user_id: int, utc_offset: int, now: int
+) -> int | None:
+    """Recompute the next fire time after a time zone change."""
+    reminder = await get_reminder(db, user_id)
+    if reminder is None:
+        return None
+    return await set_reminder(
+        db, user_id, reminder["chat_id"], reminder["local_time"], utc_offset, now
+    )
+
+
+async def delete_reminder(db: aiosqlite.Connection, user_id: int) -> bool:
+    cursor = await db.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def load_reminders(
+    db: aiosqlite.Connection,
+    until: int,
+    loaded_until: int,
+    changed_since: int,
+    overdue_before: int,
+) -> list[tuple[int, int]]:
+    """(user_id, next_fire_at) due before `until` that may not be scheduled
+    yet: due after `loaded_until`, changed since `changed_since`, or still
+    unclaimed at `overdue_before`.
+    """
+    cursor = await db.execute(
+        """
+        SELECT user_id, next_fire_at FROM reminders
+        WHERE next_fire_at < ?
+          AND (next_fire_at >= ? OR updated_at >= ? OR next_fire_at < ?)
+        """,
+        (until, loaded_until, changed_since, overdue_before),
+    )
+    return [tuple(r) for r in await cursor.fetchall()]
+
+
+async def claim_reminders(
+    db: aiosqlite.Connection, due: list[tuple[int, int]], now: int
+) -> list[dict]:
+    """Move each (user_id, next_fire_at) reminder to its next day in one
+    transaction, skipping rows that changed since they were scheduled.
+
+    Returns the claimed rows with the time they were due as `due_at`.
+    """
+    claimed = []
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        for user_id, due_at in due:
+            cursor = await db.execute(
+                """
+                SELECT r.chat_id, r.local_time, u.utc_offset
+                FROM reminders r JOIN users u ON u.user_id = r.user_id
+                WHERE r.user_id = ? AND r.next_fire_at = ?
+                """,
+                (user_id, due_at),
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                continue
+            await db.execute(
+                "UPDATE reminders SET next_fire_at = ?, updated_at = ? WHERE user_id = ?",
+                (next_local_time(row["local_time"], row["utc_offset"], now), now, user_id),
+            )
+            claimed.append({"user_id": user_id, "chat_id": row["chat_id"], "due_at": due_at})
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    return claimed
@@ -0,0 +1,198 @@
+"""Full-text search over a user's conversation, archived messages included,
+and mood notes (FTS5).
+"""
+import asyncio
+
+import aiosqlite
+
+from bot.db.models import FTS_TOKENIZER
+from bot.db.repositories.archive_index import INDEX, ROWID_STRIDE, entries, unpack
+from bot.db.repositories.conversation import LIVE_BLOCKS, LIVE_MESSAGES
+from bot.db.shards import user_db, user_dbs
+
+# Marks around matched words in snippets; the caller turns them into markup
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# (index name, source table, indexed column); archive_fts is filled apart
+FTS_INDEXES = {
+    "conversation": ("conversation_messages", "content"),
+    "mood": ("mood_entries", "note"),
+}
+
+
+async def search(
+    db: aiosqlite.Connection,
+    user_id: int,
+    match: str,
+    utc_offset: int,
+    limit: int,
+    offset: int = 0,
+) -> list[dict]:
+    """Best matches first, from messages, archived ones too, and mood notes.
+
+    `match` is an FTS5 query. Each row has kind ('message' or 'mood'),
+    role (messages only), local_at and snippet.
+    """
+    db = await user_db(db, user_id)
+    shift = f"{utc_offset} minutes"
+    # The owner term keeps other users' rows out of the MATCH, so the cost
+    # follows the user's own history rather than the whole index
+    owner = f'owner:"u{int(user_id)}"'
+    # CROSS JOIN keeps the index lookup first: left to itself the planner may
+    # walk the user's rows and run the whole MATCH again for each of them
+    cursor = await db.execute(
+        f"""
+        SELECT * FROM (
+            SELECT 'message' AS kind, m.role, datetime(m.created_at, ?) AS local_at,
+                   snippet(conversation_fts, 0, ?, ?, '…', 16) AS snippet,
+                   bm25(conversation_fts, 1.0, 0.0) AS rank, NULL AS archived
+            FROM conversation_fts
+            CROSS JOIN conversation_messages m ON m.id = conversation_fts.rowid
+            WHERE conversation_fts MATCH ? AND m.user_id = ? AND m.{LIVE_MESSAGES}
+            UNION ALL
+            SELECT 'mood', NULL, e.local_at,
+                   snippet(mood_fts, 0, ?, ?, '…', 16),
+                   bm25(mood_fts, 1.0, 0.0), NULL
+            FROM mood_fts
+            CROSS JOIN mood_entries e ON e.id = mood_fts.rowid
+            WHERE mood_fts MATCH ? AND e.user_id = ?
+            UNION ALL
+            SELECT 'message', NULL, NULL, NULL, bm25(archive_fts, 1.0, 0.0),
+                   archive_fts.rowid
+            FROM archive_fts
+            CROSS JOIN conversation_archive a ON a.id = archive_fts.rowid / {ROWID_STRIDE}
+            WHERE archive_fts MATCH ? AND a.user_id = ? AND a.{LIVE_BLOCKS}
+        )
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        """,
+        (
+            shift, MATCH_START, MATCH_END, f"{owner} AND content:({match})",
+            user_id, user_id,
+            MATCH_START, MATCH_END, f"{owner} AND note:({match})", user_id,
+            f"{owner} AND content:({match})", user_id, user_id,
+            limit, offset,
+        ),
+    )
+    hits = [dict(r) for r in await cursor.fetchall()]
+    archived = {hit["archived"]: hit for hit in hits if hit["archived"] is not None}
+    if archived:
+        await _fill_archived(db, archived, match, shift)
+    for hit in hits:
+        del hit["archived"]
+    # A block purged after /reset since the MATCH has nothing to show
+    return [hit for hit in hits if hit["snippet"] is not None]
+
+
+async def _fill_archived(
+    db: aiosqlite.Connection, hits: dict[int, dict], match: str, shift: str
+) -> None:
+    """Fill in role, local_at and snippet of archived messages, keyed by
+    their archive_fts rowid.
+
+    archive_fts has no text to cut snippets from, so the messages are
+    unpacked into a temporary index and matched again there.
+    """
+    blocks = sorted({rowid // ROWID_STRIDE for rowid in hits})
+    cursor = await db.execute(
+        f"""
+        SELECT id, payload FROM conversation_archive
+        WHERE id IN ({", ".join("?" * len(blocks))})
+        """,
+        blocks,
+    )
+    rows = []
+    for block_id, payload in await cursor.fetchall():
+        messages = await asyncio.to_thread(unpack, payload)
+        for place, message in enumerate(messages):
+            rowid = block_id * ROWID_STRIDE + place
+            if rowid in hits:
+                rows.append((rowid, message["content"], message["role"], message["created_at"]))
+
+    await db.execute(
+        f"""
+        CREATE VIRTUAL TABLE temp.archive_hits USING fts5(
+            content, role UNINDEXED, created_at UNINDEXED, tokenize='{FTS_TOKENIZER}'
+        )
+        """
+    )
+    try:
+        await db.executemany(
+            "INSERT INTO archive_hits (rowid, content, role, created_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        cursor = await db.execute(
+            """
+            SELECT rowid, role, datetime(created_at, ?),
+                   snippet(archive_hits, 0, ?, ?, '…', 16)
+            FROM archive_hits WHERE archive_hits MATCH ?
+            """,
+            (shift, MATCH_START, MATCH_END, f"content:({match})"),
+        )
+        for rowid, role, local_at, snippet in await cursor.fetchall():
+            hits[rowid].update(role=role, local_at=local_at, snippet=snippet)
+    finally:
+        await db.execute("DROP TABLE temp.archive_hits")
+        await db.commit()
+
+
+async def backfill_step(db: aiosqlite.Connection, batch: int, blocks: int) -> int:
+    """Index the next `batch` ids of one index that predates its rows, or
+    the next `blocks` archive blocks.
+
+    Returns how many indexes still have rows waiting (0 when done).
+    """
+    remaining = 0
+    for conn in await user_dbs(db):
+        if remaining:
+            cursor = await conn.execute("SELECT count(*) FROM fts_backfill")
+            remaining += (await cursor.fetchone())[0]
+        else:
+            remaining += await _backfill_step(conn, batch, blocks)
+    return remaining
+
+
+async def _backfill_step(db: aiosqlite.Connection, batch: int, blocks: int) -> int:
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute("SELECT name, next_id, until_id FROM fts_backfill LIMIT 1")
+        row = await cursor.fetchone()
+        if row is None:
+            await db.rollback()
+            return 0
+        name, next_id, until_id = row
+        if name == "archive":
+            last_id = min(next_id + blocks - 1, until_id)
+            cursor = await db.execute(
+                """
+                SELECT id, user_id, payload FROM conversation_archive
+                WHERE id BETWEEN ? AND ?
+                """,
+                (next_id, last_id),
+            )
+            for block_id, user_id, payload in await cursor.fetchall():
+                messages = await asyncio.to_thread(unpack, payload)
+                await db.executemany(INDEX, entries(block_id, user_id, messages))
+        else:
+            table, column = FTS_INDEXES[name]
+            last_id = min(next_id + batch - 1, until_id)
+            await db.execute(
+                f"""
+                INSERT INTO {name}_fts(rowid, {column}, owner)
+                SELECT id, {column}, 'u' || user_id FROM {table} WHERE id BETWEEN ? AND ?
+                """,
+                (next_id, last_id),
+            )
+        if last_id >= until_id:
+            await db.execute("DELETE FROM fts_backfill WHERE name = ?", (name,))
+        else:
+            await db.execute(
+                "UPDATE fts_backfill SET next_id = ? WHERE name = ?", (last_id + 1, name)
+            )
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    cursor = await db.execute("SELECT count(*) FROM fts_backfill")
+    return (await cursor.fetchone())[0]
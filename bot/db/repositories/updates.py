@@ -0,0 +1,34 @@
+import aiosqlite
+
+
+async def load_recent_updates(db: aiosqlite.Connection, since: int) -> list[tuple]:
+    """(update_id, chat_id, message_id, seen_at) seen after `since`, oldest first."""
+    cursor = await db.execute(
+        """
+        SELECT update_id, chat_id, message_id, seen_at
+        FROM processed_updates
+        WHERE seen_at >= ?
+        ORDER BY seen_at
+        """,
+        (since,),
+    )
+    return [tuple(r) for r in await cursor.fetchall()]
+
+
+async def record_updates(db: aiosqlite.Connection, rows: list[tuple]) -> None:
+    await db.executemany(
+        """
+        INSERT OR IGNORE INTO processed_updates (update_id, chat_id, message_id, seen_at)
+        VALUES (?, ?, ?, ?)
+        """,
+        rows,
+    )
+    await db.commit()
+
+
+async def prune_updates(db: aiosqlite.Connection, before: int) -> int:
+    cursor = await db.execute(
+        "DELETE FROM processed_updates WHERE seen_at < ?", (before,)
+    )
+    await db.commit()
+    return cursor.rowcount
@@ -0,0 +1,58 @@
+import aiosqlite
+
+
+async def add_usage(db: aiosqlite.Connection, rows: list[tuple[int, int, int]]) -> None:
+    """Add (user_id, minute, tokens) rows to the per-minute counters."""
+    await db.executemany(
+        """
+        INSERT INTO token_usage (user_id, minute, tokens)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id, minute) DO UPDATE SET tokens = tokens + excluded.tokens
+        """,
+        rows,
+    )
+    await db.commit()
+
+
+async def load_usage(db: aiosqlite.Connection, since_minute: int) -> list[tuple[int, int, int]]:
+    cursor = await db.execute(
+        """
+        SELECT user_id, minute, tokens FROM token_usage
+        WHERE minute >= ?
+        ORDER BY minute
+        """,
+        (since_minute,),
+    )
+    return [tuple(r) for r in await cursor.fetchall()]
+
+
+async def total_usage(db: aiosqlite.Connection, since_minute: int) -> int:
+    cursor = await db.execute(
+        "SELECT COALESCE(SUM(tokens), 0) FROM token_usage WHERE minute >= ?",
+        (since_minute,),
+    )
+    return (await cursor.fetchone())[0]
+
+
+async def top_consumers(
+    db: aiosqlite.Connection, since_minute: int, limit: int = 10
+) -> list[tuple[int, int]]:
+    cursor = await db.execute(
+        """
+        SELECT user_id, SUM(tokens) AS tokens FROM token_usage
+        WHERE minute >= ?
+        GROUP BY user_id
+        ORDER BY tokens DESC
+        LIMIT ?
+        """,
+        (since_minute, limit),
+    )
+    return [tuple(r) for r in await cursor.fetchall()]
+
+
+async def prune_usage(db: aiosqlite.Connection, before_minute: int) -> int:
+    cursor = await db.execute(
+        "DELETE FROM token_usage WHERE minute < ?", (before_minute,)
+    )
+    await db.commit()
+    return cursor.rowcount
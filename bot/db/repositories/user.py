@@ -1,5 +1,22 @@
+from collections import OrderedDict
+
 import aiosqlite
 
+from bot.utils.constants import USER_CACHE_SIZE
+from bot.utils.timezones import default_utc_offset
+
+# user_id -> (profile fields as last written, row), least recently used first.
+# Users are pinned to one process (see bot/workers.py), so this stays in step
+# with the table as long as every write to a user goes through this module.
+_known: OrderedDict[int, tuple[tuple, dict]] = OrderedDict()
+
+
+def _remember(user_id: int, fingerprint: tuple, row: dict) -> None:
+    _known[user_id] = (fingerprint, row)
+    _known.move_to_end(user_id)
+    if len(_known) > USER_CACHE_SIZE:
+        _known.popitem(last=False)
+
 
 async def get_or_create_user(
     db: aiosqlite.Connection,
@@ -8,21 +25,48 @@ async def get_or_create_user(
     first_name: str | None = None,
     language_code: str | None = None,
 ) -> dict:
+    """Create the user or refresh their Telegram profile fields.
+
+    Known users whose profile did not change are served from memory
+    without touching the database.
+    """
+    fingerprint = (username, first_name, language_code)
+    known = _known.get(user_id)
+    if known is not None and known[0] == fingerprint:
+        _known.move_to_end(user_id)
+        return dict(known[1])
+
+    # utc_offset is only guessed on first sight; later it changes via /timezone
     await db.execute(
         """
-        INSERT INTO users (user_id, username, first_name, language_code)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO users (user_id, username, first_name, language_code, utc_offset)
+        VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET
             username = excluded.username,
             first_name = excluded.first_name,
             language_code = excluded.language_code
         """,
-        (user_id, username, first_name, language_code),
+        (user_id, username, first_name, language_code, default_utc_offset(language_code)),
     )
     await db.commit()
 
     cursor = await db.execute(
         "SELECT * FROM users WHERE user_id = ?", (user_id,)
     )
-    row = await cursor.fetchone()
+    row = dict(await cursor.fetchone())
+    _remember(user_id, fingerprint, row)
     return dict(row)
+
+
+async def set_utc_offset(
+    db: aiosqlite.Connection,
+    user_id: int,
+    offset: int,
+) -> None:
+    await db.execute(
+        "UPDATE users SET utc_offset = ? WHERE user_id = ?", (offset, user_id)
+    )
+    await db.commit()
+    known = _known.get(user_id)
+    if known is not None:
+        known[1]["utc_offset"] = offset
@@ -0,0 +1,95 @@
+"""Optional horizontal partitioning of the per-user tables.
+
+With SHARDS = N > 0, conversation, mood, crisis and reply job rows of a user
+live in one of N shard files next to DB_PATH, picked by user_id; users,
+settings and the other shared tables stay in DB_PATH. Each file has its own
+write lock, so writes of different users no longer queue behind each other.
+
+Repositories take the main connection and ask `user_db` for the one holding
+a user's rows, or `user_dbs` for all of them. `python -m bot.tools.reshard`
+moves the data when N changes.
+"""
+import glob
+import os
+import sqlite3
+
+import aiosqlite
+
+from bot.config import settings
+
+# bot_settings key with the number of shards the data is laid out in
+LAYOUT_KEY = "storage_shards"
+# Set while reshard puts the new shard files in place after recording the
+# layout; the files are not to be used until it is gone
+INSTALL_KEY = "storage_shards_installing"
+
+
+def shard_path(index: int, base: str | None = None) -> str:
+    """File of shard `index` next to `base` (DB_PATH by default):
+    data/freepsy.db -> data/freepsy.shard2.db
+    """
+    root, ext = os.path.splitext(base or settings.db_path)
+    return f"{root}.shard{index}{ext}"
+
+
+def shard_files(base: str | None = None) -> list[str]:
+    """Shard files that exist next to `base`, whatever their count."""
+    root, ext = os.path.splitext(base or settings.db_path)
+    return sorted(glob.glob(f"{glob.escape(root)}.shard*{ext}"))
+
+
+def shard_of(user_id: int, shards: int | None = None) -> int:
+    # The same partitioning as WORKERS: with equal counts every worker
+    # process writes to a shard of its own
+    return user_id % (shards or settings.shards)
+
+
+async def open_connection(db: aiosqlite.Connection) -> aiosqlite.Connection:
+    await db
+    db.row_factory = aiosqlite.Row
+    await db.execute("PRAGMA busy_timeout=5000")
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA foreign_keys=ON")
+    return db
+
+
+class Database(aiosqlite.Connection):
+    """Connection to the main database.
+
+    With SHARDS set, per-user tables live in shard files; repositories get a
+    connection to the right one from `user_db`, which opens it on first use.
+    Closing the main connection closes them too.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(lambda: sqlite3.connect(path), iter_chunk_size=64)
+        self.shards: dict[int, aiosqlite.Connection] = {}
+
+    async def shard(self, index: int) -> aiosqlite.Connection:
+        conn = self.shards.get(index)
+        if conn is None:
+            conn = await open_connection(aiosqlite.connect(shard_path(index)))
+            self.shards[index] = conn
+        return conn
+
+    async def close(self) -> None:
+        try:
+            for conn in self.shards.values():
+                await conn.close()
+        finally:
+            self.shards.clear()
+            await super().close()
+
+
+async def user_db(db: Database, user_id: int) -> aiosqlite.Connection:
+    """Connection to the database with `user_id`'s rows of the per-user tables."""
+    if not settings.shards:
+        return db
+    return await db.shard(shard_of(user_id))
+
+
+async def user_dbs(db: Database) -> list[aiosqlite.Connection]:
+    """Every database with per-user tables, for work that spans all users."""
+    if not settings.shards:
+        return [db]
+    return [await db.shard(index) for index in range(settings.shards)]
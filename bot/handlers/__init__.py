@@ -1,12 +1,19 @@
 from aiogram import Dispatcher
 
-from bot.handlers import start, techniques, mood, admin, reset, therapy
+from bot.handlers import (
+    start, techniques, mood, timezone, reminders, search, export, admin, reset,
+    therapy,
+)
 
 
 def register_all_handlers(dp: Dispatcher) -> None:
     dp.include_router(start.router)
     dp.include_router(techniques.router)
     dp.include_router(mood.router)
+    dp.include_router(timezone.router)
+    dp.include_router(reminders.router)
+    dp.include_router(search.router)
+    dp.include_router(export.router)
     dp.include_router(admin.router)
     dp.include_router(reset.router)
     # therapy MUST be last — it's a catch-all for text messages
@@ -1,3 +1,4 @@
+import html
 import logging
 
 from aiogram import Router, F
@@ -7,6 +8,10 @@ from aiogram.types import Message, CallbackQuery
 from bot.db.engine import get_db
 from bot.db.repositories.settings import set_setting, get_setting, delete_setting
 from bot.services.llm import validate_model, fetch_free_models
+from bot.services import metrics, outbox, quota
+from bot.services.analytics import start_analytics
+from bot.services.backup import list_backups, run_backup
+from bot.services.export import parse_export_args, start_export
 from bot.keyboards.inline import model_select_keyboard
 from bot.utils.constants import ADMIN_ID
 from bot.utils.prompts import SYSTEM_PROMPT
@@ -23,7 +28,7 @@ _model_lists: dict[int, list[dict]] = {}
 @router.message(Command("modelchange"))
 async def cmd_modelchange(message: Message) -> None:
     if message.from_user.id != ADMIN_ID:
-        await message.answer("Эта команда доступна только администратору.")
+        await outbox.answer(message, "Эта команда доступна только администратору.")
         return
 
     db = await get_db()
@@ -32,11 +37,12 @@ async def cmd_modelchange(message: Message) -> None:
     finally:
         await db.close()
 
-    await message.answer("Загружаю список моделей...")
+    await outbox.answer(message, "Загружаю список моделей...")
     models = await fetch_free_models()
 
     if not models:
-        await message.answer(
+        await outbox.answer(
+            message,
             f"Не удалось получить список моделей.\n"
             f"Текущая модель: <code>{current}</code>",
             parse_mode="HTML",
@@ -47,7 +53,7 @@ async def cmd_modelchange(message: Message) -> None:
     text = f"Текущая модель: <code>{current}</code>\n\nВыбери новую модель:"
     if truncated:
         text += f"\n<i>(показаны первые 20 из {len(models)})</i>"
-    sent = await message.answer(text, reply_markup=kb, parse_mode="HTML")
+    sent = await outbox.answer(message, text, reply_markup=kb, parse_mode="HTML")
     _model_lists[sent.message_id] = models
 
 
@@ -61,7 +67,7 @@ async def model_chosen(callback: CallbackQuery) -> None:
 
     if data == "cancel":
         _model_lists.pop(callback.message.message_id, None)
-        await callback.message.edit_text("Выбор модели отменён.")
+        await outbox.edit_text(callback.message, "Выбор модели отменён.")
         await callback.answer()
         return
 
@@ -84,12 +90,12 @@ async def model_chosen(callback: CallbackQuery) -> None:
     model_id = model["id"]
     model_name = model["name"]
 
-    await callback.message.edit_text(f"Проверяю модель <code>{model_name}</code>...", parse_mode="HTML")
+    await outbox.edit_text(callback.message, f"Проверяю модель <code>{model_name}</code>...", parse_mode="HTML")
 
     error = await validate_model(model_id)
     if error:
         _model_lists.pop(callback.message.message_id, None)
-        await callback.message.edit_text(f"Модель отклонена: {error}", parse_mode="HTML")
+        await outbox.edit_text(callback.message, f"Модель отклонена: {error}", parse_mode="HTML")
         await callback.answer()
         return
 
@@ -101,7 +107,8 @@ async def model_chosen(callback: CallbackQuery) -> None:
 
     _model_lists.pop(callback.message.message_id, None)
 
-    await callback.message.edit_text(
+    await outbox.edit_text(
+        callback.message,
         f"Модель изменена на: <b>{model_name}</b>\n<code>{model_id}</code>",
         parse_mode="HTML",
     )
@@ -111,7 +118,7 @@ async def model_chosen(callback: CallbackQuery) -> None:
 @router.message(Command("setprompt"))
 async def cmd_setprompt(message: Message) -> None:
     if message.from_user.id != ADMIN_ID:
-        await message.answer("Эта команда доступна только администратору.")
+        await outbox.answer(message, "Эта команда доступна только администратору.")
         return
 
     args = message.text.split(maxsplit=1)
@@ -121,7 +128,8 @@ async def cmd_setprompt(message: Message) -> None:
             current = await get_setting(db, "system_prompt", SYSTEM_PROMPT)
         finally:
             await db.close()
-        await message.answer(
+        await outbox.answer(
+            message,
             f"Текущий системный промпт:\n\n{current}",
         )
         return
@@ -134,13 +142,13 @@ async def cmd_setprompt(message: Message) -> None:
         await db.close()
 
     logger.info("System prompt changed by user_id=%s", message.from_user.id)
-    await message.answer("Системный промпт обновлён.")
+    await outbox.answer(message, "Системный промпт обновлён.")
 
 
 @router.message(Command("resetprompt"))
 async def cmd_resetprompt(message: Message) -> None:
     if message.from_user.id != ADMIN_ID:
-        await message.answer("Эта команда доступна только администратору.")
+        await outbox.answer(message, "Эта команда доступна только администратору.")
         return
 
     db = await get_db()
@@ -150,4 +158,106 @@ async def cmd_resetprompt(message: Message) -> None:
         await db.close()
 
     logger.info("System prompt reset to default by user_id=%s", message.from_user.id)
-    await message.answer("Системный промпт сброшен на стандартный.")
+    await outbox.answer(message, "Системный промпт сброшен на стандартный.")
+
+
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message) -> None:
+    if message.from_user.id != ADMIN_ID:
+        await outbox.answer(message, "Эта команда доступна только администратору.")
+        return
+
+    await outbox.answer(
+        message,
+        f"<pre>{html.escape(metrics.render())}</pre>",
+        parse_mode="HTML",
+    )
+
+
+@router.message(Command("exportall"))
+async def cmd_exportall(message: Message) -> None:
+    if message.from_user.id != ADMIN_ID:
+        await outbox.answer(message, "Эта команда доступна только администратору.")
+        return
+
+    args = parse_export_args(message.text)
+    if args is None:
+        await outbox.answer(message, "Формат: /exportall [csv]")
+        return
+
+    # Bulk exports are always compressed
+    fmt, _ = args
+    if not start_export(message.bot, message.chat.id, None, fmt, compress=True):
+        await outbox.answer(message, "Выгрузка уже готовится.")
+        return
+    await outbox.answer(message, "Готовлю полную выгрузку, пришлю файлом.")
+
+
+@router.message(Command("analytics"))
+async def cmd_analytics(message: Message) -> None:
+    if message.from_user.id != ADMIN_ID:
+        await outbox.answer(message, "Эта команда доступна только администратору.")
+        return
+
+    args = message.text.split()[1:]
+    if args not in ([], ["content"]):
+        await outbox.answer(message, "Формат: /analytics [content]")
+        return
+
+    if not start_analytics(message.bot, message.chat.id, include_content=bool(args)):
+        await outbox.answer(message, "Аналитическая выгрузка уже идёт.")
+
+
+@router.message(Command("backup"))
+async def cmd_backup(message: Message) -> None:
+    if message.from_user.id != ADMIN_ID:
+        await outbox.answer(message, "Эта команда доступна только администратору.")
+        return
+
+    await outbox.answer(message, "Делаю резервную копию...")
+    try:
+        result = await run_backup()
+    except Exception:
+        logger.exception("Manual backup failed")
+        await outbox.answer(message, "Резервная копия не удалась, подробности в логах.")
+        return
+
+    await outbox.answer(
+        message,
+        f"Резервная копия готова: <code>{html.escape(result.path)}</code>\n"
+        f"{result.bytes / (1024 * 1024):.1f} МБ за {result.seconds:.1f} с, "
+        f"всего копий: {len(list_backups())}",
+        parse_mode="HTML",
+    )
+
+
+def _format_quota() -> str:
+    limits = quota.limits()
+    hour, day = quota.global_usage()
+    lines = ["<b>Лимиты токенов</b> (0 — без лимита)"]
+    lines += [f"<code>{name}</code>: {value}" for name, value in limits.items()]
+    lines.append(f"\nВсего за час: {hour}, за сутки: {day}")
+    return "\n".join(lines)
+
+
+@router.message(Command("quota"))
+async def cmd_quota(message: Message) -> None:
+    if message.from_user.id != ADMIN_ID:
+        await outbox.answer(message, "Эта команда доступна только администратору.")
+        return
+
+    args = message.text.split()[1:]
+    if args:
+        if len(args) != 2 or args[0] not in quota.limits() or not args[1].isdigit():
+            await outbox.answer(
+                message,
+                f"Формат: /quota [{'|'.join(quota.limits())} число]",
+            )
+            return
+        await quota.set_limit(args[0], int(args[1]))
+        logger.info("Quota %s set to %s by user_id=%s", args[0], args[1], message.from_user.id)
+
+    lines = [_format_quota(), "\n<b>Топ за сутки</b>"]
+    top = await quota.top_users()
+    lines += [f"<code>{user_id}</code>: {tokens}" for user_id, tokens in top] or ["(пусто)"]
+    await outbox.answer(message, "\n".join(lines), parse_mode="HTML")
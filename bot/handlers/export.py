@@ -0,0 +1,32 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from bot.services import outbox
+from bot.services.export import parse_export_args, start_export
+
+router = Router()
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message) -> None:
+    args = parse_export_args(message.text)
+    if args is None:
+        await outbox.answer(
+            message,
+            "Формат: <code>/export</code>, <code>/export csv</code>, "
+            "<code>/export gz</code> (сжатие).",
+            parse_mode="HTML",
+        )
+        return
+
+    fmt, compress = args
+    if not start_export(message.bot, message.chat.id, message.from_user.id, fmt, compress):
+        await outbox.answer(message, "Выгрузка уже готовится, подожди немного.")
+        return
+
+    await outbox.answer(
+        message,
+        "Готовлю выгрузку твоих сообщений и дневника настроения. "
+        "Пришлю файлом, как только будет готово.",
+    )
@@ -1,15 +1,23 @@
 import html
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 
 from bot.db.engine import get_db
-from bot.db.repositories.mood import add_entry, get_entries_range
-from bot.keyboards.inline import mood_keyboard
-from bot.services.mood_analytics import weekly_summary
+from bot.db.repositories.mood import (
+    add_entry,
+    get_entries_range,
+    get_daily_range,
+    get_period_range,
+)
+from bot.keyboards.inline import mood_keyboard, diary_period_keyboard
+from bot.services.mood_analytics import weekly_summary, long_range_summary
+from bot.services import outbox
+from bot.utils.constants import DIARY_PERIODS
 
 router = Router()
 
@@ -20,7 +28,8 @@ class MoodStates(StatesGroup):
 
 @router.message(Command("mood"))
 async def cmd_mood(message: Message) -> None:
-    await message.answer(
+    await outbox.answer(
+        message,
         "Как ты себя чувствуешь? Оцени настроение от 1 до 10:",
         reply_markup=mood_keyboard(),
     )
@@ -40,7 +49,8 @@ async def mood_score_chosen(callback: CallbackQuery, state: FSMContext) -> None:
 
     await state.update_data(mood_score=score)
     await state.set_state(MoodStates.waiting_note)
-    await callback.message.edit_text(
+    await outbox.edit_text(
+        callback.message,
         f"Оценка: <b>{score}/10</b>\n\nХочешь добавить заметку? Напиши текст или отправь /skip",
         parse_mode="HTML",
     )
@@ -50,7 +60,7 @@ async def mood_score_chosen(callback: CallbackQuery, state: FSMContext) -> None:
 @router.message(MoodStates.waiting_note, Command("cancel"))
 async def mood_cancel(message: Message, state: FSMContext) -> None:
     await state.clear()
-    await message.answer("Запись настроения отменена.")
+    await outbox.answer(message, "Запись настроения отменена.")
 
 
 @router.message(MoodStates.waiting_note, F.text.startswith("/"))
@@ -67,7 +77,8 @@ async def mood_ignore_commands(message: Message, state: FSMContext) -> None:
         await db.close()
 
     await state.clear()
-    await message.answer(
+    await outbox.answer(
+        message,
         f"Настроение <b>{score}/10</b> записано без заметки.",
         parse_mode="HTML",
     )
@@ -87,19 +98,57 @@ async def mood_note_received(message: Message, state: FSMContext) -> None:
 
     await state.clear()
     note_text = f'\nЗаметка: <i>{html.escape(note)}</i>' if note else ""
-    await message.answer(
+    await outbox.answer(
+        message,
         f"Записано! Настроение: <b>{score}/10</b>{note_text}",
         parse_mode="HTML",
     )
 
 
-@router.message(Command("diary"))
-async def cmd_diary(message: Message) -> None:
+async def _diary_text(user_id: int, days: int) -> str:
     db = await get_db()
     try:
-        entries = await get_entries_range(db, message.from_user.id, days=7)
+        daily = await get_daily_range(db, user_id, days=days)
+        if days == 7:
+            entries = await get_entries_range(db, user_id, days=days)
+            return weekly_summary(entries, daily)
+        period = "month" if days > 90 else "week"
+        periods = await get_period_range(db, user_id, days=days, period=period)
     finally:
         await db.close()
+    return long_range_summary(daily, periods, days, period)
+
 
-    text = weekly_summary(entries)
-    await message.answer(text, parse_mode="HTML")
+@router.message(Command("diary"))
+async def cmd_diary(message: Message) -> None:
+    args = message.text.split(maxsplit=1)
+    days = 7
+    if len(args) > 1 and args[1].strip().isdigit() and int(args[1]) in DIARY_PERIODS:
+        days = int(args[1])
+
+    text = await _diary_text(message.from_user.id, days)
+    await outbox.answer(message, text, parse_mode="HTML", reply_markup=diary_period_keyboard(days))
+
+
+@router.callback_query(F.data.startswith("diary:"))
+async def diary_period_chosen(callback: CallbackQuery) -> None:
+    try:
+        days = int(callback.data.split(":")[1])
+    except (ValueError, IndexError):
+        await callback.answer("Некорректные данные.", show_alert=True)
+        return
+
+    if days not in DIARY_PERIODS:
+        await callback.answer("Некорректный период.", show_alert=True)
+        return
+
+    text = await _diary_text(callback.from_user.id, days)
+    try:
+        await outbox.edit_text(
+            callback.message,
+            text, parse_mode="HTML", reply_markup=diary_period_keyboard(days)
+        )
+    except TelegramBadRequest:
+        # Same period pressed again — message is not modified
+        pass
+    await callback.answer()
@@ -0,0 +1,74 @@
+import time
+
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from bot.db.engine import get_db
+from bot.db.repositories.reminders import delete_reminder, get_reminder, set_reminder
+from bot.db.repositories.user import get_or_create_user
+from bot.services import outbox, reminders
+from bot.utils.timezones import format_time_of_day, format_utc_offset, parse_time_of_day
+
+router = Router()
+
+
+@router.message(Command("remind"))
+async def cmd_remind(message: Message) -> None:
+    args = message.text.split(maxsplit=1)
+    user_id = message.from_user.id
+    db = await get_db()
+    try:
+        user = await get_or_create_user(
+            db,
+            user_id=user_id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            language_code=message.from_user.language_code,
+        )
+        if len(args) < 2:
+            reminder = await get_reminder(db, user_id)
+            if reminder is None:
+                text = (
+                    "Я могу каждый день напоминать записать настроение.\n\n"
+                    "Отправь время, например <code>/remind 21:00</code>."
+                )
+            else:
+                text = (
+                    "Напоминание приходит каждый день в "
+                    f"<b>{format_time_of_day(reminder['local_time'])}</b> "
+                    f"({format_utc_offset(user['utc_offset'])}).\n\n"
+                    "Изменить: <code>/remind 21:00</code>, выключить: <code>/remind off</code>."
+                )
+            await outbox.answer(message, text, parse_mode="HTML")
+            return
+
+        if args[1].strip().lower() in ("off", "выкл", "нет"):
+            await delete_reminder(db, user_id)
+            reminders.unschedule(user_id)
+            await outbox.answer(message, "Напоминания выключены.")
+            return
+
+        local_time = parse_time_of_day(args[1])
+        if local_time is None:
+            await outbox.answer(
+                message,
+                "Не понял время. Пример: <code>/remind 21:00</code>.",
+                parse_mode="HTML",
+            )
+            return
+
+        next_fire_at = await set_reminder(
+            db, user_id, message.chat.id, local_time, user["utc_offset"], int(time.time())
+        )
+    finally:
+        await db.close()
+
+    reminders.schedule(user_id, next_fire_at)
+    await outbox.answer(
+        message,
+        f"Готово! Буду напоминать каждый день в <b>{format_time_of_day(local_time)}</b> "
+        f"({format_utc_offset(user['utc_offset'])}).\n"
+        "Часовой пояс меняется командой /timezone, выключить — <code>/remind off</code>.",
+        parse_mode="HTML",
+    )
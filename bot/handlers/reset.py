@@ -5,13 +5,15 @@ from aiogram.types import Message, CallbackQuery
 from bot.db.engine import get_db
 from bot.db.repositories.conversation import delete_messages
 from bot.keyboards.inline import reset_confirm_keyboard
+from bot.services import outbox
 
 router = Router()
 
 
 @router.message(Command("reset"))
 async def cmd_reset(message: Message) -> None:
-    await message.answer(
+    await outbox.answer(
+        message,
         "Ты уверен(а), что хочешь очистить всю историю диалога? Это действие нельзя отменить.",
         reply_markup=reset_confirm_keyboard(),
     )
@@ -25,7 +27,8 @@ async def reset_confirmed(callback: CallbackQuery) -> None:
     finally:
         await db.close()
 
-    await callback.message.edit_text(
+    await outbox.edit_text(
+        callback.message,
         f"История очищена. Удалено сообщений: {deleted}.\nМожем начать сначала 💙"
     )
     await callback.answer()
@@ -33,5 +36,5 @@ async def reset_confirmed(callback: CallbackQuery) -> None:
 
 @router.callback_query(F.data == "reset:cancel")
 async def reset_cancelled(callback: CallbackQuery) -> None:
-    await callback.message.edit_text("Отменено. История сохранена.")
+    await outbox.edit_text(callback.message, "Отменено. История сохранена.")
     await callback.answer()
@@ -0,0 +1,63 @@
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message
+
+from bot.db.engine import get_db
+from bot.db.repositories.user import get_or_create_user
+from bot.keyboards.inline import search_pages_keyboard
+from bot.services import outbox
+from bot.services.search import search_page
+
+router = Router()
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext) -> None:
+    args = message.text.split(maxsplit=1)
+    query = args[1].strip() if len(args) > 1 else ""
+    db = await get_db()
+    try:
+        user = await get_or_create_user(
+            db,
+            user_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            language_code=message.from_user.language_code,
+        )
+    finally:
+        await db.close()
+
+    text, has_next = await search_page(message.from_user.id, user["utc_offset"], query, 0)
+    # The query does not fit in callback data, so pages read it from here
+    await state.update_data(search_query=query, search_offset=user["utc_offset"])
+    await outbox.answer(
+        message, text, parse_mode="HTML", reply_markup=search_pages_keyboard(0, has_next)
+    )
+
+
+@router.callback_query(F.data.startswith("search:"))
+async def search_page_chosen(callback: CallbackQuery, state: FSMContext) -> None:
+    try:
+        page = int(callback.data.split(":")[1])
+    except (ValueError, IndexError):
+        await callback.answer("Некорректные данные.", show_alert=True)
+        return
+
+    data = await state.get_data()
+    if "search_query" not in data or page < 0:
+        await callback.answer("Этот поиск устарел, повтори /search.", show_alert=True)
+        return
+
+    text, has_next = await search_page(
+        callback.from_user.id, data["search_offset"], data["search_query"], page
+    )
+    try:
+        await outbox.edit_text(
+            callback.message,
+            text, parse_mode="HTML", reply_markup=search_pages_keyboard(page, has_next)
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
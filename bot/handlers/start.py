@@ -4,6 +4,7 @@ from aiogram.types import Message
 
 from bot.db.engine import get_db
 from bot.db.repositories.user import get_or_create_user
+from bot.services import outbox
 from bot.utils.prompts import WELCOME_MESSAGE, HELP_MESSAGE
 
 router = Router()
@@ -22,9 +23,9 @@ async def cmd_start(message: Message) -> None:
         )
     finally:
         await db.close()
-    await message.answer(WELCOME_MESSAGE, parse_mode="HTML")
+    await outbox.answer(message, WELCOME_MESSAGE, parse_mode="HTML")
 
 
 @router.message(Command("help"))
 async def cmd_help(message: Message) -> None:
-    await message.answer(HELP_MESSAGE, parse_mode="HTML")
+    await outbox.answer(message, HELP_MESSAGE, parse_mode="HTML")
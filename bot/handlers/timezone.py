@@ -0,0 +1,63 @@
+import time
+
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from bot.db.engine import get_db
+from bot.db.repositories.reminders import reschedule_reminder
+from bot.db.repositories.user import get_or_create_user, set_utc_offset
+from bot.services import outbox, reminders
+from bot.utils.timezones import parse_utc_offset, format_utc_offset
+
+router = Router()
+
+
+@router.message(Command("timezone"))
+async def cmd_timezone(message: Message) -> None:
+    args = message.text.split(maxsplit=1)
+    db = await get_db()
+    try:
+        user = await get_or_create_user(
+            db,
+            user_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            language_code=message.from_user.language_code,
+        )
+        if len(args) < 2:
+            await outbox.answer(
+                message,
+                f"Твой часовой пояс: <b>{format_utc_offset(user['utc_offset'])}</b>\n\n"
+                "Чтобы изменить, отправь, например, <code>/timezone +7</code> "
+                "или <code>/timezone +5:30</code>.",
+                parse_mode="HTML",
+            )
+            return
+
+        offset = parse_utc_offset(args[1])
+        if offset is None:
+            await outbox.answer(
+                message,
+                "Не понял часовой пояс. Пример: <code>/timezone +3</code> "
+                "(от -12 до +14).",
+                parse_mode="HTML",
+            )
+            return
+
+        await set_utc_offset(db, message.from_user.id, offset)
+        next_fire_at = await reschedule_reminder(
+            db, message.from_user.id, offset, int(time.time())
+        )
+    finally:
+        await db.close()
+
+    if next_fire_at is not None:
+        reminders.schedule(message.from_user.id, next_fire_at)
+
+    await outbox.answer(
+        message,
+        f"Часовой пояс сохранён: <b>{format_utc_offset(offset)}</b>.\n"
+        "Новые записи настроения и напоминания будут учитываться по твоему местному времени.",
+        parse_mode="HTML",
+    )
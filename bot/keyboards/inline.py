@@ -1,5 +1,7 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from bot.utils.constants import DIARY_PERIODS
+
 
 def mood_keyboard() -> InlineKeyboardMarkup:
     rows = []
@@ -12,6 +14,17 @@ def mood_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def diary_period_keyboard(current: int) -> InlineKeyboardMarkup:
+    row = [
+        InlineKeyboardButton(
+            text=f"\u2713 {days} дн." if days == current else f"{days} дн.",
+            callback_data=f"diary:{days}",
+        )
+        for days in DIARY_PERIODS
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+
 def reset_confirm_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -41,3 +54,12 @@ def model_select_keyboard(
         rows.append([InlineKeyboardButton(text=label, callback_data=f"model:{idx}")])
     rows.append([InlineKeyboardButton(text="Отмена", callback_data="model:cancel")])
     return InlineKeyboardMarkup(inline_keyboard=rows), truncated
+
+
+def search_pages_keyboard(page: int, has_next: bool) -> InlineKeyboardMarkup | None:
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="← Назад", callback_data=f"search:{page - 1}"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Дальше →", callback_data=f"search:{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
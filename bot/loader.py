@@ -3,9 +3,12 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from bot.config import settings
-from bot.handlers import register_all_handlers
+from bot.handlers import register_all_handlers, therapy
 from bot.middlewares.rate_limit import RateLimitMiddleware
 from bot.middlewares.crisis_check import CrisisCheckMiddleware
+from bot.middlewares.dedup import update_dedup
+from bot.middlewares.in_flight import InFlightMiddleware
+from bot.middlewares.mailbox import UserMailboxMiddleware
 
 
 def create_bot() -> Bot:
@@ -18,9 +21,16 @@ def create_bot() -> Bot:
 def create_dispatcher() -> Dispatcher:
     dp = Dispatcher(storage=MemoryStorage())
 
+    # Outermost, so a shutdown waits for every update that got this far
+    dp.update.outer_middleware(InFlightMiddleware())
+    # Drop redelivered updates before any handler or filter sees them
+    dp.update.outer_middleware(update_dedup)
+
     # Register middlewares on message updates
     dp.message.middleware(RateLimitMiddleware())
     dp.message.middleware(CrisisCheckMiddleware())
+    # One LLM turn per user at a time, so each reply sees the previous one
+    therapy.router.message.middleware(UserMailboxMiddleware())
 
     # Register all handlers
     register_all_handlers(dp)
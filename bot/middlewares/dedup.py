@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot.db.engine import get_db
+from bot.db.repositories.updates import load_recent_updates, prune_updates, record_updates
+from bot.services import metrics
+from bot.utils.constants import (
+    DEDUP_FLUSH_INTERVAL,
+    DEDUP_MAX_ENTRIES,
+    DEDUP_PRUNE_INTERVAL,
+    DEDUP_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """Drops updates Telegram delivers a second time.
+
+    An update is a duplicate if its update_id, or the (chat_id, message_id)
+    of its message, has been seen within DEDUP_TTL. Lookups are served from
+    memory; seen keys are written to `processed_updates` in batches, and the
+    table is read once on the first update so duplicates are recognised
+    across restarts.
+    """
+
+    def __init__(self) -> None:
+        self._updates: OrderedDict[int, int] = OrderedDict()
+        self._messages: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._pending: list[tuple] = []
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def _load(self) -> None:
+        async with self._load_lock:
+            if self._loaded:
+                return
+            db = await get_db()
+            try:
+                rows = await load_recent_updates(db, int(time.time()) - DEDUP_TTL)
+            finally:
+                await db.close()
+            for update_id, chat_id, message_id, seen_at in rows[-DEDUP_MAX_ENTRIES:]:
+                self._remember(update_id, chat_id, message_id, seen_at)
+            self._loaded = True
+            logger.info("Loaded %d recently processed updates", len(self._updates))
+
+    def _remember(
+        self, update_id: int, chat_id: int | None, message_id: int | None, seen_at: int
+    ) -> None:
+        self._updates[update_id] = seen_at
+        if chat_id is not None:
+            self._messages[(chat_id, message_id)] = seen_at
+
+    def _evict(self, now: int) -> None:
+        for cache in (self._updates, self._messages):
+            while cache and (
+                len(cache) > DEDUP_MAX_ENTRIES or next(iter(cache.values())) < now - DEDUP_TTL
+            ):
+                cache.popitem(last=False)
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        if not self._loaded:
+            await self._load()
+
+        message = event.message
+        message_key = (message.chat.id, message.message_id) if message else None
+        if event.update_id in self._updates or message_key in self._messages:
+            metrics.inc("updates_duplicate")
+            logger.info("Dropping duplicate update %s", event.update_id)
+            return None
+
+        now = int(time.time())
+        chat_id, message_id = message_key or (None, None)
+        self._remember(event.update_id, chat_id, message_id, now)
+        self._evict(now)
+        self._pending.append((event.update_id, chat_id, message_id, now))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+        return await handler(event, data)
+
+    async def flush(self) -> None:
+        """Write seen keys that are still only in memory."""
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        db = await get_db()
+        try:
+            await record_updates(db, rows)
+        except Exception:
+            # Keep them for the next attempt
+            self._pending[:0] = rows
+            raise
+        finally:
+            await db.close()
+
+    async def _flush_loop(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(DEDUP_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                if time.monotonic() - last_prune > DEDUP_PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    db = await get_db()
+                    try:
+                        await prune_updates(db, int(time.time()) - DEDUP_TTL)
+                    finally:
+                        await db.close()
+            except Exception:
+                logger.exception("Failed to persist processed updates")
+
+
+update_dedup = UpdateDedupMiddleware()
@@ -0,0 +1,19 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot.services import lifecycle
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Tracks the task handling each update, so a shutdown lets it finish."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        lifecycle.track()
+        return await handler(event, data)
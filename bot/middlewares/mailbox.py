@@ -0,0 +1,104 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from bot.services import metrics, outbox
+from bot.utils.constants import MAILBOX_IDLE_TIMEOUT, MAILBOX_MAX_DEPTH
+
+Handler = Callable[[Message, dict[str, Any]], Awaitable[Any]]
+
+
+class _Mailbox:
+    __slots__ = ("items", "wakeup", "busy", "task")
+
+    def __init__(self) -> None:
+        self.items: deque[tuple[Handler, Message, dict[str, Any], asyncio.Future]] = deque()
+        self.wakeup = asyncio.Event()
+        self.busy = False
+        self.task: asyncio.Task | None = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.items) + self.busy
+
+
+class UserMailboxMiddleware(BaseMiddleware):
+    """Runs each user's turns one at a time, in arrival order.
+
+    Every user with pending turns gets an actor task that drains their
+    mailbox; different users are handled concurrently. An actor exits after
+    MAILBOX_IDLE_TIMEOUT seconds without new turns. A full mailbox rejects new
+    turns with a short notice, except when a crisis keyword was detected.
+    """
+
+    def __init__(self) -> None:
+        self._boxes: dict[int, _Mailbox] = {}
+        metrics.register_gauge("mailbox_active_users", lambda: len(self._boxes))
+        metrics.register_gauge(
+            "mailbox_queued", lambda: sum(len(b.items) for b in self._boxes.values())
+        )
+
+    async def __call__(
+        self,
+        handler: Handler,
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if event.from_user is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        box = self._boxes.get(user_id)
+        if box is None:
+            box = self._boxes[user_id] = _Mailbox()
+            box.task = asyncio.create_task(self._run(user_id, box))
+
+        if box.depth >= MAILBOX_MAX_DEPTH and not data.get("crisis_keyword"):
+            metrics.inc("mailbox_rejected")
+            await outbox.answer(
+                event,
+                "⏳ Я ещё отвечаю на твои предыдущие сообщения. "
+                "Подожди немного и напиши снова.",
+            )
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        box.items.append((handler, event, data, future))
+        box.wakeup.set()
+        return await future
+
+    async def _run(self, user_id: int, box: _Mailbox) -> None:
+        try:
+            while True:
+                if not box.items:
+                    box.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(box.wakeup.wait(), MAILBOX_IDLE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        if not box.items:
+                            return
+                    continue
+
+                handler, event, data, future = box.items.popleft()
+                if future.done():
+                    # The update was cancelled while waiting
+                    continue
+                box.busy = True
+                try:
+                    result = await handler(event, data)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    box.busy = False
+        finally:
+            if self._boxes.get(user_id) is box:
+                del self._boxes[user_id]
+            for *_, future in box.items:
+                future.cancel()
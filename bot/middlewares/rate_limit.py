@@ -4,12 +4,13 @@ from typing import Any, Awaitable, Callable
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
+from bot.services import outbox
 from bot.utils.constants import RATE_LIMIT_BURST, RATE_LIMIT_RATE
 
 _BUCKET_EVICTION_AGE = 3600  # 1 hour
 _LIGHTWEIGHT_COMMANDS = frozenset({
     "/mood", "/diary", "/start", "/help", "/cancel", "/skip",
-    "/reset", "/techniques",
+    "/reset", "/techniques", "/timezone",
 })
 
 
@@ -61,7 +62,8 @@ class RateLimitMiddleware(BaseMiddleware):
         user_id = event.from_user.id
         bucket = self._buckets.setdefault(user_id, _Bucket())
         if not bucket.consume():
-            await event.answer(
+            await outbox.answer(
+                event,
                 "⏳ Подожди немного, я ещё обрабатываю предыдущий запрос."
             )
             return None
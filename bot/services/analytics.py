@@ -0,0 +1,256 @@
+"""Offline analytics export.
+
+The live database is first copied with SQLite's online backup API; tables are
+then dumped from the copy into one gzip-compressed CSV per table. Analysis
+queries never touch the database the bot writes to. With SHARDS set, every
+shard is copied too and the per-user tables are dumped from all of them;
+their ids are unique per shard, (user_id, id) overall.
+"""
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from bot.config import settings
+from bot.db.backup import copy_database
+from bot.db.shards import shard_path
+from bot.services import metrics, outbox
+from bot.utils.constants import (
+    ANALYTICS_BATCH_PAUSE,
+    ANALYTICS_BATCH_ROWS,
+    ANALYTICS_KEEP_RUNS,
+    ANALYTICS_PROGRESS_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# table -> (columns, columns with user-written text, exported only on request)
+_TABLES: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {
+    "users": (
+        ("user_id", "language_code", "utc_offset", "is_blocked", "created_at"),
+        (),
+    ),
+    "conversation_messages": (
+        ("id", "user_id", "role", "tokens_est",
+         "length(content) AS content_chars", "created_at"),
+        ("content",),
+    ),
+    "conversation_archive": (
+        ("id", "user_id", "first_message_id", "last_message_id", "message_count",
+         "first_created_at", "last_created_at", "archived_at"),
+        (),
+    ),
+    "mood_entries": (
+        ("id", "user_id", "score", "created_at", "local_at"),
+        ("note",),
+    ),
+    "crisis_events": (
+        ("id", "user_id", "trigger", "created_at"),
+        ("matched",),
+    ),
+}
+
+_lock = asyncio.Lock()
+_admin_task: asyncio.Task | None = None
+
+
+@dataclass
+class Progress:
+    """Written by the export thread, read by the reporter on the event loop."""
+
+    table: str = ""
+    rows_done: int = 0
+    rows_total: int = 0
+
+    def render(self) -> str:
+        if not self.table:
+            return "Аналитика: снимаю копию базы..."
+        percent = self.rows_done * 100 // self.rows_total if self.rows_total else 100
+        return (
+            f"Аналитика: выгружаю {self.table}\n"
+            f"{self.rows_done}/{self.rows_total} строк ({percent}%)"
+        )
+
+
+@dataclass
+class AnalyticsResult:
+    path: str
+    rows: dict[str, int] = field(default_factory=dict)
+    bytes: int = 0
+
+
+def analytics_dir() -> str:
+    return os.path.join(os.path.dirname(settings.db_path) or ".", "analytics")
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+def _query(table: str, include_content: bool) -> str:
+    columns, content_columns = _TABLES[table]
+    if include_content:
+        columns += content_columns
+    return f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid"
+
+
+def _dump_table(
+    conns: list[sqlite3.Connection], table: str, query: str, path: str, progress: Progress
+) -> int:
+    progress.table = table
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        for i, conn in enumerate(conns):
+            cursor = conn.execute(query)
+            if i == 0:
+                writer.writerow([d[0] for d in cursor.description])
+            while rows := cursor.fetchmany(ANALYTICS_BATCH_ROWS):
+                writer.writerows(rows)
+                count += len(rows)
+                progress.rows_done += len(rows)
+                # Give the GIL back so the event loop keeps serving users
+                time.sleep(ANALYTICS_BATCH_PAUSE)
+    return count
+
+
+def _export_snapshot(
+    snapshot_paths: list[str], out_dir: str, include_content: bool, progress: Progress
+) -> dict[str, int]:
+    """The main snapshot comes first, shard snapshots (if any) after it."""
+    conns = [sqlite3.connect(f"file:{path}?mode=ro", uri=True) for path in snapshot_paths]
+    main, shards = conns[0], conns[1:] or conns[:1]
+    try:
+        sources = {table: [main] if table == "users" else shards for table in _TABLES}
+        progress.rows_total = sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in _TABLES
+            for conn in sources[table]
+        )
+        return {
+            table: _dump_table(
+                sources[table],
+                table,
+                _query(table, include_content),
+                os.path.join(out_dir, f"{table}.csv.gz"),
+                progress,
+            )
+            for table in _TABLES
+        }
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def _prune_old_runs() -> None:
+    runs = sorted(
+        entry.path for entry in os.scandir(analytics_dir()) if entry.is_dir()
+    )
+    for path in runs[:-ANALYTICS_KEEP_RUNS]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+async def run_analytics_export(
+    include_content: bool = False, progress: Progress | None = None
+) -> AnalyticsResult:
+    """Snapshot the DB and dump analytics tables to `<db dir>/analytics/<stamp>/`.
+
+    Message content, mood notes and matched crisis phrases are left out unless
+    `include_content` is set.
+    """
+    progress = progress or Progress()
+    async with _lock:
+        out_dir = os.path.join(analytics_dir(), time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(out_dir, exist_ok=True)
+        snapshot_path = os.path.join(out_dir, "snapshot.db")
+        copies = [(settings.db_path, snapshot_path)] + [
+            (shard_path(index), shard_path(index, snapshot_path))
+            for index in range(settings.shards)
+        ]
+        try:
+            for source, dest in copies:
+                await copy_database(dest, source=source)
+            rows = await asyncio.to_thread(
+                _export_snapshot, [dest for _, dest in copies], out_dir, include_content, progress
+            )
+        finally:
+            for _, dest in copies:
+                if os.path.exists(dest):
+                    os.remove(dest)
+
+        result = AnalyticsResult(path=out_dir, rows=rows)
+        result.bytes = sum(entry.stat().st_size for entry in os.scandir(out_dir))
+        await asyncio.to_thread(_prune_old_runs)
+
+    metrics.inc("analytics_exports")
+    return result
+
+
+async def _report_progress(status: Message, progress: Progress) -> None:
+    shown = status.text
+    while True:
+        await asyncio.sleep(ANALYTICS_PROGRESS_INTERVAL)
+        text = progress.render()
+        if text == shown:
+            continue
+        try:
+            await outbox.edit_text(status, text)
+            shown = text
+        except TelegramBadRequest:
+            logger.debug("Failed to update analytics progress", exc_info=True)
+
+
+def _summary(result: AnalyticsResult) -> str:
+    lines = [f"Аналитика готова: {result.path}"]
+    lines += [f"• {table}: {count}" for table, count in result.rows.items()]
+    lines.append(f"Размер: {result.bytes / 1024:.0f} КБ")
+    return "\n".join(lines)
+
+
+async def _run_for_admin(bot: Bot, chat_id: int, include_content: bool) -> None:
+    progress = Progress()
+    status = await outbox.send(chat_id, lambda: bot.send_message(chat_id, progress.render()))
+    reporter = asyncio.create_task(_report_progress(status, progress))
+    try:
+        result = await run_analytics_export(include_content, progress)
+        text = _summary(result)
+    except Exception:
+        logger.exception("Analytics export failed")
+        text = "Не удалось подготовить аналитическую выгрузку."
+    finally:
+        reporter.cancel()
+    await outbox.send(chat_id, lambda: bot.send_message(chat_id, text))
+
+
+def start_analytics(bot: Bot, chat_id: int, include_content: bool = False) -> bool:
+    """Run an export in the background, reporting progress to `chat_id`.
+
+    Returns False if an export is already running.
+    """
+    global _admin_task
+    if is_running() or (_admin_task is not None and not _admin_task.done()):
+        return False
+    _admin_task = asyncio.create_task(_run_for_admin(bot, chat_id, include_content))
+    return True
+
+
+async def analytics_loop() -> None:
+    interval = settings.analytics_interval_hours * 3600
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_analytics_export()
+            logger.info("Analytics export written to %s", result.path)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scheduled analytics export failed")
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+import aiosqlite
+
+from bot.config import settings
+from bot.db.engine import get_db
+from bot.db.repositories.archive import (
+    archive_block,
+    get_archive_boundary,
+    get_users_with_messages,
+    incremental_vacuum,
+)
+from bot.db.shards import user_dbs
+from bot.utils.constants import (
+    ARCHIVE_BLOCK_MESSAGES,
+    ARCHIVE_INTERVAL,
+    ARCHIVE_VACUUM_PAGES,
+    MAX_HISTORY_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_user(db: aiosqlite.Connection, user_id: int) -> int:
+    """Archive everything that is too old or can no longer fit into the LLM
+    context window. Returns the number of messages moved.
+    """
+    boundary = await get_archive_boundary(
+        db,
+        user_id,
+        max_age_days=settings.archive_after_days,
+        budget=MAX_HISTORY_TOKENS,
+    )
+    if boundary is None:
+        return 0
+
+    moved = 0
+    while True:
+        count = await archive_block(db, user_id, boundary, ARCHIVE_BLOCK_MESSAGES)
+        if not count:
+            break
+        moved += count
+        # Let live handlers take the write lock between blocks
+        await asyncio.sleep(0)
+    return moved
+
+
+async def reclaim_free_pages(db: aiosqlite.Connection) -> None:
+    """Shrink the DB file in small steps so the write lock is never held long."""
+    left = await incremental_vacuum(db, ARCHIVE_VACUUM_PAGES)
+    while left:
+        await asyncio.sleep(0)
+        previous, left = left, await incremental_vacuum(db, ARCHIVE_VACUUM_PAGES)
+        if left >= previous:
+            break
+
+
+async def run_archival() -> int:
+    db = await get_db()
+    try:
+        moved = 0
+        for user_id in await get_users_with_messages(db):
+            moved += await archive_user(db, user_id)
+
+        if moved:
+            for conn in await user_dbs(db):
+                await reclaim_free_pages(conn)
+        return moved
+    finally:
+        await db.close()
+
+
+async def archival_loop() -> None:
+    while True:
+        try:
+            moved = await run_archival()
+            if moved:
+                logger.info("Archived %d conversation messages", moved)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Conversation archival failed")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
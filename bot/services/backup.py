@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from bot.config import settings
+from bot.db.backup import copy_database, integrity_check
+from bot.db.shards import shard_files, shard_path
+from bot.services import metrics
+from bot.utils.constants import BACKUP_MAX_RESTARTS, BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "freepsy-"
+_lock = asyncio.Lock()
+
+
+@dataclass
+class BackupResult:
+    path: str
+    bytes: int
+    seconds: float
+
+
+def backup_dir() -> str:
+    return settings.backup_dir or os.path.join(
+        os.path.dirname(settings.db_path) or ".", "backups"
+    )
+
+
+def list_backups() -> list[str]:
+    """Finished backups, oldest first. Shard copies sit next to each one."""
+    if not os.path.isdir(backup_dir()):
+        return []
+    return sorted(
+        entry.path for entry in os.scandir(backup_dir())
+        if entry.name.startswith(_PREFIX)
+        and entry.name.endswith(".db")
+        and ".shard" not in entry.name
+    )
+
+
+def _rotate() -> None:
+    for path in list_backups()[:-settings.backup_keep]:
+        for shard in shard_files(path):
+            os.remove(shard)
+        os.remove(path)
+        logger.info("Removed old backup %s", path)
+
+
+async def run_backup() -> BackupResult:
+    """Copy the live DB into the backup dir, verify it and rotate old copies.
+
+    Shards (SHARDS > 0) are copied one after another next to the main file;
+    each copy is consistent on its own. Copies go to temporary files and only
+    get their final names once `PRAGMA integrity_check` passes, the main file
+    last, so a listed backup is always usable.
+    """
+    async with _lock:
+        os.makedirs(backup_dir(), exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(backup_dir(), f"{_PREFIX}{stamp}.db")
+        copies = [(settings.db_path, path)] + [
+            (shard_path(index), shard_path(index, path)) for index in range(settings.shards)
+        ]
+        started = time.monotonic()
+        try:
+            for source, dest in copies:
+                await copy_database(
+                    dest + ".tmp",
+                    source=source,
+                    pages=BACKUP_STEP_PAGES,
+                    sleep=BACKUP_STEP_SLEEP,
+                    max_restarts=BACKUP_MAX_RESTARTS,
+                )
+                result = await integrity_check(dest + ".tmp")
+                if result != "ok":
+                    metrics.inc("backup_failed")
+                    raise RuntimeError(f"Backup failed integrity check: {result[:200]}")
+            for _, dest in reversed(copies):
+                os.replace(dest + ".tmp", dest)
+        finally:
+            for _, dest in copies:
+                if os.path.exists(dest + ".tmp"):
+                    os.remove(dest + ".tmp")
+
+        await asyncio.to_thread(_rotate)
+
+    metrics.inc("backup_completed")
+    return BackupResult(
+        path=path,
+        bytes=sum(os.path.getsize(dest) for _, dest in copies),
+        seconds=time.monotonic() - started,
+    )
+
+
+async def backup_loop() -> None:
+    interval = settings.backup_interval_hours * 3600
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await run_backup()
+            logger.info(
+                "Backup written to %s (%d bytes, %.1fs)",
+                result.path, result.bytes, result.seconds,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scheduled backup failed")
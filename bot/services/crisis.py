@@ -2,6 +2,7 @@ import logging
 
 import aiosqlite
 
+from bot.db.shards import user_db
 from bot.utils.crisis_keywords import ALL_CRISIS_KEYWORDS
 from bot.utils.prompts import CRISIS_LLM_PROMPT
 from bot.services.llm import chat_completion
@@ -34,6 +35,7 @@ async def log_crisis_event(
     trigger: str,
     matched: str | None,
 ) -> None:
+    db = await user_db(db, user_id)
     await db.execute(
         """
         INSERT INTO crisis_events (user_id, trigger, matched)
@@ -0,0 +1,213 @@
+"""Pool of OpenAI-compatible chat completion endpoints.
+
+The primary endpoint is OpenRouter with OPENROUTER_API_KEY. EXTRA_API_KEYS
+adds more OpenRouter keys, LLM_ENDPOINTS adds other servers (for example a
+self-hosted one), as comma-separated `url|api_key|max_concurrency|model`
+entries where everything after the url is optional.
+
+Each call goes to an endpoint picked at random with weights favouring low
+latency and few recent errors. Endpoints have their own concurrency limit,
+sit out a cooldown after a 429, and after repeated failures are taken out of
+rotation until a probe of their models URL succeeds.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiohttp
+
+from bot.config import settings
+from bot.services import metrics
+from bot.utils.constants import (
+    LLM_ENDPOINT_CONCURRENCY,
+    LLM_ENDPOINT_COOLDOWN,
+    LLM_ENDPOINT_EWMA_ALPHA,
+    LLM_ENDPOINT_MAX_FAILURES,
+    LLM_ENDPOINT_PROBE_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+
+class Endpoint:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: str,
+        max_concurrency: int = LLM_ENDPOINT_CONCURRENCY,
+        model: str = "",
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        # Serves this model whatever was requested; empty passes it through
+        self.model = model
+        self.in_flight = 0
+        self.latency = 1.0
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.strikes = 0  # 429s in a row, to grow the cooldown
+        self.healthy = True
+
+    @property
+    def models_url(self) -> str:
+        return self.url.rsplit("/chat/completions", 1)[0] + "/models"
+
+    def available(self, now: float) -> bool:
+        return (
+            self.healthy
+            and now >= self.cooldown_until
+            and self.in_flight < self.max_concurrency
+        )
+
+    def weight(self) -> float:
+        return (1 - self.error_rate) / (self.latency * (1 + self.in_flight))
+
+    def succeeded(self, elapsed: float) -> None:
+        self.latency += LLM_ENDPOINT_EWMA_ALPHA * (elapsed - self.latency)
+        self.error_rate -= LLM_ENDPOINT_EWMA_ALPHA * self.error_rate
+        self.failures = 0
+        self.strikes = 0
+
+    def failed(self) -> None:
+        metrics.inc("llm_endpoint_errors")
+        self.error_rate += LLM_ENDPOINT_EWMA_ALPHA * (1 - self.error_rate)
+        self.failures += 1
+        if self.healthy and self.failures >= LLM_ENDPOINT_MAX_FAILURES:
+            self.healthy = False
+            logger.warning("LLM endpoint %s is down after %d failures", self.name, self.failures)
+
+    def rate_limited(self, retry_after: float | None) -> None:
+        metrics.inc("llm_endpoint_rate_limited")
+        self.strikes += 1
+        delay = retry_after or LLM_ENDPOINT_COOLDOWN * 2 ** min(self.strikes - 1, 4)
+        self.cooldown_until = time.monotonic() + delay
+        logger.warning("LLM endpoint %s rate limited, cooling down for %.0fs", self.name, delay)
+
+
+def _parse_endpoints() -> list[Endpoint]:
+    endpoints = [Endpoint("openrouter", OPENROUTER_URL, settings.openrouter_api_key)]
+    for i, key in enumerate(k.strip() for k in settings.extra_api_keys.split(",")):
+        if key:
+            endpoints.append(Endpoint(f"openrouter-{i + 2}", OPENROUTER_URL, key))
+    for entry in settings.llm_endpoints.split(","):
+        parts = [p.strip() for p in entry.split("|")]
+        if not parts[0]:
+            continue
+        url, api_key, concurrency, model = (parts + ["", "", ""])[:4]
+        endpoints.append(Endpoint(
+            url,
+            url,
+            api_key,
+            int(concurrency) if concurrency else LLM_ENDPOINT_CONCURRENCY,
+            model,
+        ))
+    return endpoints
+
+
+class EndpointPool:
+    def __init__(self, endpoints: list[Endpoint]) -> None:
+        self.endpoints = endpoints
+        self._changed = asyncio.Condition()
+        self._prober: asyncio.Task | None = None
+
+    def _pick(self) -> Endpoint | None:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.available(now)]
+        if not any(e.healthy for e in self.endpoints):
+            # Everything is down: keep trying rather than stall every turn
+            candidates = [
+                e for e in self.endpoints
+                if now >= e.cooldown_until and e.in_flight < e.max_concurrency
+            ]
+        if not candidates:
+            return None
+        return random.choices(candidates, [e.weight() for e in candidates])[0]
+
+    def _wait_time(self) -> float:
+        # Until the earliest cooldown ends, or a probe may have revived one
+        now = time.monotonic()
+        cooling = [
+            e.cooldown_until - now
+            for e in self.endpoints
+            if e.cooldown_until > now
+        ]
+        return min(cooling, default=LLM_ENDPOINT_PROBE_INTERVAL)
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Endpoint]:
+        """Hold a slot on the best available endpoint, waiting for one if
+        all are busy, cooling down or down.
+        """
+        if self._prober is None or self._prober.done():
+            self._prober = asyncio.create_task(self._probe_loop())
+        async with self._changed:
+            while (endpoint := self._pick()) is None:
+                metrics.inc("llm_endpoint_waits")
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self._wait_time())
+                except asyncio.TimeoutError:
+                    pass
+            endpoint.in_flight += 1
+        try:
+            yield endpoint
+        finally:
+            endpoint.in_flight -= 1
+            await self._notify()
+
+    async def _probe(self, session: aiohttp.ClientSession, endpoint: Endpoint) -> None:
+        headers = {"Authorization": f"Bearer {endpoint.api_key}"} if endpoint.api_key else {}
+        try:
+            async with session.get(
+                endpoint.models_url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)
+            ) as resp:
+                ok = resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            ok = False
+        if ok:
+            endpoint.healthy = True
+            endpoint.failures = 0
+            logger.info("LLM endpoint %s is back", endpoint.name)
+            await self._notify()
+
+    async def _probe_loop(self) -> None:
+        async with aiohttp.ClientSession() as session:
+            while True:
+                await asyncio.sleep(LLM_ENDPOINT_PROBE_INTERVAL)
+                for endpoint in self.endpoints:
+                    if not endpoint.healthy:
+                        await self._probe(session, endpoint)
+
+    async def close(self) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+
+
+_pool: EndpointPool | None = None
+
+
+def get_pool() -> EndpointPool:
+    global _pool
+    if _pool is None:
+        _pool = EndpointPool(_parse_endpoints())
+        metrics.register_gauge(
+            "llm_endpoints_healthy", lambda: sum(e.healthy for e in _pool.endpoints)
+        )
+    return _pool
+
+
+async def close_pool() -> None:
+    if _pool is not None:
+        await _pool.close()
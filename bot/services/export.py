@@ -0,0 +1,225 @@
+import asyncio
+import csv
+import gzip
+import html
+import io
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, TextIO
+
+import aiosqlite
+from aiogram import Bot
+from aiogram.types import FSInputFile
+
+from bot.config import settings
+from bot.db.engine import get_db
+from bot.db.repositories.archive import iter_archived_messages
+from bot.db.repositories.conversation import iter_messages
+from bot.db.repositories.mood import iter_entries
+from bot.services import outbox
+from bot.utils.constants import (
+    EXPORT_FLUSH_BYTES,
+    EXPORT_KEEP_FILES,
+    TELEGRAM_MAX_DOCUMENT_BYTES,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv")
+
+_CSV_FIELDS = (
+    "type", "user_id", "id", "role", "content", "score", "note",
+    "tokens_est", "created_at", "local_at",
+)
+
+_running: dict[int, asyncio.Task] = {}
+
+
+def parse_export_args(text: str) -> tuple[str, bool] | None:
+    """'/export csv gz' -> ('csv', True). Returns None on unknown options."""
+    fmt, compress = "jsonl", False
+    for arg in text.split()[1:]:
+        arg = arg.lower()
+        if arg in FORMATS:
+            fmt = arg
+        elif arg in ("gz", "gzip"):
+            compress = True
+        else:
+            return None
+    return fmt, compress
+
+
+def export_dir() -> str:
+    return os.path.join(os.path.dirname(settings.db_path) or ".", "exports")
+
+
+async def iter_user_records(db: aiosqlite.Connection, user_id: int) -> AsyncIterator[dict]:
+    """Everything we store about a user, oldest first: archived messages,
+    live messages, then mood entries.
+    """
+    async for m in iter_archived_messages(db, user_id):
+        yield {"type": "message", "user_id": user_id, **m}
+    async for m in iter_messages(db, user_id):
+        yield {"type": "message", "user_id": user_id, **m}
+    async for e in iter_entries(db, user_id):
+        yield {"type": "mood", "user_id": user_id, **e}
+
+
+class _ExportWriter:
+    """Buffers encoded records and hands full chunks to a thread for writing,
+    so memory stays bounded and the event loop never blocks on disk or gzip.
+    """
+
+    def __init__(self, path: str, fmt: str, compress: bool) -> None:
+        self._fmt = fmt
+        self._fh: TextIO = (
+            gzip.open(path, "wt", encoding="utf-8", newline="")
+            if compress
+            else open(path, "w", encoding="utf-8", newline="")
+        )
+        self._buffer = io.StringIO()
+        self._csv = csv.DictWriter(
+            self._buffer, fieldnames=_CSV_FIELDS, extrasaction="ignore"
+        )
+        if fmt == "csv":
+            self._csv.writeheader()
+
+    async def write(self, record: dict) -> None:
+        if self._fmt == "csv":
+            self._csv.writerow(record)
+        else:
+            self._buffer.write(json.dumps(record, ensure_ascii=False))
+            self._buffer.write("\n")
+        if self._buffer.tell() >= EXPORT_FLUSH_BYTES:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if chunk:
+            await asyncio.to_thread(self._fh.write, chunk)
+
+    async def close(self) -> None:
+        try:
+            await self._flush()
+        finally:
+            await asyncio.to_thread(self._fh.close)
+
+
+async def export_to_file(
+    path: str,
+    user_ids: list[int] | None,
+    fmt: str = "jsonl",
+    compress: bool = False,
+) -> int:
+    """Write records of the given users (or of everyone) to `path`.
+
+    Returns the number of records written.
+    """
+    writer = _ExportWriter(path, fmt, compress)
+    count = 0
+    db = await get_db()
+    try:
+        if user_ids is None:
+            cursor = await db.execute("SELECT user_id FROM users ORDER BY user_id")
+            user_ids = [r[0] for r in await cursor.fetchall()]
+        for user_id in user_ids:
+            async for record in iter_user_records(db, user_id):
+                await writer.write(record)
+                count += 1
+    finally:
+        await db.close()
+        await writer.close()
+    return count
+
+
+def _export_path(name: str, fmt: str, compress: bool) -> str:
+    os.makedirs(export_dir(), exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    suffix = f".{fmt}.gz" if compress else f".{fmt}"
+    return os.path.join(export_dir(), f"freepsy-{name}-{stamp}{suffix}")
+
+
+def _prune_kept_exports() -> None:
+    kept = sorted(
+        entry.path for entry in os.scandir(export_dir())
+        if entry.name.startswith("freepsy-all-")
+    )
+    for path in kept[:-EXPORT_KEEP_FILES]:
+        os.remove(path)
+
+
+async def _run_export(
+    bot: Bot,
+    chat_id: int,
+    name: str,
+    user_ids: list[int] | None,
+    fmt: str,
+    compress: bool,
+) -> None:
+    path = _export_path(name, fmt, compress)
+    keep = False
+    try:
+        count = await export_to_file(path, user_ids, fmt, compress)
+        # A finished bulk export stays on disk until it has reached the admin
+        keep = user_ids is None
+        size = os.path.getsize(path)
+        if size > TELEGRAM_MAX_DOCUMENT_BYTES:
+            if keep:
+                _prune_kept_exports()
+                text = (
+                    f"Выгрузка готова, но больше лимита Telegram "
+                    f"({size // (1024 * 1024)} МБ). Записей: {count}.\n"
+                    f"Файл на сервере: <code>{html.escape(path)}</code>"
+                )
+            else:
+                hint = "" if compress else " Попробуй со сжатием: добавь <code>gz</code> к команде."
+                text = (
+                    f"Выгрузка получилась слишком большой для Telegram "
+                    f"({size // (1024 * 1024)} МБ).{hint}"
+                )
+            await outbox.send(chat_id, lambda: bot.send_message(
+                chat_id, text, parse_mode="HTML",
+            ))
+            return
+        await outbox.send(chat_id, lambda: bot.send_document(
+            chat_id,
+            FSInputFile(path),
+            caption=f"Готово! Записей в выгрузке: {count}.",
+        ))
+        keep = False
+    except Exception:
+        logger.exception("Export %s failed", name)
+        text = "Не удалось подготовить выгрузку. Попробуй позже."
+        if keep:
+            text = f"Не удалось отправить выгрузку. Файл на сервере: {path}"
+        await outbox.send(chat_id, lambda: bot.send_message(chat_id, text))
+    finally:
+        if not keep and os.path.exists(path):
+            os.remove(path)
+
+
+def start_export(
+    bot: Bot,
+    chat_id: int,
+    user_id: int | None,
+    fmt: str = "jsonl",
+    compress: bool = False,
+) -> bool:
+    """Start an export in the background. `user_id=None` exports all users.
+
+    Returns False if an export for the same requester is already running.
+    """
+    task = _running.get(chat_id)
+    if task is not None and not task.done():
+        return False
+
+    name = "all" if user_id is None else str(user_id)
+    user_ids = None if user_id is None else [user_id]
+    task = asyncio.create_task(_run_export(bot, chat_id, name, user_ids, fmt, compress))
+    _running[chat_id] = task
+    task.add_done_callback(lambda t: _running.pop(chat_id, None))
+    return True
@@ -6,12 +6,16 @@ from bot.utils.constants import MAX_HISTORY_TOKENS
 from bot.utils.prompts import SYSTEM_PROMPT
 
 
-async def build_messages(db: aiosqlite.Connection, conversation: list[dict]) -> list[dict]:
+async def build_messages(
+    db: aiosqlite.Connection,
+    conversation: list[dict],
+    budget: int = MAX_HISTORY_TOKENS,
+) -> list[dict]:
     prompt = await get_setting(db, "system_prompt", SYSTEM_PROMPT)
 
     system_msg = {"role": "system", "content": prompt}
     system_tokens = estimate_tokens(prompt)
-    budget = MAX_HISTORY_TOKENS - system_tokens
+    budget -= system_tokens
 
     selected: list[dict] = []
     used = 0
@@ -20,7 +24,11 @@ async def build_messages(db: aiosqlite.Connection, conversation: list[dict]) ->
         t = msg.get("tokens_est") or estimate_tokens(msg["content"])
         if used + t > budget:
             break
-        selected.append({"role": msg["role"], "content": msg["content"]})
+        entry = {"role": msg["role"], "content": msg["content"]}
+        if "id" in msg:
+            # Lets the LLM client reuse this message's encoded JSON
+            entry["id"] = msg["id"]
+        selected.append(entry)
         used += t
 
     selected.reverse()
@@ -0,0 +1,139 @@
+"""Process state and graceful shutdown.
+
+SIGTERM or SIGINT moves the process from serving to draining: polling stops,
+background jobs take no new work, and what is already in progress — updates
+being handled (a turn waiting on the LLM included), resumed reply jobs,
+reminder batches and the outbox — gets SHUTDOWN_TIMEOUT seconds to finish.
+Then buffered writes are flushed, the WAL is checkpointed and the process
+exits. A second signal exits at once.
+
+The state is the `lifecycle_state` gauge: 0 starting, 1 serving,
+2 draining, 3 stopped.
+"""
+import asyncio
+import logging
+import signal
+import time
+
+from aiogram import Bot
+
+from bot.db.engine import checkpoint
+from bot.middlewares.dedup import update_dedup
+from bot.services import metrics, outbox, quota
+from bot.services.llm import close_session
+from bot.services.typing_indicator import typing_indicator
+from bot.utils.constants import DRAIN_LOG_INTERVAL, DRAIN_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+STARTING, SERVING, DRAINING, STOPPED = range(4)
+_STATE_NAMES = ("starting", "serving", "draining", "stopped")
+
+_state = STARTING
+_drain_started = 0.0
+_stop = asyncio.Event()
+_main_task: asyncio.Task | None = None
+# Tasks a shutdown waits for
+_work: set[asyncio.Task] = set()
+
+metrics.register_gauge("lifecycle_state", lambda: _state)
+metrics.register_gauge("lifecycle_tracked_tasks", lambda: len(_work))
+
+
+def set_state(state: int) -> None:
+    global _state, _drain_started
+    if state == DRAINING and _state < DRAINING:
+        _drain_started = time.monotonic()
+    _state = state
+    logger.info("Process is %s", _STATE_NAMES[state])
+
+
+def draining() -> bool:
+    return _state >= DRAINING
+
+
+def track(task: asyncio.Task | None = None) -> None:
+    """Make a shutdown wait for `task`, by default the current one."""
+    task = task or asyncio.current_task()
+    _work.add(task)
+    task.add_done_callback(_work.discard)
+
+
+def _on_signal(sig: signal.Signals) -> None:
+    if not _stop.is_set():
+        logger.info("Received %s, stopping", sig.name)
+        _stop.set()
+    elif _main_task is not None:
+        logger.warning("Received %s again, exiting without waiting", sig.name)
+        _main_task.cancel()
+
+
+def install_signal_handlers() -> None:
+    """Route SIGTERM and SIGINT to a graceful stop of the current task."""
+    global _main_task
+    _main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, _on_signal, sig)
+
+
+async def serve(task: asyncio.Task) -> None:
+    """Wait until a stop signal or until `task` ends; its errors propagate."""
+    stop = asyncio.create_task(_stop.wait())
+    try:
+        await asyncio.wait({task, stop}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop.cancel()
+    if task.done():
+        task.result()
+
+
+async def drain(timeout: float) -> bool:
+    """Wait for tracked work and the outbox, up to `timeout` seconds since
+    draining began. Returns False if something was still pending.
+    """
+    if not draining():
+        set_state(DRAINING)
+    deadline = _drain_started + timeout
+    next_log = 0.0
+    while _work or outbox.depth():
+        now = time.monotonic()
+        if now >= deadline:
+            logger.warning(
+                "Drain deadline reached: %d tasks in flight, %d messages queued",
+                len(_work), outbox.depth(),
+            )
+            return False
+        if now >= next_log:
+            logger.info(
+                "Draining: %d tasks in flight, %d messages queued",
+                len(_work), outbox.depth(),
+            )
+            next_log = now + DRAIN_LOG_INTERVAL
+        await asyncio.sleep(DRAIN_POLL_INTERVAL)
+    logger.info("Drained in %.1fs", time.monotonic() - _drain_started)
+    return True
+
+
+async def close(bot: Bot, checkpoint_wal: bool = True) -> None:
+    """Flush buffered writes and release connections of a drained process.
+
+    Every step runs even if an earlier one fails.
+    """
+    steps = [
+        ("typing indicator", typing_indicator.close),
+        ("update dedup", update_dedup.flush),
+        ("token quotas", quota.flush),
+    ]
+    if checkpoint_wal:
+        steps.append(("WAL checkpoint", checkpoint))
+    steps += [
+        ("LLM session", close_session),
+        ("bot session", bot.session.close),
+    ]
+    for name, step in steps:
+        try:
+            await step()
+        except Exception:
+            logger.exception("Shutdown step failed: %s", name)
+    set_state(STOPPED)
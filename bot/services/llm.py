@@ -7,14 +7,23 @@ import logging
 import aiohttp
 
 from bot.config import settings
-from bot.utils.constants import LLM_TIMEOUT
+from bot.services import metrics
+from bot.services.endpoints import OPENROUTER_URL, close_pool, get_pool
+from bot.services.payload import encode_request
+from bot.utils.constants import (
+    HTTP_DNS_TTL,
+    HTTP_IDLE_PING_INTERVAL,
+    HTTP_KEEPALIVE,
+    HTTP_POOL_PER_HOST,
+    HTTP_POOL_SIZE,
+    HTTP_WARM_CONNECTIONS,
+    LLM_TIMEOUT,
+)
 
 logger = logging.getLogger(__name__)
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models"
 MAX_RETRIES = 3
-RETRY_DELAYS = [2, 5, 10]
 _MODELS_CACHE_TTL = 600  # 10 minutes
 
 _think_pattern = re.compile(r"<think>.*?</think>", re.DOTALL)
@@ -23,17 +32,95 @@ _cache_ts: float = 0
 _models_lock = asyncio.Lock()
 
 _session: aiohttp.ClientSession | None = None
+_http = {"in_flight": 0, "created": 0, "reused": 0}
+_last_request = 0.0
+
+
+async def _on_request_start(session, context, params) -> None:
+    _http["in_flight"] += 1
+
+
+async def _on_request_done(session, context, params) -> None:
+    global _last_request
+    _http["in_flight"] -= 1
+    _last_request = time.monotonic()
+
+
+async def _on_connection_created(session, context, params) -> None:
+    _http["created"] += 1
+
+
+async def _on_connection_reused(session, context, params) -> None:
+    _http["reused"] += 1
+
+
+async def _on_connection_queued(session, context, params) -> None:
+    # Every connection of the pool (or of the host) is busy
+    metrics.inc("http_pool_waits")
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_request_end.append(_on_request_done)
+    trace.on_request_exception.append(_on_request_done)
+    trace.on_connection_create_end.append(_on_connection_created)
+    trace.on_connection_reuseconn.append(_on_connection_reused)
+    trace.on_connection_queued_start.append(_on_connection_queued)
+    return trace
+
+
+metrics.register_gauge("http_requests_in_flight", lambda: _http["in_flight"])
+metrics.register_gauge("http_pool_usage", lambda: round(_http["in_flight"] / HTTP_POOL_SIZE, 2))
+metrics.register_gauge("http_connections_created", lambda: _http["created"])
+metrics.register_gauge(
+    "http_connection_reuse_ratio",
+    lambda: round(_http["reused"] / max(1, _http["reused"] + _http["created"]), 3),
+)
 
 
 def _get_session() -> aiohttp.ClientSession:
     global _session
     if _session is None or _session.closed:
-        _session = aiohttp.ClientSession()
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE,
+        )
+        _session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()])
     return _session
 
 
+async def warm_up(connections: int = HTTP_WARM_CONNECTIONS) -> None:
+    """Open connections to every LLM host ahead of the first real request,
+    so it does not pay for DNS and the TLS handshake.
+    """
+    urls = {e.models_url.split("/", 3)[2]: e.models_url for e in get_pool().endpoints}
+    session = _get_session()
+
+    async def touch(url: str) -> None:
+        try:
+            async with session.head(url, timeout=aiohttp.ClientTimeout(total=10)):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Failed to warm up connection to %s: %s", url, e)
+
+    await asyncio.gather(*(touch(url) for url in urls.values() for _ in range(connections)))
+
+
+async def keepalive_loop() -> None:
+    """Warm up at startup, then keep a connection per host open while idle."""
+    await warm_up()
+    while True:
+        await asyncio.sleep(HTTP_IDLE_PING_INTERVAL)
+        if time.monotonic() - _last_request >= HTTP_IDLE_PING_INTERVAL:
+            await warm_up(connections=1)
+
+
 async def close_session() -> None:
     global _session
+    await close_pool()
     if _session is not None and not _session.closed:
         await _session.close()
         _session = None
@@ -117,8 +204,8 @@ async def validate_model(model: str) -> str | None:
         ) as resp:
             if resp.status == 200:
                 return None
-            body = await resp.text()
-            logger.warning("Model validation failed for %s: %s %s", model, resp.status, body)
+            text = await resp.text()
+            logger.warning("Model validation failed for %s: %s %s", model, resp.status, text)
             return f"Модель <code>{model}</code> вернула ошибку {resp.status}. Возможно, она не поддерживает system-промпты."
     except Exception as e:
         logger.warning("Model validation error for %s: %s", model, e)
@@ -128,57 +215,76 @@ async def validate_model(model: str) -> str | None:
 async def chat_completion(
     messages: list[dict],
     model: str,
+    user_id: int | None = None,
 ) -> str:
-    headers = {
-        "Authorization": f"Bearer {settings.openrouter_api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": model,
-        "messages": messages,
-        "include_reasoning": False,
-    }
-
+    """Ask the model for a reply. Pass `user_id` with history messages that
+    carry their "id" to reuse their encoded JSON between turns.
+    """
     timeout = aiohttp.ClientTimeout(total=LLM_TIMEOUT)
     data: dict | None = None
 
     for attempt in range(MAX_RETRIES):
-        try:
-            session = _get_session()
-            async with session.post(
-                OPENROUTER_URL, json=payload, headers=headers, timeout=timeout
-            ) as resp:
-                if resp.status == 429:
-                    body = await resp.text()
-                    logger.warning(
-                        "Rate limited (attempt %d/%d): %s",
-                        attempt + 1, MAX_RETRIES, body,
-                    )
-                    if attempt < MAX_RETRIES - 1:
-                        await asyncio.sleep(RETRY_DELAYS[attempt])
+        async with get_pool().acquire() as endpoint:
+            headers = {"Content-Type": "application/json"}
+            if endpoint.api_key:
+                headers["Authorization"] = f"Bearer {endpoint.api_key}"
+            body = await encode_request(
+                endpoint.model or model, messages, user_id, include_reasoning=False
+            )
+            started = time.monotonic()
+            try:
+                session = _get_session()
+                async with session.post(
+                    endpoint.url, data=body, headers=headers, timeout=timeout
+                ) as resp:
+                    if resp.status == 429:
+                        text = await resp.text()
+                        logger.warning(
+                            "Rate limited by %s (attempt %d/%d): %s",
+                            endpoint.name, attempt + 1, MAX_RETRIES, text,
+                        )
+                        retry_after = resp.headers.get("Retry-After", "")
+                        endpoint.rate_limited(
+                            float(retry_after) if retry_after.isdigit() else None
+                        )
+                        if attempt < MAX_RETRIES - 1:
+                            continue
+                        return "Извини, AI-сервис временно перегружен. Попробуй через минуту."
+
+                    if resp.status >= 500 and attempt < MAX_RETRIES - 1:
+                        logger.warning("LLM endpoint %s returned %s", endpoint.name, resp.status)
+                        endpoint.failed()
                         continue
-                    return "Извини, AI-сервис временно перегружен. Попробуй через минуту."
 
-                if resp.status != 200:
-                    body = await resp.text()
-                    logger.error("OpenRouter error %s: %s", resp.status, body)
-                    return "Извини, произошла ошибка при обращении к AI. Попробуй ещё раз чуть позже."
-
-                try:
-                    data = await resp.json()
-                except (ValueError, aiohttp.ContentTypeError) as e:
-                    body = await resp.text()
-                    logger.error("Invalid JSON from OpenRouter: %s — %s", e, body[:500])
-                    return "Извини, получен некорректный ответ от AI. Попробуй ещё раз."
-        except asyncio.TimeoutError:
-            logger.warning("LLM timeout (attempt %d/%d)", attempt + 1, MAX_RETRIES)
-            if attempt < MAX_RETRIES - 1:
-                continue
-            return "Извини, AI долго думает и не успел ответить. Попробуй ещё раз."
-        except aiohttp.ClientError as e:
-            logger.error("HTTP error: %s", e)
-            return "Извини, ошибка соединения с AI. Попробуй ещё раз."
-        else:
+                    if resp.status != 200:
+                        text = await resp.text()
+                        logger.error("LLM error %s from %s: %s", resp.status, endpoint.name, text)
+                        if resp.status >= 500:
+                            endpoint.failed()
+                        return "Извини, произошла ошибка при обращении к AI. Попробуй ещё раз чуть позже."
+
+                    try:
+                        data = await resp.json()
+                    except (ValueError, aiohttp.ContentTypeError) as e:
+                        text = await resp.text()
+                        logger.error("Invalid JSON from %s: %s — %s", endpoint.name, e, text[:500])
+                        endpoint.failed()
+                        return "Извини, получен некорректный ответ от AI. Попробуй ещё раз."
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "LLM timeout on %s (attempt %d/%d)", endpoint.name, attempt + 1, MAX_RETRIES
+                )
+                endpoint.failed()
+                if attempt < MAX_RETRIES - 1:
+                    continue
+                return "Извини, AI долго думает и не успел ответить. Попробуй ещё раз."
+            except aiohttp.ClientError as e:
+                logger.error("HTTP error on %s: %s", endpoint.name, e)
+                endpoint.failed()
+                if attempt < MAX_RETRIES - 1:
+                    continue
+                return "Извини, ошибка соединения с AI. Попробуй ещё раз."
+            endpoint.succeeded(time.monotonic() - started)
             break
 
     if data is None:
@@ -0,0 +1,99 @@
+"""Load shedding for LLM calls.
+
+Watches the number of LLM calls in flight, how long turns wait before their
+LLM call starts, and how long the calls take. When any of them crosses its
+threshold the bot switches into shedding mode: ordinary turns get a smaller
+history budget and the fallback model. It switches back once every signal
+is below LOAD_RECOVER_RATIO of its threshold for LOAD_COOLDOWN seconds.
+Crisis turns are never shed.
+"""
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from bot.config import settings
+from bot.services import metrics
+from bot.utils.constants import (
+    LOAD_BUDGET_FACTOR,
+    LOAD_COOLDOWN,
+    LOAD_EWMA_ALPHA,
+    LOAD_RECOVER_RATIO,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LoadController:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.latency = 0.0
+        self.queue_wait = 0.0
+        self.shedding = False
+        self._calm_since: float | None = None
+
+    def _pressure(self) -> tuple[float, ...]:
+        """Each signal as a share of its threshold; a threshold of 0
+        turns its signal off.
+        """
+        signals = (
+            (self.in_flight, settings.load_max_in_flight),
+            (self.latency, settings.load_max_latency),
+            (self.queue_wait, settings.load_max_queue_wait),
+        )
+        return tuple(value / limit for value, limit in signals if limit > 0)
+
+    def _update(self) -> None:
+        pressure = max(self._pressure(), default=0.0)
+        now = time.monotonic()
+        if not self.shedding:
+            if pressure >= 1:
+                self.shedding = True
+                self._calm_since = None
+                metrics.inc("load_state_changes")
+                logger.warning(
+                    "LLM load shedding on (in flight %d, latency %.1fs, queue wait %.1fs)",
+                    self.in_flight, self.latency, self.queue_wait,
+                )
+            return
+        if pressure >= LOAD_RECOVER_RATIO:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= LOAD_COOLDOWN:
+            self.shedding = False
+            metrics.inc("load_state_changes")
+            logger.info("LLM load shedding off")
+
+    def observe_queue_wait(self, seconds: float) -> None:
+        self.queue_wait += LOAD_EWMA_ALPHA * (seconds - self.queue_wait)
+        self._update()
+
+    @asynccontextmanager
+    async def llm_call(self) -> AsyncIterator[None]:
+        """Wrap an LLM call to count it in flight and measure its latency."""
+        self.in_flight += 1
+        self._update()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            elapsed = time.monotonic() - started
+            self.latency += LOAD_EWMA_ALPHA * (elapsed - self.latency)
+            self._update()
+
+    def adjust(self, budget: int, model: str, crisis: bool = False) -> tuple[int, str]:
+        """History budget and model for the next ordinary turn."""
+        self._update()
+        if not self.shedding or crisis:
+            return budget, model
+        metrics.inc("load_shed_turns")
+        return int(budget * LOAD_BUDGET_FACTOR), settings.fallback_model or model
+
+
+load = LoadController()
+metrics.register_gauge("load_shedding", lambda: int(load.shedding))
+metrics.register_gauge("llm_in_flight", lambda: load.in_flight)
+metrics.register_gauge("llm_latency_ewma", lambda: round(load.latency, 2))
+metrics.register_gauge("llm_queue_wait_ewma", lambda: round(load.queue_wait, 2))
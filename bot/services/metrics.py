@@ -0,0 +1,29 @@
+from typing import Callable
+
+_counters: dict[str, int] = {}
+_gauges: dict[str, Callable[[], float]] = {}
+
+
+def inc(name: str, value: int = 1) -> None:
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = lambda: value
+
+
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    """Gauge whose value is read lazily, when a snapshot is taken."""
+    _gauges[name] = read
+
+
+def snapshot() -> dict[str, float]:
+    values: dict[str, float] = dict(_counters)
+    for name, read in _gauges.items():
+        values[name] = read()
+    return dict(sorted(values.items()))
+
+
+def render() -> str:
+    lines = [f"{name} {value:g}" for name, value in snapshot().items()]
+    return "\n".join(lines) or "(пусто)"
@@ -1,35 +1,130 @@
 import html
+import math
+from datetime import date, timedelta
 
+_PERIOD_TITLES = {
+    "week": "По неделям",
+    "month": "По месяцам",
+}
 
-def weekly_summary(entries: list[dict]) -> str:
+
+def weekly_summary(entries: list[dict], daily: list[dict]) -> str:
     if not entries:
         return "За последнюю неделю нет записей настроения. Используй /mood чтобы начать."
 
-    scores = [e["score"] for e in entries]
-    avg = sum(scores) / len(scores)
-    trend = _compute_trend(scores)
+    count, avg, _ = _combine(daily)
+    trend = _trend_label(trend_fit(daily), 7)
 
     lines = [f"📓 <b>Дневник настроения за неделю</b> ({len(entries)} записей)\n"]
-    lines.append(f"Средняя оценка: <b>{avg:.1f}</b> / 10")
+    if count:
+        lines.append(f"Средняя оценка: <b>{avg:.1f}</b> / 10")
     lines.append(f"Тренд: {trend}\n")
 
     for e in entries:
-        date = e["created_at"][:16].replace("T", " ") if e["created_at"] else "?"
+        date_str = e["local_at"][:16] if e["local_at"] else "?"
         bar = _score_bar(e["score"])
         note_part = f' — <i>{html.escape(e["note"])}</i>' if e.get("note") else ""
-        lines.append(f"<code>{date}</code> {bar} {e['score']}/10{note_part}")
+        lines.append(f"<code>{date_str}</code> {bar} {e['score']}/10{note_part}")
+
+    return "\n".join(lines)
+
+
+def long_range_summary(
+    daily: list[dict],
+    periods: list[dict],
+    days: int,
+    period: str = "week",
+) -> str:
+    """Summary for 30/90/365-day views, built only from rollups."""
+    count, avg, _ = _combine(daily)
+    if not count:
+        return (
+            f"За последние {days} дней нет записей настроения. "
+            "Используй /mood чтобы начать."
+        )
+
+    slope = trend_fit(daily)
+    moving = moving_average(daily)
+
+    lines = [
+        f"📓 <b>Дневник настроения за {days} дней</b> "
+        f"({count} записей, дней с отметками: {len(daily)})\n"
+    ]
+    lines.append(f"Средняя оценка: <b>{avg:.1f}</b> / 10")
+    if moving:
+        lines.append(f"Скользящее среднее (7 дн.): <b>{moving[-1][1]:.1f}</b>")
+    lines.append(f"Разброс: ±{volatility(daily):.1f}")
+    trend = _trend_label(slope, days)
+    if slope is not None:
+        trend += f" ({slope * 7:+.2f} в неделю)"
+    lines.append(f"Тренд: {trend}\n")
+
+    lines.append(f"<b>{_PERIOD_TITLES[period]}:</b>")
+    for p in periods:
+        p_avg = p["score_sum"] / p["entries"]
+        bar = _score_bar(round(p_avg))
+        lines.append(f"<code>{p['period']}</code> {bar} {p_avg:.1f} ({p['entries']})")
 
     return "\n".join(lines)
 
 
-def _compute_trend(scores: list[int]) -> str:
-    if len(scores) < 2:
+def moving_average(daily: list[dict], window: int = 7) -> list[tuple[str, float]]:
+    """Entry-weighted moving average over the trailing `window` calendar days."""
+    result: list[tuple[str, float]] = []
+    start = 0
+    entries = 0
+    total = 0
+    parsed = [date.fromisoformat(d["day"]) for d in daily]
+    for i, d in enumerate(daily):
+        entries += d["entries"]
+        total += d["score_sum"]
+        while parsed[start] <= parsed[i] - timedelta(days=window):
+            entries -= daily[start]["entries"]
+            total -= daily[start]["score_sum"]
+            start += 1
+        result.append((d["day"], total / entries))
+    return result
+
+
+def volatility(daily: list[dict]) -> float | None:
+    """Standard deviation of all scores, computed from sums and sums of squares."""
+    count, _, std = _combine(daily)
+    return std if count else None
+
+
+def trend_fit(daily: list[dict]) -> float | None:
+    """Least-squares slope of score over time, in points per day.
+
+    Equivalent to fitting every raw entry, with each entry placed on its day.
+    """
+    count = sum(d["entries"] for d in daily)
+    if not count:
+        return None
+    xs = [date.fromisoformat(d["day"]).toordinal() for d in daily]
+    x_mean = sum(x * d["entries"] for x, d in zip(xs, daily)) / count
+    sxx = sum(d["entries"] * (x - x_mean) ** 2 for x, d in zip(xs, daily))
+    if sxx == 0:
+        return None
+    sxy = sum((x - x_mean) * d["score_sum"] for x, d in zip(xs, daily))
+    return sxy / sxx
+
+
+def _combine(rows: list[dict]) -> tuple[int, float, float]:
+    """Merge rollup rows into (count, mean, standard deviation)."""
+    count = sum(r["entries"] for r in rows)
+    if not count:
+        return 0, 0.0, 0.0
+    total = sum(r["score_sum"] for r in rows)
+    total_sq = sum(r["score_sq_sum"] for r in rows)
+    mean = total / count
+    variance = max(0.0, total_sq / count - mean * mean)
+    return count, mean, math.sqrt(variance)
+
+
+def _trend_label(slope: float | None, span_days: int) -> str:
+    if slope is None:
         return "недостаточно данных"
-    first_half = scores[: len(scores) // 2]
-    second_half = scores[len(scores) // 2 :]
-    avg1 = sum(first_half) / len(first_half)
-    avg2 = sum(second_half) / len(second_half)
-    diff = avg2 - avg1
+    diff = slope * max(1, span_days - 1)
     if diff > 0.5:
         return "📈 улучшение"
     elif diff < -0.5:
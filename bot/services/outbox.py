@@ -0,0 +1,166 @@
+"""Outbound Telegram message queue with per-chat and global flood control.
+
+Every send goes through a per-chat FIFO served by its own short-lived worker,
+so chunks of one reply can never overtake each other. Before each call the
+worker reserves a token from the chat's bucket and from the global bucket;
+`TelegramRetryAfter` pauses only the affected chat and retries the same item.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from bot.services import metrics
+from bot.utils.constants import (
+    OUTBOX_CHAT_BURST,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_GLOBAL_BURST,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_BUCKET_EVICTION_AGE = 60
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "last_refill")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token, possibly on credit. Returns seconds to wait before use."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class Outbox:
+    def __init__(self) -> None:
+        self._queues: dict[int, deque[tuple[Callable[[], Awaitable[Any]], asyncio.Future]]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._chat_buckets: dict[int, _TokenBucket] = {}
+        self._global = _TokenBucket(OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_BURST)
+
+    def set_global_share(self, share: float) -> None:
+        """Use only `share` of the bot-wide rate, e.g. when several processes
+        send on behalf of the same bot token.
+        """
+        self._global = _TokenBucket(
+            OUTBOX_GLOBAL_RATE * share, max(1.0, OUTBOX_GLOBAL_BURST * share)
+        )
+
+    def depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Queue a Bot API call for `chat_id` and wait for its result.
+
+        `call` must create a new request each time it is invoked — it may be
+        retried after a flood-control pause.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append((call, future))
+        if chat_id not in self._workers:
+            self._evict_stale_buckets()
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return await future
+
+    def _evict_stale_buckets(self) -> None:
+        now = time.monotonic()
+        stale = [
+            chat_id for chat_id, b in self._chat_buckets.items()
+            if chat_id not in self._workers and now - b.last_refill > _BUCKET_EVICTION_AGE
+        ]
+        for chat_id in stale:
+            del self._chat_buckets[chat_id]
+
+    async def _drain(self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        bucket = self._chat_buckets.setdefault(
+            chat_id, _TokenBucket(OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST)
+        )
+        attempts = 0
+        try:
+            while queue:
+                call, future = queue[0]
+                if future.done():
+                    # Caller gave up before we got to it
+                    queue.popleft()
+                    continue
+
+                await asyncio.sleep(bucket.reserve())
+                await asyncio.sleep(self._global.reserve())
+                try:
+                    result = await call()
+                except TelegramRetryAfter as e:
+                    attempts += 1
+                    metrics.inc("outbox_retry_after")
+                    logger.warning(
+                        "Flood control for chat %s: retry in %ss (attempt %d/%d)",
+                        chat_id, e.retry_after, attempts, OUTBOX_MAX_RETRIES,
+                    )
+                    if attempts <= OUTBOX_MAX_RETRIES:
+                        bucket.pause(e.retry_after)
+                        continue
+                    if not future.done():
+                        future.set_exception(e)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    metrics.inc("outbox_sent")
+                    if not future.done():
+                        future.set_result(result)
+                queue.popleft()
+                attempts = 0
+        finally:
+            # Fail whatever is left if the worker itself is cancelled
+            for _, future in queue:
+                if not future.done():
+                    future.cancel()
+            self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+
+
+_outbox = Outbox()
+metrics.register_gauge("outbox_queue_depth", _outbox.depth)
+metrics.register_gauge("outbox_active_chats", lambda: len(_outbox._workers))
+
+
+async def send(chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+    return await _outbox.send(chat_id, call)
+
+
+async def answer(message: Message, text: str, **kwargs: Any) -> Message:
+    return await _outbox.send(message.chat.id, lambda: message.answer(text, **kwargs))
+
+
+async def edit_text(message: Message, text: str, **kwargs: Any) -> Message | bool:
+    return await _outbox.send(message.chat.id, lambda: message.edit_text(text, **kwargs))
+
+
+def depth() -> int:
+    return _outbox.depth()
+
+
+def set_global_share(share: float) -> None:
+    _outbox.set_global_share(share)
@@ -0,0 +1,70 @@
+"""JSON request bodies for chat completions, encoded incrementally.
+
+History messages never change once stored (ids come from AUTOINCREMENT), so
+each one is encoded once and the bytes are kept per user. A turn then only
+encodes the messages that are new since the previous one and splices the
+cached fragments together. orjson is used when installed; big encodes run in
+a thread so they do not stall the event loop.
+"""
+import asyncio
+import json
+from collections import OrderedDict
+
+from bot.services import metrics
+from bot.utils.constants import PAYLOAD_CACHE_USERS, PAYLOAD_THREAD_THRESHOLD
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _fragment(message: dict) -> bytes:
+    # Only the fields the API expects; "id" is just our cache key
+    return dumps({"role": message["role"], "content": message["content"]})
+
+
+# user_id -> {message id -> encoded message}, least recently used first
+_cache: OrderedDict[int, dict[int, bytes]] = OrderedDict()
+
+
+def _encode_all(messages: list[dict], cached: dict[int, bytes]) -> list[bytes]:
+    return [cached.get(m.get("id")) or _fragment(m) for m in messages]
+
+
+async def encode_request(
+    model: str,
+    messages: list[dict],
+    user_id: int | None = None,
+    **options,
+) -> bytes:
+    """Encode a chat completion request body.
+
+    With `user_id`, fragments of messages carrying an "id" are reused from
+    and saved to that user's cache.
+    """
+    cached = _cache.get(user_id, {}) if user_id is not None else {}
+    missing = sum(len(m["content"]) for m in messages if m.get("id") not in cached)
+    if missing >= PAYLOAD_THREAD_THRESHOLD:
+        parts = await asyncio.to_thread(_encode_all, messages, cached)
+    else:
+        parts = _encode_all(messages, cached)
+
+    if user_id is not None:
+        # Replaced rather than updated: messages that left the window go with
+        # the old dict, and a thread may still be reading it
+        fragments = {m["id"]: part for m, part in zip(messages, parts) if "id" in m}
+        metrics.inc("payload_fragments_reused", sum(1 for i in fragments if i in cached))
+        _cache[user_id] = fragments
+        _cache.move_to_end(user_id)
+        while len(_cache) > PAYLOAD_CACHE_USERS:
+            _cache.popitem(last=False)
+
+    head = dumps({"model": model, **options})[:-1]
+    return head + b',"messages":[' + b",".join(parts) + b"]}"
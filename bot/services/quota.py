@@ -0,0 +1,233 @@
+"""Hourly and daily LLM token quotas, per user and global.
+
+Per-user usage lives in memory as one-minute slots over the last 24 hours,
+so checks never touch the database. Increments are written to `token_usage`
+every QUOTA_FLUSH_INTERVAL; the global totals are read back at the same time,
+which makes them include the usage of other processes as well.
+
+A user close to a limit gets a smaller history budget; at the limit new
+turns are refused. Crisis turns are never refused.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import aiosqlite
+
+from bot.db.engine import get_db
+from bot.db.repositories.settings import get_setting, set_setting
+from bot.db.repositories.usage import (
+    add_usage,
+    load_usage,
+    prune_usage,
+    top_consumers,
+    total_usage,
+)
+from bot.services import metrics
+from bot.utils.constants import (
+    MAX_HISTORY_TOKENS,
+    QUOTA_DEFAULTS,
+    QUOTA_DEGRADE_AT,
+    QUOTA_DEGRADED_BUDGET,
+    QUOTA_FLUSH_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+_HOUR = 60
+_DAY = 24 * 60
+# Keep a day of history in the table beyond the daily window
+_RETENTION = 2 * _DAY
+
+
+def _minute() -> int:
+    return int(time.time()) // 60
+
+
+class _Usage:
+    """Tokens per minute over the last day, with a running daily total."""
+
+    __slots__ = ("slots", "day_total")
+
+    def __init__(self) -> None:
+        self.slots: deque[list[int]] = deque()
+        self.day_total = 0
+
+    def add(self, minute: int, tokens: int) -> None:
+        if self.slots and self.slots[-1][0] == minute:
+            self.slots[-1][1] += tokens
+        else:
+            self.slots.append([minute, tokens])
+        self.day_total += tokens
+
+    def totals(self, now: int) -> tuple[int, int]:
+        while self.slots and self.slots[0][0] <= now - _DAY:
+            self.day_total -= self.slots.popleft()[1]
+        hour = 0
+        for minute, tokens in reversed(self.slots):
+            if minute <= now - _HOUR:
+                break
+            hour += tokens
+        return hour, self.day_total
+
+
+@dataclass(frozen=True)
+class QuotaDecision:
+    budget: int
+    degraded: bool = False
+    refused: bool = False
+
+
+_users: dict[int, _Usage] = {}
+_pending: dict[tuple[int, int], int] = {}
+_pending_total = 0
+# Tokens being written by flush(), still counted until totals are re-read
+_flushing_total = 0
+_flush_lock = asyncio.Lock()
+# Global (hour, day) totals as of the last flush, all processes included
+_global = (0, 0)
+_limits: dict[str, int] = dict(QUOTA_DEFAULTS)
+
+
+def limits() -> dict[str, int]:
+    return dict(_limits)
+
+
+def usage(user_id: int) -> tuple[int, int]:
+    entry = _users.get(user_id)
+    return entry.totals(_minute()) if entry else (0, 0)
+
+
+def global_usage() -> tuple[int, int]:
+    local = _pending_total + _flushing_total
+    return _global[0] + local, _global[1] + local
+
+
+def check(user_id: int, crisis: bool = False) -> QuotaDecision:
+    """Decide how much history the next LLM call of this user may use."""
+    user_hour, user_day = usage(user_id)
+    global_hour, global_day = global_usage()
+    ratio = max(
+        (used / _limits[name] for name, used in (
+            ("user_hour", user_hour),
+            ("user_day", user_day),
+            ("global_hour", global_hour),
+            ("global_day", global_day),
+        ) if _limits[name] > 0),
+        default=0.0,
+    )
+    if ratio >= 1 and not crisis:
+        metrics.inc("quota_refused")
+        return QuotaDecision(budget=0, refused=True)
+    if ratio >= QUOTA_DEGRADE_AT:
+        metrics.inc("quota_degraded")
+        return QuotaDecision(budget=QUOTA_DEGRADED_BUDGET, degraded=True)
+    return QuotaDecision(budget=MAX_HISTORY_TOKENS)
+
+
+def record(user_id: int, tokens: int) -> None:
+    global _pending_total
+    minute = _minute()
+    _users.setdefault(user_id, _Usage()).add(minute, tokens)
+    _pending[(user_id, minute)] = _pending.get((user_id, minute), 0) + tokens
+    _pending_total += tokens
+
+
+async def _refresh_limits(db: aiosqlite.Connection) -> None:
+    for name, default in QUOTA_DEFAULTS.items():
+        value = await get_setting(db, f"quota_{name}")
+        _limits[name] = int(value) if value is not None else default
+
+
+async def set_limit(name: str, value: int) -> None:
+    db = await get_db()
+    try:
+        await set_setting(db, f"quota_{name}", str(value))
+    finally:
+        await db.close()
+    _limits[name] = value
+
+
+async def load() -> None:
+    """Rebuild per-user windows and limits after a restart."""
+    global _global
+    now = _minute()
+    db = await get_db()
+    try:
+        for user_id, minute, tokens in await load_usage(db, now - _DAY + 1):
+            _users.setdefault(user_id, _Usage()).add(minute, tokens)
+        _global = (
+            await total_usage(db, now - _HOUR + 1),
+            await total_usage(db, now - _DAY + 1),
+        )
+        await _refresh_limits(db)
+    finally:
+        await db.close()
+
+
+async def flush(prune: bool = False) -> None:
+    """Persist pending increments and re-read global totals and limits."""
+    # The loop, /quota and shutdown may flush at the same time; one at a
+    # time keeps _flushing_total the amount of the flush that set it
+    async with _flush_lock:
+        await _flush(prune)
+
+
+async def _flush(prune: bool) -> None:
+    global _pending, _pending_total, _flushing_total, _global
+    rows = [(user_id, minute, tokens) for (user_id, minute), tokens in _pending.items()]
+    _flushing_total = _pending_total
+    _pending, _pending_total = {}, 0
+    now = _minute()
+    db = await get_db()
+    try:
+        if rows:
+            try:
+                await add_usage(db, rows)
+            except Exception:
+                # Keep them for the next flush
+                for user_id, minute, tokens in rows:
+                    key = (user_id, minute)
+                    _pending[key] = _pending.get(key, 0) + tokens
+                _pending_total += _flushing_total
+                raise
+        _global = (
+            await total_usage(db, now - _HOUR + 1),
+            await total_usage(db, now - _DAY + 1),
+        )
+        await _refresh_limits(db)
+        if prune:
+            await prune_usage(db, now - _RETENTION)
+    finally:
+        _flushing_total = 0
+        await db.close()
+
+    for user_id in [u for u, entry in _users.items() if entry.totals(now)[1] == 0]:
+        del _users[user_id]
+
+
+async def top_users(limit: int = 10) -> list[tuple[int, int]]:
+    """Heaviest users over the last 24 hours, across all processes."""
+    await flush()
+    db = await get_db()
+    try:
+        return await top_consumers(db, _minute() - _DAY + 1, limit)
+    finally:
+        await db.close()
+
+
+async def quota_loop() -> None:
+    await load()
+    flushes = 0
+    while True:
+        await asyncio.sleep(QUOTA_FLUSH_INTERVAL)
+        flushes += 1
+        try:
+            # Prune roughly once an hour
+            await flush(prune=flushes % (3600 // QUOTA_FLUSH_INTERVAL) == 0)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to persist token usage")
@@ -0,0 +1,218 @@
+"""Daily mood check-in reminders.
+
+The `reminders` table is the schedule. The scheduler keeps only the next
+REMINDER_WINDOW of it in memory, in a two-level timer wheel (seconds of the
+current minute, minutes of the next hour), and tops it up every
+REMINDER_SYNC_INTERVAL with an index range scan — rows that come into the
+window, rows other processes changed since the last sync, and overdue rows
+nothing has claimed, should a change slip past the sync.
+
+Due reminders are sent in batches at REMINDER_SEND_RATE. Each batch is first
+moved to its next day in one transaction, so after a restart nothing is sent
+twice; a batch that fails to be claimed goes back on the wheel. Reminders
+missed while the bot was down are sent late, unless they are more than
+REMINDER_GRACE overdue. A shutdown lets the batch in progress
+finish and leaves the rest of the queue to the next start.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from bot.db.engine import get_db
+from bot.db.repositories.reminders import claim_reminders, delete_reminder, load_reminders
+from bot.keyboards.inline import mood_keyboard
+from bot.services import lifecycle, metrics, outbox
+from bot.utils.constants import (
+    REMINDER_BATCH_SIZE,
+    REMINDER_GRACE,
+    REMINDER_SEND_RATE,
+    REMINDER_SYNC_INTERVAL,
+    REMINDER_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TEXT = "Привет! Как ты себя чувствуешь сегодня? Оцени настроение от 1 до 10:"
+
+
+class TimerWheel:
+    """Hierarchical timer wheel with one-second resolution and a horizon of
+    just under an hour. Adding and firing an item are O(1).
+    """
+
+    def __init__(self, now: int) -> None:
+        # Next second to fire
+        self.now = now
+        self.seconds: list[list[tuple[int, int]]] = [[] for _ in range(60)]
+        self.minutes: list[list[tuple[int, int]]] = [[] for _ in range(60)]
+        self.size = 0
+
+    def add(self, when: int, item: int) -> None:
+        """Schedule `item` at `when`; past times fire on the next tick but
+        keep their original `when`.
+        """
+        at = max(when, self.now)
+        ahead = at // 60 - self.now // 60
+        if ahead == 0:
+            self.seconds[at % 60].append((when, item))
+        elif ahead < 60:
+            self.minutes[(at // 60) % 60].append((when, item))
+        else:
+            raise ValueError("beyond the wheel's horizon")
+        self.size += 1
+
+    def advance(self, to: int) -> list[tuple[int, int]]:
+        """Fire everything due up to and including second `to`."""
+        due = []
+        while self.now <= to:
+            if self.now % 60 == 0:
+                # A new minute: spread its items over the seconds
+                slot = (self.now // 60) % 60
+                for when, item in self.minutes[slot]:
+                    # Only future items go to the minute slots, so `when` is exact
+                    self.seconds[when % 60].append((when, item))
+                self.minutes[slot] = []
+            slot = self.now % 60
+            due.extend(self.seconds[slot])
+            self.seconds[slot] = []
+            self.now += 1
+        self.size -= len(due)
+        return due
+
+
+_wheel: TimerWheel | None = None
+# Fire time each user on the wheel or in the send queue is expected at, until
+# the reminder is claimed; wheel items that disagree are stale
+_scheduled: dict[int, int] = {}
+_loaded_until = 0
+
+
+def schedule(user_id: int, when: int) -> None:
+    """Put a reminder changed in this process on the wheel right away.
+
+    Reminders beyond the loaded window, or changed in a process that does
+    not run the scheduler, are picked up by the next sync.
+    """
+    if _wheel is not None and when < _loaded_until:
+        _scheduled[user_id] = when
+        _wheel.add(when, user_id)
+
+
+def unschedule(user_id: int) -> None:
+    _scheduled.pop(user_id, None)
+
+
+async def _sync(since: int) -> None:
+    global _loaded_until
+    now = int(time.time())
+    until = now + REMINDER_WINDOW
+    db = await get_db()
+    try:
+        rows = await load_reminders(db, until, _loaded_until, since, now)
+    finally:
+        await db.close()
+    for user_id, when in rows:
+        if _scheduled.get(user_id) != when:
+            _scheduled[user_id] = when
+            _wheel.add(when, user_id)
+    _loaded_until = until
+
+
+async def _deliver(bot: Bot, reminder: dict) -> None:
+    chat_id = reminder["chat_id"]
+    try:
+        await outbox.send(chat_id, lambda: bot.send_message(
+            chat_id, REMINDER_TEXT, reply_markup=mood_keyboard()
+        ))
+        metrics.inc("reminders_sent")
+    except TelegramForbiddenError:
+        logger.info("User %s blocked the bot, dropping their reminder", reminder["user_id"])
+        db = await get_db()
+        try:
+            await delete_reminder(db, reminder["user_id"])
+        finally:
+            await db.close()
+    except Exception:
+        logger.exception("Failed to send reminder to user %s", reminder["user_id"])
+
+
+def _release(batch: list[tuple[int, int]], retry: bool) -> None:
+    """Forget the reminders of a claimed batch, or with `retry` put them back
+    on the wheel to be due again on the next tick. Users rescheduled or
+    turned off meanwhile are left alone.
+    """
+    for user_id, when in batch:
+        if _scheduled.get(user_id) != when:
+            continue
+        if retry:
+            _wheel.add(when, user_id)
+        else:
+            del _scheduled[user_id]
+
+
+async def _send_batches(bot: Bot, queue: asyncio.Queue) -> None:
+    # None asks to stop after the batch in progress
+    while (item := await queue.get()) is not None:
+        batch = [item]
+        while len(batch) < REMINDER_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        started = time.monotonic()
+        now = int(time.time())
+        db = await get_db()
+        try:
+            claimed = await claim_reminders(db, batch, now)
+        except Exception:
+            logger.exception("Failed to claim %d reminders", len(batch))
+            claimed = []
+            _release(batch, retry=True)
+        else:
+            _release(batch, retry=False)
+        finally:
+            await db.close()
+
+        late = [r for r in claimed if now - r["due_at"] > REMINDER_GRACE]
+        if late:
+            metrics.inc("reminders_skipped", len(late))
+        await asyncio.gather(*(
+            _deliver(bot, r) for r in claimed if now - r["due_at"] <= REMINDER_GRACE
+        ))
+        await asyncio.sleep(len(batch) / REMINDER_SEND_RATE - (time.monotonic() - started))
+
+
+async def reminder_loop(bot: Bot) -> None:
+    global _wheel, _loaded_until
+    _wheel = TimerWheel(int(time.time()))
+    _scheduled.clear()
+    _loaded_until = 0
+    metrics.register_gauge("reminders_scheduled", lambda: len(_scheduled))
+    queue: asyncio.Queue = asyncio.Queue()
+    metrics.register_gauge("reminders_queued", queue.qsize)
+    sender = asyncio.create_task(_send_batches(bot, queue))
+    # A shutdown lets the batch being sent finish
+    lifecycle.track()
+    last_sync = None
+    try:
+        while not lifecycle.draining():
+            now = int(time.time())
+            if last_sync is None or now - last_sync >= REMINDER_SYNC_INTERVAL:
+                try:
+                    # Rows written during the sync are read again next time
+                    await _sync(since=last_sync or 0)
+                    last_sync = now
+                except Exception:
+                    logger.exception("Failed to load reminders")
+            for when, user_id in _wheel.advance(now):
+                if _scheduled.get(user_id) == when:
+                    queue.put_nowait((user_id, when))
+            await asyncio.sleep(1 - time.time() % 1)
+        # Queued reminders are not claimed yet and stay due in the table
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        await sender
+    finally:
+        sender.cancel()
+        _wheel = None
@@ -0,0 +1,244 @@
+"""LLM replies as durable jobs.
+
+The therapy handler records a job for every user turn and runs it inline.
+If the process dies before the reply is delivered, the job's lease runs out
+and `recovery_loop` — in this or any other process — picks it up again.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import aiosqlite
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot.db.engine import get_db
+from bot.db.repositories.conversation import estimate_tokens, get_message, get_messages
+from bot.db.repositories.jobs import (
+    claim_jobs,
+    create_job,
+    finish_job,
+    prune_jobs,
+    release_job,
+    renew_lease,
+    save_reply,
+)
+from bot.services import lifecycle, metrics, outbox, quota
+from bot.services.history import build_messages
+from bot.services.load import load
+from bot.services.llm import chat_completion
+from bot.services.typing_indicator import typing_indicator
+from bot.utils.constants import (
+    LLM_JOB_CONCURRENCY,
+    LLM_JOB_LEASE,
+    LLM_JOB_MAX_ATTEMPTS,
+    LLM_JOB_POLL_INTERVAL,
+    LLM_JOB_PRUNE_INTERVAL,
+    LLM_JOB_RETENTION_DAYS,
+)
+from bot.utils.formatting import md_to_html, sanitize_html, split_message
+
+logger = logging.getLogger(__name__)
+
+# Lease owner id of this process
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_ERROR_REPLY = "Извини, произошла ошибка. Попробуй ещё раз."
+
+_QUOTA_REPLY = (
+    "Мы сегодня много поговорили, и я упёрся в лимит. "
+    "Давай продолжим чуть позже — через час-другой я снова смогу ответить. "
+    "Если тебе тяжело прямо сейчас, попробуй /breathe или /ground."
+)
+
+_CRISIS_NOTE = {
+    "role": "system",
+    "content": "ВНИМАНИЕ: пользователь выразил кризисные мысли. "
+    "Контакты горячих линий уже показаны. "
+    "Ответь с максимальной эмпатией и поддержкой. "
+    "Не игнорируй тему, но и не усиливай кризис.",
+}
+
+
+async def send_reply(bot: Bot, chat_id: int, text: str) -> None:
+    """Convert LLM Markdown to HTML and send it in chunks, falling back to
+    plain text for chunks Telegram refuses to parse.
+    """
+    async with typing_indicator.sending(chat_id):
+        # Split on paragraph boundaries to avoid breaking markdown/words
+        for chunk in split_message(text):
+            html_text = sanitize_html(md_to_html(chunk))
+            try:
+                await outbox.send(chat_id, lambda: bot.send_message(
+                    chat_id, html_text, parse_mode="HTML"
+                ))
+            except TelegramBadRequest:
+                await outbox.send(chat_id, lambda: bot.send_message(chat_id, chunk))
+
+
+async def _keep_lease(job: dict) -> None:
+    # Own connection: a commit here must not end the job's transaction
+    db = await get_db()
+    try:
+        while True:
+            await asyncio.sleep(LLM_JOB_LEASE / 3)
+            if not await renew_lease(db, job, OWNER, LLM_JOB_LEASE):
+                logger.warning("Lost lease on LLM job %s", job["id"])
+                return
+    finally:
+        await db.close()
+
+
+async def _generate(
+    bot: Bot,
+    db: aiosqlite.Connection,
+    job: dict,
+    budget: int,
+    received_at: float | None,
+) -> str | None:
+    conversation = await get_messages(db, job["user_id"], up_to_id=job["message_id"])
+    if not any(m["id"] == job["message_id"] for m in conversation):
+        # History was cleared before we got to it
+        return None
+
+    if received_at is not None:
+        load.observe_queue_wait(time.time() - received_at)
+    budget, model = load.adjust(budget, job["model"], crisis=bool(job["crisis"]))
+    messages = await build_messages(db, conversation, budget)
+    if job["crisis"]:
+        messages.append(_CRISIS_NOTE)
+
+    async with typing_indicator.thinking(bot, job["chat_id"]):
+        try:
+            async with load.llm_call():
+                response = await chat_completion(messages, model, job["user_id"])
+        except Exception:
+            logger.exception("Unexpected LLM error for user %s", job["user_id"])
+            response = _ERROR_REPLY
+
+    # Guard against empty response
+    if not response or not response.strip():
+        response = _ERROR_REPLY
+
+    quota.record(
+        job["user_id"],
+        sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(response),
+    )
+    return response
+
+
+async def run_job(
+    bot: Bot,
+    db: aiosqlite.Connection,
+    job: dict,
+    received_at: float | None = None,
+) -> None:
+    """Take a leased job to the end: generate and save the reply unless that
+    already happened, then deliver it.
+
+    `received_at` is the unix time the user sent the message, if known.
+    """
+    heartbeat = asyncio.create_task(_keep_lease(job))
+    try:
+        if job["reply_message_id"] is None:
+            decision = quota.check(job["user_id"], crisis=bool(job["crisis"]))
+            if decision.refused:
+                await outbox.send(job["chat_id"], lambda: bot.send_message(
+                    job["chat_id"], _QUOTA_REPLY
+                ))
+                await finish_job(db, job, OWNER, "failed", "quota exceeded")
+                return
+            response = await _generate(bot, db, job, decision.budget, received_at)
+            if response is None:
+                await finish_job(db, job, OWNER, "failed", "message deleted")
+                return
+            if await save_reply(db, job, OWNER, response) is None:
+                logger.warning("LLM job %s was taken over, dropping its reply", job["id"])
+                return
+        else:
+            stored = await get_message(db, job["user_id"], job["reply_message_id"])
+            if stored is None:
+                await finish_job(db, job, OWNER, "failed", "reply deleted")
+                return
+            response = stored["content"]
+
+        try:
+            await send_reply(bot, job["chat_id"], response)
+        except TelegramForbiddenError:
+            logger.info("User %s blocked the bot, reply not delivered", job["user_id"])
+        await finish_job(db, job, OWNER)
+    except asyncio.CancelledError:
+        # Shutdown: the lease runs out and the job is resumed after restart
+        raise
+    except Exception as e:
+        logger.exception("LLM job %s failed", job["id"])
+        metrics.inc("llm_jobs_errors")
+        await release_job(db, job, OWNER, repr(e)[:500])
+    finally:
+        heartbeat.cancel()
+
+
+async def reply_to(
+    bot: Bot,
+    db: aiosqlite.Connection,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    model: str,
+    crisis: bool,
+    received_at: float | None = None,
+) -> None:
+    """Record a reply job for a saved user message and run it right away."""
+    job = await create_job(
+        db, user_id, chat_id, message_id, model, crisis, OWNER, LLM_JOB_LEASE
+    )
+    await run_job(bot, db, job, received_at)
+
+
+async def _resume(bot: Bot, job: dict) -> None:
+    logger.info("Resuming LLM job %s for user %s", job["id"], job["user_id"])
+    metrics.inc("llm_jobs_resumed")
+    db = await get_db()
+    try:
+        await run_job(bot, db, job)
+    finally:
+        await db.close()
+
+
+async def recovery_loop(bot: Bot) -> None:
+    """Pick up jobs left behind by crashed or restarted processes."""
+    running: set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+    last_prune = 0.0
+    try:
+        while True:
+            try:
+                db = await get_db()
+                try:
+                    # A draining process takes no new jobs; the next one will
+                    free = 0 if lifecycle.draining() else LLM_JOB_CONCURRENCY - len(running)
+                    jobs = (
+                        await claim_jobs(db, OWNER, LLM_JOB_LEASE, LLM_JOB_MAX_ATTEMPTS, free)
+                        if free > 0
+                        else []
+                    )
+                    if loop.time() - last_prune > LLM_JOB_PRUNE_INTERVAL:
+                        await prune_jobs(db, LLM_JOB_RETENTION_DAYS)
+                        last_prune = loop.time()
+                finally:
+                    await db.close()
+                for job in jobs:
+                    task = asyncio.create_task(_resume(bot, job))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                    lifecycle.track(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("LLM job recovery failed")
+            await asyncio.sleep(LLM_JOB_POLL_INTERVAL)
+    finally:
+        for task in running:
+            task.cancel()
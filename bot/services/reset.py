@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+from bot.db.engine import get_db
+from bot.db.repositories.conversation import purge_step
+from bot.db.shards import user_dbs
+from bot.services.archive import reclaim_free_pages
+from bot.utils.constants import (
+    HISTORY_PURGE_BLOCKS,
+    HISTORY_PURGE_INTERVAL,
+    HISTORY_PURGE_MESSAGES,
+    HISTORY_PURGE_PAUSE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def run_purge() -> int:
+    """Delete the rows /reset has hidden, a small batch per transaction so
+    the bot keeps writing in between. Returns the number of rows deleted.
+    """
+    db = await get_db()
+    try:
+        purged = 0
+        while deleted := await purge_step(db, HISTORY_PURGE_MESSAGES, HISTORY_PURGE_BLOCKS):
+            purged += deleted
+            await asyncio.sleep(HISTORY_PURGE_PAUSE)
+
+        if purged:
+            for conn in await user_dbs(db):
+                await reclaim_free_pages(conn)
+        return purged
+    finally:
+        await db.close()
+
+
+async def purge_loop() -> None:
+    while True:
+        try:
+            purged = await run_purge()
+            if purged:
+                logger.info("Purged %d rows of reset history", purged)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Purging reset history failed")
+        await asyncio.sleep(HISTORY_PURGE_INTERVAL)
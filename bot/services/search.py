@@ -0,0 +1,102 @@
+"""/search: query building, result formatting and the index backfill."""
+import asyncio
+import html
+import logging
+import re
+
+from bot.db.engine import get_db
+from bot.db.repositories.search import MATCH_END, MATCH_START, backfill_step, search
+from bot.utils.constants import (
+    SEARCH_BACKFILL_BATCH,
+    SEARCH_BACKFILL_BLOCKS,
+    SEARCH_BACKFILL_PAUSE,
+    SEARCH_MAX_TERMS,
+    SEARCH_PAGE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def to_match_query(text: str) -> str | None:
+    """Turn free text into an FTS5 query matching all of its words.
+
+    The tokenizer does not stem, so longer words lose their ending and are
+    matched as prefixes: "сестре" finds "сестра" and "сестру" too.
+    """
+    words = _WORD_RE.findall(text.lower())
+    # Prepositions and conjunctions would only narrow the match
+    words = [w for w in words if len(w) > 2] or words
+    terms = []
+    for word in words[:SEARCH_MAX_TERMS]:
+        if len(word) >= 7:
+            word = word[:-2]
+        elif len(word) >= 5:
+            word = word[:-1]
+        terms.append(f'"{word}"*')
+    return " ".join(terms) or None
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet.replace("\n", " "))
+        .replace(MATCH_START, "<b>")
+        .replace(MATCH_END, "</b>")
+    )
+
+
+def _format_hit(hit: dict) -> str:
+    day = f"{hit['local_at'][8:10]}.{hit['local_at'][5:7]}.{hit['local_at'][:4]}"
+    if hit["kind"] == "mood":
+        source = "📓 дневник"
+    elif hit["role"] == "user":
+        source = "💬 ты"
+    else:
+        source = "💬 бот"
+    return f"<i>{day}, {source}</i>\n{_highlight(hit['snippet'])}"
+
+
+async def search_page(user_id: int, utc_offset: int, query: str, page: int) -> tuple[str, bool]:
+    """Text of one page of results and whether there is a next one."""
+    match = to_match_query(query)
+    if match is None:
+        return "Напиши, что искать, например: <code>/search сестра</code>.", False
+    db = await get_db()
+    try:
+        hits = await search(
+            db, user_id, match, utc_offset, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE
+        )
+    finally:
+        await db.close()
+
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+    title = f"🔎 <b>{html.escape(query)}</b>"
+    if not hits:
+        text = "Ничего не нашлось." if page == 0 else "Больше ничего не нашлось."
+        return f"{title}\n\n{text}", False
+    body = "\n\n".join(_format_hit(hit) for hit in hits)
+    return f"{title} — стр. {page + 1}\n\n{body}", has_next
+
+
+async def fts_backfill_loop() -> None:
+    """Index rows and archive blocks written before the search indexes
+    existed, a small batch at a time so the bot keeps writing in between.
+    """
+    total = 0
+    while True:
+        db = await get_db()
+        try:
+            remaining = await backfill_step(db, SEARCH_BACKFILL_BATCH, SEARCH_BACKFILL_BLOCKS)
+        except Exception:
+            logger.exception("Search index backfill failed")
+            remaining = 1
+        finally:
+            await db.close()
+        if remaining == 0:
+            if total:
+                logger.info("Search index backfill finished after %d batches", total)
+            return
+        total += 1
+        await asyncio.sleep(SEARCH_BACKFILL_PAUSE)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiogram import Bot
+from aiogram.enums import ChatAction
+
+from bot.utils.constants import TYPING_INTERVAL, TYPING_MAX_RATE, TYPING_TICK
+
+logger = logging.getLogger(__name__)
+
+
+class _Chat:
+    __slots__ = ("thinking", "sending", "due")
+
+    def __init__(self, due: float) -> None:
+        self.thinking = 0
+        self.sending = 0
+        self.due = due
+
+
+class TypingScheduler:
+    """Keeps "typing…" visible in every chat that waits for an LLM reply.
+
+    One timer serves all chats: each tick sends the chat actions that are due,
+    oldest first, within a global rate cap. Chats that are currently receiving
+    a reply are skipped — a sent message clears the indicator anyway.
+    """
+
+    def __init__(self) -> None:
+        self._bot: Bot | None = None
+        self._chats: dict[int, _Chat] = {}
+        self._task: asyncio.Task | None = None
+        self._pending: set[asyncio.Task] = set()
+        self.max_rate = float(TYPING_MAX_RATE)
+        self._allowance = self.max_rate
+        self._last_refill = time.monotonic()
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    @asynccontextmanager
+    async def thinking(self, bot: Bot, chat_id: int) -> AsyncIterator[None]:
+        self._bot = bot
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(due=time.monotonic())
+        chat.thinking += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            yield
+        finally:
+            chat.thinking -= 1
+            self._release(chat_id, chat)
+
+    @asynccontextmanager
+    async def sending(self, chat_id: int) -> AsyncIterator[None]:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            yield
+            return
+        chat.sending += 1
+        try:
+            yield
+        finally:
+            chat.sending -= 1
+            # Our message cleared the indicator; show it again for the
+            # requests in this chat that are still waiting
+            chat.due = time.monotonic()
+            self._release(chat_id, chat)
+
+    def _release(self, chat_id: int, chat: _Chat) -> None:
+        if chat.thinking <= 0 and chat.sending <= 0:
+            self._chats.pop(chat_id, None)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._allowance = min(self.max_rate, self._allowance + elapsed * self.max_rate)
+
+    async def _run(self) -> None:
+        while self._chats:
+            now = time.monotonic()
+            self._refill(now)
+            due = sorted(
+                (chat.due, chat_id)
+                for chat_id, chat in self._chats.items()
+                if chat.due <= now and not chat.sending
+            )
+            for _, chat_id in due[: int(self._allowance)]:
+                self._allowance -= 1
+                self._chats[chat_id].due = now + TYPING_INTERVAL
+                task = asyncio.create_task(self._send(chat_id))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+            await asyncio.sleep(TYPING_TICK)
+
+    async def close(self) -> None:
+        """Stop the timer and wait for the chat actions already on their way."""
+        if self._task is not None:
+            self._task.cancel()
+        await asyncio.gather(
+            *(t for t in (self._task, *self._pending) if t is not None),
+            return_exceptions=True,
+        )
+        self._chats.clear()
+
+    async def _send(self, chat_id: int) -> None:
+        try:
+            await self._bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        except Exception:
+            logger.debug("Failed to send typing action to %s", chat_id, exc_info=True)
+
+
+typing_indicator = TypingScheduler()
@@ -0,0 +1,340 @@
+"""Fill a new database with synthetic users and years of their history.
+
+    python -m bot.tools.datagen --users 20000 --messages 10000000
+
+For benchmarks and query plan checks (`bot.tools.querybench`), never for
+real data: it only writes to a DB_PATH that does not exist yet, and marks
+the result as synthetic. `python -m bot.tools.reshard N` lays it out in
+shards afterwards.
+
+The shape follows the bot's traffic: message counts per user are
+Pareto-distributed (a few users write most of the history), each user joins
+at some point of the last `--years` and talks in sessions of a few turns,
+an assistant reply often lands in the same second as the message it answers,
+and all users' rows are interleaved in time order as they would be in the
+table. Texts are Russian. Mood entries, crisis events, recent reply jobs,
+reminders, token usage and processed updates are added in proportion; the
+archive stays empty until the bot's archiver runs over the data.
+"""
+import argparse
+import heapq
+import logging
+import math
+import os
+import random
+import sqlite3
+import time
+from typing import Iterator
+
+from bot.config import settings
+from bot.db.models import SCHEMA, SCHEMA_VERSION
+from bot.db.repositories.conversation import estimate_tokens
+from bot.db.shards import LAYOUT_KEY
+from bot.utils.constants import LLM_JOB_RETENTION_DAYS
+from bot.utils.timezones import default_utc_offset
+
+logger = logging.getLogger(__name__)
+
+# bot_settings key marking a generated database
+SYNTHETIC_KEY = "synthetic_data"
+
+_BATCH_ROWS = 10_000
+_LOG_EVERY = 500_000
+_PARETO_ALPHA = 1.16  # the 80/20 rule
+_TURNS_PER_SESSION = 4  # mean user messages per session
+_MOOD_PER_MESSAGES = 20  # about one mood entry per this many messages
+_CRISIS_SHARE = 0.003  # user messages that log a crisis event
+_REMINDER_SHARE = 0.15
+_LANGUAGES = (("ru", 80), ("uk", 8), ("en", 6), ("kk", 3), ("be", 1), (None, 2))
+_OTHER_OFFSETS = (120, 240, 300, 360, 420, 480, 540, 600, 660, 720)
+
+_MESSAGE_COLUMNS = ("id", "user_id", "role", "content", "tokens_est", "created_at")
+_CRISIS_COLUMNS = ("user_id", "trigger", "matched", "created_at")
+_JOB_COLUMNS = (
+    "id", "user_id", "chat_id", "message_id", "reply_message_id", "model",
+    "state", "attempts", "created_at", "updated_at",
+)
+_MOOD_COLUMNS = ("user_id", "score", "note", "created_at", "local_at")
+
+_WORDS = """
+я ты мы он она они мне меня себя всё это что как когда почему потому опять
+снова сегодня вчера завтра утром вечером ночью неделю месяц год давно
+очень совсем немного слишком никак всегда никогда иногда часто просто
+тревога тревожно страх боюсь паника устал усталость сон спать бессонница
+работа работе начальник коллеги проект дедлайн учёба экзамен сессия
+мама мамой папа сестра сестрой брат муж жена друг подруга дети ребёнок
+отношения ссора поругались помирились одиночество одиноко пусто грустно
+радость радостно спокойно легче тяжело больно обидно злюсь раздражение
+чувствую думаю хочу могу надо получается пытаюсь стараюсь помогает
+дыхание дышать прогулка спорт терапевт психолог таблетки врач здоровье
+голова сердце мысли чувства эмоции настроение энергия силы мотивация
+дом квартира переезд город деньги кредит зарплата отпуск выходные
+поговорить рассказать понять принять отпустить справиться выдержать
+""".split()
+
+_REPLY_OPENINGS = (
+    "Понимаю, как тебе сейчас непросто.",
+    "Спасибо, что делишься этим.",
+    "Звучит так, будто это тебя сильно вымотало.",
+    "Похоже, в этом много напряжения.",
+    "Давай попробуем разобраться вместе.",
+)
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    words = rng.choices(_WORDS, k=rng.randint(low, high))
+    return " ".join(words).capitalize() + rng.choice((".", ".", ".", "?", "!", "…"))
+
+
+class _Texts:
+    """Messages composed from a pool of generated sentences, which is much
+    cheaper than drawing every word and still gives FTS a real vocabulary.
+    """
+
+    def __init__(self, rng: random.Random, pool: int = 20_000) -> None:
+        self.rng = rng
+        self.sentences = [_sentence(rng, 3, 14) for _ in range(pool)]
+
+    def user(self) -> str:
+        return " ".join(self.rng.choices(self.sentences, k=self.rng.randint(1, 4)))
+
+    def assistant(self) -> str:
+        body = self.rng.choices(self.sentences, k=self.rng.randint(3, 12))
+        return " ".join([self.rng.choice(_REPLY_OPENINGS), *body])
+
+    def note(self) -> str | None:
+        return self.rng.choice(self.sentences) if self.rng.random() < 0.4 else None
+
+
+def _timestamp(ts: int) -> str:
+    # The format of CURRENT_TIMESTAMP
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+def _user_messages(
+    rng: random.Random, user_id: int, count: int, joined: int, now: int
+) -> Iterator[tuple[int, int, str]]:
+    """(unix time, user_id, role) of one user's messages, oldest first."""
+    sessions = sorted(
+        rng.randint(joined, now)
+        for _ in range(max(1, math.ceil(count / (2 * _TURNS_PER_SESSION))))
+    )
+    last = joined
+    left = count
+    for start in sessions:
+        ts = max(start, last)
+        for _ in range(1 + int(rng.expovariate(1 / (_TURNS_PER_SESSION - 1)))):
+            if left == 0:
+                return
+            yield min(ts, now), user_id, "user"
+            left -= 1
+            if left == 0:
+                return
+            # Replies often come within the same second
+            ts += int(rng.expovariate(1 / 8))
+            yield min(ts, now), user_id, "assistant"
+            left -= 1
+            ts += 15 + int(rng.expovariate(1 / 120))
+        last = ts
+    # Sessions ended before the count did: the rest go to the last one
+    while left:
+        yield min(last, now), user_id, "user" if left % 2 else "assistant"
+        left -= 1
+        last += 1 + int(rng.expovariate(1 / 30))
+
+
+def _user_moods(
+    rng: random.Random, user_id: int, count: int, joined: int, now: int
+) -> Iterator[tuple[int, int]]:
+    for ts in sorted(rng.randint(joined, now) for _ in range(count)):
+        yield ts, user_id
+
+
+def _insert(conn: sqlite3.Connection, table: str, columns: tuple, rows: list) -> None:
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})",
+        rows,
+    )
+    rows.clear()
+
+
+def generate(users: int, messages: int, years: float, seed: int) -> None:
+    path = settings.db_path
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists; point DB_PATH at a new file")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = random.Random(seed)
+    texts = _Texts(rng)
+    now = int(time.time())
+    span = int(years * 365 * 86400)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    # Triggers come after the bulk load, FTS indexes are built in one pass
+    triggers = [s for s in SCHEMA if "CREATE TRIGGER" in s]
+    conn.execute("BEGIN")
+    for statement in SCHEMA:
+        if statement not in triggers:
+            conn.execute(statement)
+    conn.executemany(
+        "INSERT INTO bot_settings (key, value) VALUES (?, ?)",
+        [(LAYOUT_KEY, "0"), (SYNTHETIC_KEY, str(seed))],
+    )
+
+    languages, weights = zip(*_LANGUAGES)
+    user_ids = rng.sample(range(10_000_000, 7_000_000_000), users)
+    profiles = []
+    for user_id in user_ids:
+        language = rng.choices(languages, weights)[0]
+        offset = (
+            rng.choice(_OTHER_OFFSETS) if rng.random() < 0.1 else default_utc_offset(language)
+        )
+        joined = now - int(span * rng.random())
+        profiles.append((user_id, language, offset, joined))
+    conn.executemany(
+        """
+        INSERT INTO users (user_id, username, first_name, language_code, created_at, utc_offset)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            (user_id, f"user{user_id}", rng.choice(("Аня", "Саша", "Дима", "Оля", "Женя")),
+             language, _timestamp(joined), offset)
+            for user_id, language, offset, joined in profiles
+        ),
+    )
+
+    # Heavy tail: a few users own most of the history
+    shares = [rng.paretovariate(_PARETO_ALPHA) for _ in profiles]
+    total = sum(shares)
+    streams = []
+    moods = []
+    for (user_id, _, _, joined), share in zip(profiles, shares):
+        count = round(messages * share / total)
+        if count:
+            streams.append(_user_messages(rng, user_id, count, joined, now))
+        mood_count = round(count / _MOOD_PER_MESSAGES * rng.uniform(0, 2))
+        if mood_count:
+            moods.append(_user_moods(rng, user_id, mood_count, joined, now))
+
+    logger.info("Writing messages of %d users", users)
+    offsets = {user_id: offset for user_id, _, offset, _ in profiles}
+    jobs_since = now - LLM_JOB_RETENTION_DAYS * 86400
+    # user_id -> id of the user message waiting for its reply
+    pending: dict[int, int] = {}
+    rows, crises, jobs = [], [], []
+    message_id = job_id = 0
+    for ts, user_id, role in heapq.merge(*streams):
+        message_id += 1
+        content = texts.user() if role == "user" else texts.assistant()
+        created_at = _timestamp(ts)
+        rows.append((message_id, user_id, role, content, estimate_tokens(content), created_at))
+        if role == "user":
+            pending[user_id] = message_id
+            if rng.random() < _CRISIS_SHARE:
+                crises.append((user_id, "keyword", rng.choice(_WORDS), created_at))
+        elif (question := pending.pop(user_id, None)) and ts >= jobs_since:
+            job_id += 1
+            jobs.append((
+                job_id, user_id, user_id, question, message_id, "deepseek/deepseek-r1",
+                "done", 1, created_at, created_at,
+            ))
+        if len(rows) >= _BATCH_ROWS:
+            _insert(conn, "conversation_messages", _MESSAGE_COLUMNS, rows)
+            _insert(conn, "crisis_events", _CRISIS_COLUMNS, crises)
+            _insert(conn, "llm_jobs", _JOB_COLUMNS, jobs)
+        if message_id % _LOG_EVERY == 0:
+            logger.info("%d messages", message_id)
+    _insert(conn, "conversation_messages", _MESSAGE_COLUMNS, rows)
+    _insert(conn, "crisis_events", _CRISIS_COLUMNS, crises)
+    _insert(conn, "llm_jobs", _JOB_COLUMNS, jobs)
+    # A few turns still waiting for a reply, as after a crash
+    conn.executemany(
+        """
+        INSERT INTO llm_jobs (user_id, chat_id, message_id, model, state)
+        VALUES (?, ?, ?, 'deepseek/deepseek-r1', 'pending')
+        """,
+        [(user_id, user_id, message) for user_id, message in list(pending.items())[:20]],
+    )
+
+    logger.info("Writing mood entries")
+    rows = []
+    for ts, user_id in heapq.merge(*moods):
+        score = min(10, max(1, round(rng.gauss(6, 2))))
+        rows.append((
+            user_id, score, texts.note(), _timestamp(ts), _timestamp(ts + offsets[user_id] * 60),
+        ))
+        if len(rows) >= _BATCH_ROWS:
+            _insert(conn, "mood_entries", _MOOD_COLUMNS, rows)
+    _insert(conn, "mood_entries", _MOOD_COLUMNS, rows)
+    conn.execute(
+        """
+        INSERT INTO mood_daily
+            (user_id, day, entries, score_sum, score_min, score_max, score_sq_sum)
+        SELECT user_id, date(local_at), COUNT(*), SUM(score),
+               MIN(score), MAX(score), SUM(score * score)
+        FROM mood_entries
+        GROUP BY user_id, date(local_at)
+        """
+    )
+
+    logger.info("Writing reminders, usage and updates")
+    conn.executemany(
+        """
+        INSERT INTO reminders (user_id, chat_id, local_time, next_fire_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            (user_id, user_id, rng.randrange(0, 1440, 15), now + rng.randrange(86400), now)
+            for user_id, _, _, _ in profiles
+            if rng.random() < _REMINDER_SHARE
+        ),
+    )
+    minute = now // 60
+    conn.executemany(
+        "INSERT OR IGNORE INTO token_usage (user_id, minute, tokens) VALUES (?, ?, ?)",
+        (
+            (rng.choice(user_ids), minute - rng.randrange(24 * 60), rng.randint(500, 20_000))
+            for _ in range(min(users * 5, 200_000))
+        ),
+    )
+    conn.executemany(
+        """
+        INSERT INTO processed_updates (update_id, chat_id, message_id, seen_at)
+        VALUES (?, ?, ?, ?)
+        """,
+        (
+            (update_id, rng.choice(user_ids), update_id, now - rng.randrange(86400))
+            for update_id in range(min(users * 5, 100_000))
+        ),
+    )
+
+    logger.info("Building search indexes")
+    conn.execute("INSERT INTO conversation_fts(conversation_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO mood_fts(mood_fts) VALUES ('rebuild')")
+    for statement in triggers:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("COMMIT")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    logger.info(
+        "%s: %d users, %d messages, %d reply jobs", path, users, message_id, job_id
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(prog="python -m bot.tools.datagen")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--years", type=float, default=3, help="span of the history")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.users, args.messages, args.years, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+"""Time every repository query on a large database and check its plan.
+
+    python -m bot.tools.querybench [--runs 5]
+
+Run it on a database made by `bot.tools.datagen`, in either storage layout;
+it refuses any other, because the write cases change data and the last ones
+archive, reset and purge the history of the users they measure. A later run
+picks other users. tests/test_query_plans.py runs the plan checks on a small
+generated database.
+
+Each case calls a repository function the way the bot does, for the user
+with the most messages, a median one and one of the lightest, and reports
+the median time of `--runs` calls. Every statement a case executes is
+captured with the SQLite trace callback and run through EXPLAIN QUERY PLAN.
+A case fails if a plan scans a table it should search, sorts rows that an
+index should return in order, or leaves out an index the case expects. The
+exit status is 1 when a case fails, so a schema change that loses an index
+does not go unnoticed.
+"""
+import argparse
+import asyncio
+import logging
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import aiosqlite
+
+from bot.db.engine import get_db, init_db
+from bot.db.repositories import (
+    archive,
+    conversation,
+    jobs,
+    mood,
+    reminders,
+    search,
+    updates,
+    usage,
+    user,
+)
+from bot.db.repositories import settings as settings_repo
+from bot.db.shards import Database, user_dbs
+from bot.services.crisis import log_crisis_event
+from bot.tools.datagen import SYNTHETIC_KEY
+from bot.utils.constants import (
+    ARCHIVE_BLOCK_MESSAGES,
+    ARCHIVE_VACUUM_PAGES,
+    HISTORY_PURGE_BLOCKS,
+    HISTORY_PURGE_MESSAGES,
+    LLM_JOB_LEASE,
+    LLM_JOB_MAX_ATTEMPTS,
+    LLM_JOB_RETENTION_DAYS,
+    MAX_HISTORY_TOKENS,
+    REMINDER_BATCH_SIZE,
+    REMINDER_WINDOW,
+    SEARCH_BACKFILL_BATCH,
+    SEARCH_BACKFILL_BLOCKS,
+    SEARCH_PAGE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+OWNER = "querybench"
+_TEXT = "Сегодня опять не могу уснуть, всё думаю про работу и про сестру."
+_STATEMENT = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)")
+# FTS5 reads and writes its shadow tables with statements of its own
+_FTS_INTERNAL = re.compile(r"'\w+'\.'\w+_(config|data|idx|docsize)'")
+
+
+@dataclass
+class BenchUser:
+    user_id: int
+    messages: int
+    last_message_id: int
+    utc_offset: int
+    job: dict | None = None
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[["Bench", BenchUser | None], Awaitable[Any]]
+    # Substrings of EXPLAIN QUERY PLAN lines that must all appear
+    expects: tuple[str, ...] = ()
+    # Tables the case may read in full
+    scans: tuple[str, ...] = ()
+    # Whether a temp B-tree (ORDER BY, GROUP BY, DISTINCT) is expected
+    sorts: bool = False
+    # Global cases run without a user
+    per_user: bool = True
+    # Cases that use up what they measure run once per user
+    once: bool = False
+
+
+@dataclass
+class Result:
+    case: Case
+    times: dict[str, float] = field(default_factory=dict)
+    problems: list[str] = field(default_factory=list)
+    # Each distinct plan with the first statement that had it
+    plans: dict[tuple[str, ...], str] = field(default_factory=dict)
+
+
+class Bench:
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.conns: list[aiosqlite.Connection] = []
+        self.now = int(time.time())
+        self.statements: list[tuple[aiosqlite.Connection, str]] = []
+        self.tracing = False
+
+    async def attach(self) -> list[aiosqlite.Connection]:
+        conns = [self.db, *(c for c in await user_dbs(self.db) if c is not self.db)]
+        for conn in conns:
+            await conn.set_trace_callback(
+                lambda sql, conn=conn: self.tracing and self.statements.append((conn, sql))
+            )
+        return conns
+
+    async def timed(self, case: Case, bench_user: BenchUser | None) -> float:
+        self.tracing = True
+        started = time.perf_counter()
+        try:
+            await case.run(self, bench_user)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.tracing = False
+        return elapsed
+
+    async def explain(self, result: Result) -> None:
+        """Check the plans of the statements traced since the last call."""
+        statements, self.statements = self.statements, []
+        details = []
+        seen = set()
+        for conn, sql in statements:
+            if not _STATEMENT.match(sql) or _FTS_INTERNAL.search(sql) or sql in seen:
+                continue
+            seen.add(sql)
+            cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = tuple(row[3] for row in await cursor.fetchall())
+            result.plans.setdefault(plan, " ".join(sql.split())[:160])
+            details += plan
+        case = result.case
+        for detail in details:
+            scan = _FULL_SCAN.match(detail)
+            if scan and "VIRTUAL TABLE" not in detail and scan.group(1) not in case.scans:
+                result.problems.append(f"full scan: {detail}")
+            if "USE TEMP B-TREE" in detail and not case.sorts:
+                result.problems.append(f"sort: {detail}")
+        for expected in case.expects:
+            if not any(expected in detail for detail in details):
+                result.problems.append(f"not used: {expected}")
+        # One entry per problem across users and runs
+        result.problems = list(dict.fromkeys(result.problems))
+
+
+async def _drain(rows: AsyncIterator[dict]) -> int:
+    return sum([1 async for _ in rows])
+
+
+async def _create_job(bench: Bench, u: BenchUser) -> None:
+    u.job = await jobs.create_job(
+        bench.db, u.user_id, u.user_id, u.last_message_id, "bench", False, OWNER, LLM_JOB_LEASE
+    )
+
+
+async def _claim_reminders(bench: Bench, _: None) -> None:
+    due = await reminders.load_reminders(bench.db, bench.now + 86400, 0, 0, 0)
+    await reminders.claim_reminders(bench.db, due[:REMINDER_BATCH_SIZE], bench.now)
+
+
+def _minute(bench: Bench, minutes_ago: int = 0) -> int:
+    return bench.now // 60 - minutes_ago
+
+
+# In order: the cases that archive and delete history come last
+CASES = [
+    Case(
+        "user.get_or_create_user",
+        # A new username every call takes the write path past the cache
+        lambda b, u: user.get_or_create_user(b.db, u.user_id, f"bench{time.perf_counter_ns()}"),
+        expects=("users USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "user.set_utc_offset",
+        lambda b, u: user.set_utc_offset(b.db, u.user_id, u.utc_offset),
+        expects=("users USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "settings.get_setting",
+        lambda b, u: settings_repo.get_setting(b.db, SYNTHETIC_KEY),
+        expects=("sqlite_autoindex_bot_settings_1",),
+        per_user=False,
+    ),
+    Case(
+        "settings.set_setting",
+        lambda b, u: settings_repo.set_setting(b.db, "querybench", str(b.now)),
+        per_user=False,
+    ),
+    Case(
+        "settings.delete_setting",
+        lambda b, u: settings_repo.delete_setting(b.db, "querybench"),
+        expects=("sqlite_autoindex_bot_settings_1",),
+        per_user=False,
+    ),
+    Case(
+        "conversation.add_message",
+        lambda b, u: conversation.add_message(b.db, u.user_id, "user", _TEXT),
+    ),
+    Case(
+        "conversation.get_messages",
+        lambda b, u: conversation.get_messages(b.db, u.user_id),
+        expects=("idx_conv_user_id",),
+    ),
+    Case(
+        "conversation.get_messages(up_to_id)",
+        lambda b, u: conversation.get_messages(b.db, u.user_id, u.last_message_id),
+        expects=("idx_conv_user_id",),
+    ),
+    Case(
+        "conversation.get_message",
+        lambda b, u: conversation.get_message(b.db, u.user_id, u.last_message_id),
+        expects=("conversation_messages USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "conversation.iter_messages",
+        lambda b, u: _drain(conversation.iter_messages(b.db, u.user_id)),
+        expects=("idx_conv_user_id",),
+    ),
+    Case(
+        "crisis.log_crisis_event",
+        lambda b, u: log_crisis_event(b.db, u.user_id, "keyword", "querybench"),
+    ),
+    Case(
+        "mood.add_entry",
+        lambda b, u: mood.add_entry(b.db, u.user_id, 6, _TEXT),
+        expects=("users USING INTEGER PRIMARY KEY", "mood_entries USING INTEGER PRIMARY KEY"),
+    ),
+    Case(
+        "mood.get_entries_range",
+        lambda b, u: mood.get_entries_range(b.db, u.user_id, 30),
+        expects=("idx_mood_user_local",),
+    ),
+    Case(
+        "mood.iter_entries",
+        lambda b, u: _drain(mood.iter_entries(b.db, u.user_id)),
+        expects=("idx_mood_user_id",),
+    ),
+    Case(
+        "mood.get_daily_range",
+        lambda b, u: mood.get_daily_range(b.db, u.user_id, 365),
+        expects=("mood_daily USING PRIMARY KEY",),
+    ),
+    Case(
+        "mood.get_period_range",
+        lambda b, u: mood.get_period_range(b.db, u.user_id, 365, "month"),
+        expects=("mood_daily USING PRIMARY KEY",),
+        sorts=True,  # GROUP BY the month
+    ),
+    Case(
+        "mood.ensure_daily_rollups",
+        lambda b, u: asyncio.gather(*(mood.ensure_daily_rollups(c) for c in b.conns)),
+        # EXISTS stops at the first row
+        scans=("mood_daily", "mood_entries"),
+        per_user=False,
+    ),
+    Case(
+        "search.search",
+        lambda b, u: search.search(b.db, u.user_id, "сестр*", u.utc_offset, SEARCH_PAGE_SIZE),
+        # One MATCH over each index, then row lookups ("0:=M1" would run the
+        # MATCH once per row of the user)
+        expects=(
+            "conversation_fts VIRTUAL TABLE INDEX 0:M",
+            "mood_fts VIRTUAL TABLE INDEX 0:M",
+            "archive_fts VIRTUAL TABLE INDEX 0:M",
+            "SEARCH m USING INTEGER PRIMARY KEY",
+            "SEARCH e USING INTEGER PRIMARY KEY",
+            "SEARCH a USING INTEGER PRIMARY KEY",
+        ),
+        sorts=True,  # by rank
+    ),
+    Case(
+        "search.backfill_step",
+        lambda b, u: search.backfill_step(
+            b.db, SEARCH_BACKFILL_BATCH, SEARCH_BACKFILL_BLOCKS
+        ),
+        scans=("fts_backfill",),
+        per_user=False,
+    ),
+    Case("jobs.create_job", _create_job),
+    Case(
+        "jobs.renew_lease",
+        lambda b, u: jobs.renew_lease(b.db, u.job, OWNER, LLM_JOB_LEASE),
+        expects=("llm_jobs USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "jobs.save_reply",
+        lambda b, u: jobs.save_reply(b.db, u.job, OWNER, _TEXT),
+        expects=("llm_jobs USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "jobs.release_job",
+        lambda b, u: jobs.release_job(b.db, u.job, OWNER, "querybench"),
+        expects=("llm_jobs USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "jobs.claim_jobs",
+        lambda b, u: jobs.claim_jobs(b.db, OWNER, LLM_JOB_LEASE, LLM_JOB_MAX_ATTEMPTS, 4),
+        expects=("idx_llm_jobs_state",),
+        sorts=True,  # ORDER BY id over two index ranges
+        per_user=False,
+    ),
+    Case(
+        "jobs.finish_job",
+        lambda b, u: jobs.finish_job(b.db, u.job, OWNER),
+        expects=("llm_jobs USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "jobs.prune_jobs",
+        lambda b, u: jobs.prune_jobs(b.db, LLM_JOB_RETENTION_DAYS),
+        expects=("idx_llm_jobs_state",),
+        per_user=False,
+    ),
+    Case(
+        "reminders.set_reminder",
+        lambda b, u: reminders.set_reminder(b.db, u.user_id, u.user_id, 540, u.utc_offset, b.now),
+    ),
+    Case(
+        "reminders.get_reminder",
+        lambda b, u: reminders.get_reminder(b.db, u.user_id),
+        expects=("reminders USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "reminders.reschedule_reminder",
+        lambda b, u: reminders.reschedule_reminder(b.db, u.user_id, u.utc_offset, b.now),
+        expects=("reminders USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "reminders.load_reminders",
+        lambda b, u: reminders.load_reminders(
+            b.db, b.now + REMINDER_WINDOW, b.now, b.now, b.now
+        ),
+        expects=("idx_reminders_next_fire",),
+        per_user=False,
+    ),
+    Case(
+        "reminders.claim_reminders",
+        _claim_reminders,
+        expects=("idx_reminders_next_fire", "SEARCH u USING INTEGER PRIMARY KEY"),
+        per_user=False,
+        once=True,
+    ),
+    Case(
+        "reminders.delete_reminder",
+        lambda b, u: reminders.delete_reminder(b.db, u.user_id),
+        expects=("reminders USING INTEGER PRIMARY KEY",),
+    ),
+    Case(
+        "updates.record_updates",
+        lambda b, u: updates.record_updates(
+            b.db, [(-i, 1, i, b.now) for i in range(1, 101)]
+        ),
+        per_user=False,
+    ),
+    Case(
+        "updates.load_recent_updates",
+        lambda b, u: updates.load_recent_updates(b.db, b.now - 3600),
+        expects=("idx_processed_updates_seen",),
+        per_user=False,
+    ),
+    Case(
+        "updates.prune_updates",
+        lambda b, u: updates.prune_updates(b.db, b.now - 86400),
+        expects=("idx_processed_updates_seen",),
+        per_user=False,
+    ),
+    Case(
+        "usage.add_usage",
+        lambda b, u: usage.add_usage(b.db, [(u.user_id, _minute(b), 1000)]),
+    ),
+    Case(
+        "usage.load_usage",
+        lambda b, u: usage.load_usage(b.db, _minute(b, 60)),
+        expects=("idx_token_usage_minute",),
+        per_user=False,
+    ),
+    Case(
+        "usage.total_usage",
+        lambda b, u: usage.total_usage(b.db, _minute(b, 24 * 60)),
+        expects=("idx_token_usage_minute",),
+        per_user=False,
+    ),
+    Case(
+        "usage.top_consumers",
+        lambda b, u: usage.top_consumers(b.db, _minute(b, 24 * 60)),
+        # Grouping by the primary key reads the table in full, which only
+        # keeps two days of counters
+        scans=("token_usage",),
+        sorts=True,  # ORDER BY the total
+        per_user=False,
+    ),
+    Case(
+        "usage.prune_usage",
+        lambda b, u: usage.prune_usage(b.db, _minute(b, 23 * 60)),
+        expects=("idx_token_usage_minute",),
+        per_user=False,
+    ),
+    Case(
+        "archive.get_users_with_messages",
+        lambda b, u: archive.get_users_with_messages(b.db),
+        expects=("COVERING INDEX idx_conv_user_id",),
+        scans=("conversation_messages",),
+        per_user=False,
+    ),
+    Case(
+        "archive.get_archive_boundary",
+        lambda b, u: archive.get_archive_boundary(b.db, u.user_id, 30, MAX_HISTORY_TOKENS),
+        expects=("idx_conv_user_id",),
+    ),
+    Case(
+        "archive.archive_block",
+        lambda b, u: archive.archive_block(
+            b.db, u.user_id, u.last_message_id, ARCHIVE_BLOCK_MESSAGES
+        ),
+        expects=("idx_conv_user_id",),
+        once=True,
+    ),
+    Case(
+        "archive.iter_archived_messages",
+        lambda b, u: _drain(archive.iter_archived_messages(b.db, u.user_id)),
+        expects=("idx_archive_user_id", "conversation_archive USING INTEGER PRIMARY KEY"),
+    ),
+    Case(
+        "archive.incremental_vacuum",
+        lambda b, u: asyncio.gather(*(
+            archive.incremental_vacuum(c, ARCHIVE_VACUUM_PAGES) for c in b.conns
+        )),
+        per_user=False,
+        once=True,
+    ),
+    Case(
+        "conversation.delete_messages",
+        lambda b, u: conversation.delete_messages(b.db, u.user_id),
+        expects=(
+            "idx_conv_user_id",
+            "idx_archive_user_id",
+            "history_resets USING INTEGER PRIMARY KEY",
+        ),
+        once=True,
+    ),
+    Case(
+        "conversation.purge_step",
+        lambda b, u: conversation.purge_step(
+            b.db, HISTORY_PURGE_MESSAGES, HISTORY_PURGE_BLOCKS
+        ),
+        expects=("idx_conv_user_id", "idx_archive_user_id"),
+        # The next reset to purge, whichever it is
+        scans=("history_resets",),
+        per_user=False,
+    ),
+]
+
+
+async def _pick_users(db: Database) -> dict[str, BenchUser]:
+    counts = []
+    for conn in await user_dbs(db):
+        # Users an earlier run has reset keep their rows until the purge
+        # is done, but none of them can be read
+        cursor = await conn.execute(
+            """
+            SELECT user_id, count(*), max(id) FROM conversation_messages
+            WHERE user_id NOT IN (SELECT user_id FROM history_resets)
+            GROUP BY user_id
+            """
+        )
+        counts += await cursor.fetchall()
+    if not counts:
+        raise SystemExit("The database has no messages")
+    counts.sort(key=lambda row: row[1])
+    picked = {"heavy": counts[-1], "median": counts[len(counts) // 2], "light": counts[0]}
+    users = {}
+    for label, (user_id, messages, last_id) in picked.items():
+        cursor = await db.execute("SELECT utc_offset FROM users WHERE user_id = ?", (user_id,))
+        users[label] = BenchUser(user_id, messages, last_id, (await cursor.fetchone())[0])
+    return users
+
+
+async def run(runs: int) -> list[Result]:
+    await init_db()
+    db = await get_db()
+    try:
+        if await settings_repo.get_setting(db, SYNTHETIC_KEY) is None:
+            raise SystemExit(
+                "Not a database made by bot.tools.datagen; querybench writes to it"
+            )
+        bench = Bench(db)
+        users = await _pick_users(db)
+        for label, u in users.items():
+            logger.info("%6s: user %d, %d messages", label, u.user_id, u.messages)
+        bench.conns = await bench.attach()
+        results = []
+        for case in CASES:
+            result = Result(case)
+            targets = users.items() if case.per_user else [("all", None)]
+            for label, u in targets:
+                times = [
+                    await bench.timed(case, u) for _ in range(1 if case.once else runs)
+                ]
+                result.times[label] = statistics.median(times)
+                await bench.explain(result)
+            results.append(result)
+        return results
+    finally:
+        await db.close()
+
+
+def report(results: list[Result], verbose: bool) -> str:
+    width = max(len(r.case.name) for r in results)
+    lines = [f"{'case':<{width}}  {'heavy':>9}  {'median':>9}  {'light':>9}  plan"]
+    for r in results:
+        columns = (
+            [r.times.get(label) for label in ("heavy", "median", "light")]
+            if r.case.per_user else [r.times["all"], None, None]
+        )
+        cells = "  ".join(
+            f"{t * 1000:9.2f}" if t is not None else " " * 9 for t in columns
+        )
+        lines.append(f"{r.case.name:<{width}}  {cells}  {'FAIL' if r.problems else 'ok'}")
+    for r in results:
+        if r.problems or verbose:
+            lines.append(f"\n{r.case.name}:")
+            lines += [f"  {problem}" for problem in r.problems]
+            for plan, sql in r.plans.items():
+                lines += [f"  {sql}", *(f"    {detail}" for detail in plan)]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(prog="python -m bot.tools.querybench")
+    parser.add_argument("--runs", type=int, default=5, help="calls per case and user")
+    parser.add_argument("--plans", action="store_true", help="print every plan")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.runs))
+    print("times in ms, median of runs\n")
+    print(report(results, args.plans))
+    sys.exit(1 if any(r.problems for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
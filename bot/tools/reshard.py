@@ -0,0 +1,240 @@
+"""Move per-user rows to another number of shards.
+
+    python -m bot.tools.reshard N
+
+Run it with the bot stopped and a fresh backup at hand, then start the bot
+with SHARDS=N. N = 0 brings every row back into DB_PATH.
+
+New shard files are written with a ".new" suffix and take the place of the
+old ones only after the main database records the new layout, together with
+a mark that the files are being installed; the bot does not start while the
+mark is there. A run that was interrupted is finished by running it again.
+
+Ids are unique per file only, so rows are renumbered on the way: the ids of
+each source file are shifted past those already in the target, and the
+message ids of reply jobs and the marks of /reset with them. Archive blocks
+keep the message ids they were archived with, and are indexed for search
+again under their new ids.
+"""
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+
+from bot.config import settings
+from bot.db.models import SCHEMA_VERSION, SHARD_SCHEMA
+from bot.db.repositories.archive_index import INDEX, entries, unpack
+from bot.db.shards import INSTALL_KEY, LAYOUT_KEY, shard_files, shard_path
+
+logger = logging.getLogger(__name__)
+
+_BATCH_ROWS = 10_000
+
+# Per-user tables and their columns; the FTS indexes fill themselves by
+# trigger, but for archive_fts, which _copy fills. Messages and archive blocks
+# come before the rows that point at them.
+_TABLES = {
+    "conversation_messages": (
+        "id", "user_id", "role", "content", "tokens_est", "created_at",
+    ),
+    "conversation_archive": (
+        "id", "user_id", "first_message_id", "last_message_id", "message_count",
+        "first_created_at", "last_created_at", "payload", "archived_at",
+    ),
+    "mood_entries": ("id", "user_id", "score", "note", "created_at", "local_at"),
+    "mood_daily": (
+        "user_id", "day", "entries", "score_sum", "score_min", "score_max", "score_sq_sum",
+    ),
+    "crisis_events": ("id", "user_id", "trigger", "matched", "created_at"),
+    "llm_jobs": (
+        "id", "user_id", "chat_id", "message_id", "reply_message_id", "model", "crisis",
+        "state", "attempts", "lease_owner", "lease_until", "error", "created_at",
+        "updated_at",
+    ),
+    "history_resets": ("user_id", "message_id", "archive_id", "reset_at"),
+}
+# Columns holding ids of another table, shifted along with them
+_REFS = {
+    "message_id": "conversation_messages",
+    "reply_message_id": "conversation_messages",
+    "archive_id": "conversation_archive",
+}
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # Autocommit: transactions are opened explicitly
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _layout(main: sqlite3.Connection) -> int:
+    row = main.execute(
+        "SELECT value FROM bot_settings WHERE key = ?", (LAYOUT_KEY,)
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _create_shard(path: str) -> sqlite3.Connection:
+    if os.path.exists(path):
+        os.remove(path)
+    conn = _connect(path)
+    # Takes effect without a VACUUM while the file is still empty
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("BEGIN")
+    for statement in SHARD_SCHEMA:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("COMMIT")
+    return conn
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection, shards: int, index: int) -> int:
+    """Copy the rows of users in shard `index` of `shards` (all of them when
+    `shards` is 0) from `src` into the open transaction of `dst`.
+    """
+    where, params = ("WHERE user_id % ? = ?", (shards, index)) if shards else ("", ())
+    offsets: dict[str, int] = {}
+    copied = 0
+    for table, columns in _TABLES.items():
+        if "id" in columns:
+            cursor = dst.execute(f"SELECT COALESCE(max(id), 0) FROM {table}")
+            offsets[table] = cursor.fetchone()[0]
+        shifts = [
+            offsets[table] if column == "id"
+            else offsets[_REFS[column]] if column in _REFS
+            else 0
+            for column in columns
+        ]
+        order = "ORDER BY id" if "id" in columns else ""
+        cursor = src.execute(
+            f"SELECT {', '.join(columns)} FROM {table} {where} {order}", params
+        )
+        insert = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        while rows := cursor.fetchmany(_BATCH_ROWS):
+            rows = [
+                [v + s if s and v is not None else v for v, s in zip(row, shifts)]
+                for row in rows
+            ]
+            dst.executemany(insert, rows)
+            if table == "conversation_archive":
+                for block_id, user_id, *_, payload, _ in rows:
+                    dst.executemany(INDEX, entries(block_id, user_id, unpack(payload)))
+            copied += len(rows)
+    return copied
+
+
+def _remove(path: str) -> None:
+    for file in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def _install_new_shards(main: sqlite3.Connection, shards: int) -> None:
+    """Put the ".new" files in place, drop shard files beyond `shards` and
+    clear the install mark. A shard without a ".new" file was installed by an
+    interrupted run already.
+    """
+    keep = {shard_path(index) for index in range(shards)}
+    for path in sorted(keep):
+        if os.path.exists(path + ".new"):
+            _remove(path)
+            os.replace(path + ".new", path)
+    for path in shard_files():
+        if path not in keep:
+            _remove(path)
+    main.execute("DELETE FROM bot_settings WHERE key = ?", (INSTALL_KEY,))
+
+
+def reshard(target: int) -> None:
+    main = _connect(settings.db_path)
+    try:
+        current = _layout(main)
+        new_paths = [shard_path(index) + ".new" for index in range(target)]
+        installing = main.execute(
+            "SELECT EXISTS(SELECT 1 FROM bot_settings WHERE key = ?)", (INSTALL_KEY,)
+        ).fetchone()[0]
+        if current == target and installing:
+            logger.info("Finishing an interrupted run")
+            _install_new_shards(main, target)
+            return
+
+        # Left by a run that did not get to record its layout
+        root, ext = os.path.splitext(settings.db_path)
+        for stale in glob.glob(f"{glob.escape(root)}.shard*{ext}.new"):
+            os.remove(stale)
+        if current == target:
+            logger.info("The database is already laid out in %d shards", target)
+            return
+
+        sources = (
+            [main] if current == 0
+            else [_connect(shard_path(index)) for index in range(current)]
+        )
+        try:
+            if target == 0:
+                main.execute("BEGIN IMMEDIATE")
+                for table in _TABLES:
+                    if main.execute(f"SELECT EXISTS(SELECT 1 FROM {table})").fetchone()[0]:
+                        raise RuntimeError(f"{table} in {settings.db_path} is not empty")
+                for index, src in enumerate(sources):
+                    logger.info("Shard %d: %d rows", index, _copy(src, main, 0, 0))
+            else:
+                for index, path in enumerate(new_paths):
+                    dst = _create_shard(path)
+                    try:
+                        dst.execute("BEGIN")
+                        copied = sum(_copy(src, dst, target, index) for src in sources)
+                        dst.execute("COMMIT")
+                    finally:
+                        dst.close()
+                    logger.info("New shard %d: %d rows", index, copied)
+                main.execute("BEGIN IMMEDIATE")
+                if current == 0:
+                    # Rows first: their FTS triggers still need fts_backfill
+                    for table in _TABLES:
+                        main.execute(f"DELETE FROM {table}")
+                    main.execute("INSERT INTO archive_fts (archive_fts) VALUES ('delete-all')")
+                    main.execute("DELETE FROM fts_backfill")
+            main.executemany(
+                """
+                INSERT INTO bot_settings (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """,
+                [(LAYOUT_KEY, str(target)), (INSTALL_KEY, str(target))],
+            )
+            main.execute("COMMIT")
+        except Exception:
+            if main.in_transaction:
+                main.execute("ROLLBACK")
+            raise
+        finally:
+            for src in sources:
+                if src is not main:
+                    src.close()
+
+        _install_new_shards(main, target)
+        if current == 0:
+            # The pragma frees one page per step, so it has to be fetched to the end
+            main.execute("PRAGMA incremental_vacuum").fetchall()
+        logger.info("Resharded from %d to %d shards; set SHARDS=%d", current, target, target)
+    finally:
+        main.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(prog="python -m bot.tools.reshard")
+    parser.add_argument("shards", type=int, help="new number of shards, 0 for one file")
+    args = parser.parse_args()
+    if args.shards < 0:
+        parser.error("the number of shards cannot be negative")
+    reshard(args.shards)
+
+
+if __name__ == "__main__":
+    main()
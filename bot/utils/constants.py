@@ -4,3 +4,86 @@ RATE_LIMIT_BURST = 3
 RATE_LIMIT_RATE = 0.1  # 1 token per 10 seconds
 LLM_TIMEOUT = 120
 TYPING_INTERVAL = 4
+TYPING_TICK = 0.25
+TYPING_MAX_RATE = 20  # chat actions per second across all chats
+DIARY_PERIODS = (7, 30, 90, 365)
+ARCHIVE_INTERVAL = 3600  # seconds between archival runs
+ARCHIVE_BLOCK_MESSAGES = 500
+ARCHIVE_VACUUM_PAGES = 2000
+# Telegram flood limits: ~1 msg/s per chat, ~30 msg/s per bot
+OUTBOX_CHAT_RATE = 1.0
+OUTBOX_CHAT_BURST = 3
+OUTBOX_GLOBAL_RATE = 30.0
+OUTBOX_GLOBAL_BURST = 30
+OUTBOX_MAX_RETRIES = 3
+EXPORT_FLUSH_BYTES = 256 * 1024
+EXPORT_KEEP_FILES = 3  # bulk exports too big for Telegram kept on disk
+TELEGRAM_MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+ANALYTICS_BATCH_ROWS = 5000
+ANALYTICS_BATCH_PAUSE = 0.02  # seconds the export thread sleeps between batches
+ANALYTICS_PROGRESS_INTERVAL = 5
+ANALYTICS_KEEP_RUNS = 10
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.01
+BACKUP_MAX_RESTARTS = 20  # then finish in a single pass
+WORKER_POLL_TIMEOUT = 10  # long-polling timeout of the front process
+WORKER_PING_INTERVAL = 5
+WORKER_PING_TIMEOUT = 20  # restart a worker silent for this long
+WORKER_RESTART_DELAY = 1
+WORKER_EXIT_GRACE = 10  # over SHUTDOWN_TIMEOUT, for flushes before a worker exits
+MAILBOX_MAX_DEPTH = 3  # turns per user, including the one being answered
+MAILBOX_IDLE_TIMEOUT = 30
+LLM_JOB_LEASE = 60  # seconds; renewed every third of that while a job runs
+LLM_JOB_MAX_ATTEMPTS = 3
+LLM_JOB_POLL_INTERVAL = 10
+LLM_JOB_CONCURRENCY = 4  # resumed jobs per process
+LLM_JOB_RETENTION_DAYS = 7
+LLM_JOB_PRUNE_INTERVAL = 3600
+DEDUP_TTL = 24 * 3600  # Telegram keeps undelivered updates for 24 hours
+DEDUP_MAX_ENTRIES = 50_000
+DEDUP_FLUSH_INTERVAL = 1
+DEDUP_PRUNE_INTERVAL = 3600
+# Token quotas; 0 disables a limit. Admins override them with /quota
+QUOTA_DEFAULTS = {
+    "user_hour": 400_000,
+    "user_day": 2_000_000,
+    "global_hour": 20_000_000,
+    "global_day": 200_000_000,
+}
+QUOTA_DEGRADE_AT = 0.8  # share of a limit after which history is cut down
+QUOTA_DEGRADED_BUDGET = 20_000
+QUOTA_FLUSH_INTERVAL = 30
+LOAD_BUDGET_FACTOR = 0.3  # share of the history budget left when shedding
+LOAD_RECOVER_RATIO = 0.7  # stop shedding below this share of every threshold
+LOAD_COOLDOWN = 60
+LOAD_EWMA_ALPHA = 0.2
+PAYLOAD_CACHE_USERS = 256  # users whose encoded history is kept
+PAYLOAD_THREAD_THRESHOLD = 64 * 1024  # chars to encode before using a thread
+LLM_ENDPOINT_CONCURRENCY = 16  # default per-endpoint limit of calls in flight
+LLM_ENDPOINT_COOLDOWN = 5  # seconds after a 429 without Retry-After, doubling
+LLM_ENDPOINT_EWMA_ALPHA = 0.2
+LLM_ENDPOINT_MAX_FAILURES = 3  # failures in a row before probing takes over
+LLM_ENDPOINT_PROBE_INTERVAL = 30
+HTTP_POOL_SIZE = 100  # connections of the LLM client, all hosts
+HTTP_POOL_PER_HOST = 64
+HTTP_DNS_TTL = 300
+HTTP_KEEPALIVE = 60  # seconds an idle connection stays in the pool
+HTTP_IDLE_PING_INTERVAL = 45  # below HTTP_KEEPALIVE so idle connections survive
+HTTP_WARM_CONNECTIONS = 2  # opened per host at startup
+REMINDER_WINDOW = 50 * 60  # seconds of schedule kept in memory, under an hour
+REMINDER_SYNC_INTERVAL = 60
+REMINDER_BATCH_SIZE = 50
+REMINDER_SEND_RATE = 20  # per second, leaves room under the global flood limit
+REMINDER_GRACE = 2 * 3600  # reminders overdue longer than this are skipped
+SEARCH_PAGE_SIZE = 5
+SEARCH_MAX_TERMS = 8
+SEARCH_BACKFILL_BATCH = 500  # ids per transaction
+SEARCH_BACKFILL_BLOCKS = 2  # archive blocks per transaction
+SEARCH_BACKFILL_PAUSE = 0.1
+USER_CACHE_SIZE = 50_000  # users whose profile row is kept in memory
+DRAIN_POLL_INTERVAL = 0.2
+DRAIN_LOG_INTERVAL = 5
+HISTORY_PURGE_INTERVAL = 30  # seconds between looks for histories hidden by /reset
+HISTORY_PURGE_MESSAGES = 500  # messages deleted per transaction
+HISTORY_PURGE_BLOCKS = 5  # archive blocks deleted per transaction
+HISTORY_PURGE_PAUSE = 0.1
@@ -7,6 +7,8 @@ _BOLD_RE = re.compile(r"\*\*(.+?)\*\*")
 _ITALIC_RE = re.compile(r"(?<!\w)\*([^*]+?)\*(?!\w)")
 _HEADER_RE = re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE)
 
+MAX_CHUNK = 3500  # leave room for HTML tags added by md_to_html
+
 _OPEN_TAG_RE = re.compile(r"<(b|i|code|pre)>")
 _CLOSE_TAG_RE = re.compile(r"</(b|i|code|pre)>")
 
@@ -64,3 +66,49 @@ def sanitize_html(text: str) -> str:
         text += f"</{tag}>"
 
     return text
+
+
+def split_message(text: str, max_len: int = MAX_CHUNK) -> list[str]:
+    """Split text on paragraph boundaries, falling back to sentence/hard split."""
+    if len(text) <= max_len:
+        return [text]
+
+    chunks: list[str] = []
+    while text:
+        if len(text) <= max_len:
+            chunks.append(text)
+            break
+
+        # Try splitting at paragraph boundary (double newline)
+        cut = text.rfind("\n\n", 0, max_len)
+        if cut > 0:
+            chunks.append(text[: cut])
+            text = text[cut + 2 :]
+            continue
+
+        # Try splitting at single newline
+        cut = text.rfind("\n", 0, max_len)
+        if cut > 0:
+            chunks.append(text[: cut])
+            text = text[cut + 1 :]
+            continue
+
+        # Try splitting at sentence boundary
+        cut = text.rfind(". ", 0, max_len)
+        if cut > 0:
+            chunks.append(text[: cut + 1])
+            text = text[cut + 2 :]
+            continue
+
+        # Hard split at space
+        cut = text.rfind(" ", 0, max_len)
+        if cut > 0:
+            chunks.append(text[: cut])
+            text = text[cut + 1 :]
+            continue
+
+        # Last resort: hard cut
+        chunks.append(text[: max_len])
+        text = text[max_len :]
+
+    return chunks
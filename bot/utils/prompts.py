@@ -59,7 +59,7 @@ WELCOME_MESSAGE = """👋 Привет! Я <b>FreePsy</b> — бесплатны
 /breathe — дыхательная техника
 /ground — техника заземления
 /mood — записать настроение
-/diary — дневник за неделю
+/diary — дневник настроения
 /reset — очистить историю
 /help — список команд
 
@@ -71,7 +71,11 @@ HELP_MESSAGE = """📋 <b>Доступные команды:</b>
 🌬 /breathe — дыхательная техника 4-7-8
 🌍 /ground — техника заземления 5-4-3-2-1
 📊 /mood — записать настроение (1-10)
-📓 /diary — дневник настроения за неделю
+📓 /diary — дневник настроения (7, 30, 90 или 365 дней)
+🕒 /timezone — часовой пояс для дневника
+⏰ /remind — ежедневное напоминание о настроении
+🔎 /search — поиск по дневнику и диалогу
+📦 /export — выгрузить мои сообщения и дневник (csv, gz)
 🗑 /reset — очистить историю диалога
 ❓ /help — эта справка
 
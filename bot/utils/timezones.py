@@ -0,0 +1,76 @@
+import re
+
+# Most of our users are in Russia; Moscow time is the least surprising default
+DEFAULT_UTC_OFFSET = 180
+
+# Best guess of a user's UTC offset (minutes) from Telegram's language_code
+LANGUAGE_UTC_OFFSETS = {
+    "ru": 180,
+    "be": 180,
+    "uk": 120,
+    "kk": 300,
+    "uz": 300,
+    "tg": 300,
+    "ky": 360,
+    "az": 240,
+    "hy": 240,
+    "ka": 240,
+}
+
+_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?\s*([+-]?)(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def default_utc_offset(language_code: str | None) -> int:
+    if not language_code:
+        return DEFAULT_UTC_OFFSET
+    return LANGUAGE_UTC_OFFSETS.get(language_code[:2].lower(), DEFAULT_UTC_OFFSET)
+
+
+def parse_utc_offset(text: str) -> int | None:
+    """Parse '+3', '-5', '+5:30', 'UTC+7' into minutes. Returns None if invalid."""
+    m = _OFFSET_RE.match(text.strip())
+    if not m:
+        return None
+    sign, hours, minutes = m.group(1), int(m.group(2)), int(m.group(3) or 0)
+    if minutes >= 60:
+        return None
+    offset = hours * 60 + minutes
+    if sign == "-":
+        offset = -offset
+    if not -12 * 60 <= offset <= 14 * 60:
+        return None
+    return offset
+
+
+def format_utc_offset(offset: int) -> str:
+    sign = "-" if offset < 0 else "+"
+    hours, minutes = divmod(abs(offset), 60)
+    return f"UTC{sign}{hours}:{minutes:02d}" if minutes else f"UTC{sign}{hours}"
+
+
+_TIME_RE = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?$")
+
+
+def parse_time_of_day(text: str) -> int | None:
+    """Parse '21:00', '9:30', '8' into minutes after midnight. None if invalid."""
+    m = _TIME_RE.match(text.strip())
+    if not m:
+        return None
+    hours, minutes = int(m.group(1)), int(m.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_time_of_day(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def next_local_time(minutes: int, utc_offset: int, after: int) -> int:
+    """Unix time of the first `minutes` after local midnight, in a zone with
+    `utc_offset`, that is strictly later than `after` (unix time).
+    """
+    shift = utc_offset * 60
+    local_midnight = (after + shift) // 86400 * 86400 - shift
+    at = local_midnight + minutes * 60
+    return at if at > after else at + 86400
@@ -0,0 +1,233 @@
+"""Multi-process mode (`WORKERS` > 0).
+
+The front process polls Telegram and routes every update by the sender's
+user_id to one of N child processes (`python -m bot --worker INDEX`), each
+running the regular dispatcher. Updates travel as JSON lines over the child's
+stdin, so a user's updates always reach the same process in the order
+Telegram delivered them, and in-memory per-user state (FSM, rate limits,
+admin model lists) works as in single-process mode.
+
+Workers answer health pings on stdout; one that exits or stops answering is
+restarted. Background jobs (archival, backups, analytics) run in the front
+process only. On shutdown the front stops polling and closes the workers'
+stdin; each drains its updates in progress (bot/services/lifecycle.py) and
+exits.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bot.config import settings
+from bot.services import lifecycle, metrics, outbox, quota
+from bot.services.llm import keepalive_loop
+from bot.services.typing_indicator import typing_indicator
+from bot.utils.constants import (
+    TYPING_MAX_RATE,
+    WORKER_PING_INTERVAL,
+    WORKER_PING_TIMEOUT,
+    WORKER_POLL_TIMEOUT,
+    WORKER_EXIT_GRACE,
+    WORKER_RESTART_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+_PING = b'{"ping": 1}\n'
+_PONG = b"pong\n"
+# Updates are a few KB; leave plenty of room over asyncio's 64 KB default
+_LINE_LIMIT = 4 * 1024 * 1024
+
+
+class _Worker:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.process: asyncio.subprocess.Process | None = None
+        self.last_pong = 0.0
+        self._reader: asyncio.Task | None = None
+        # The router and the supervisor can find the worker dead at once
+        self._restarting = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self.process is not None
+            and self.process.returncode is None
+            and time.monotonic() - self.last_pong < WORKER_PING_TIMEOUT
+        )
+
+    async def start(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bot", "--worker", str(self.index),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        self.last_pong = time.monotonic()
+        self._reader = asyncio.create_task(self._read_pongs(self.process))
+        logger.info("Worker %d started (pid %d)", self.index, self.process.pid)
+
+    async def _read_pongs(self, process: asyncio.subprocess.Process) -> None:
+        while line := await process.stdout.readline():
+            if line == _PONG:
+                self.last_pong = time.monotonic()
+
+    async def send(self, line: bytes) -> None:
+        self.process.stdin.write(line)
+        await self.process.stdin.drain()
+
+    async def stop(self) -> None:
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            # EOF on stdin lets the worker finish in-flight updates and exit
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(
+                    self.process.wait(), settings.shutdown_timeout + WORKER_EXIT_GRACE
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Worker %d did not exit in time, killing it", self.index)
+                self.process.kill()
+                await self.process.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+
+    async def restart(self, dead: asyncio.subprocess.Process | None) -> None:
+        """Replace the `dead` process with a new one, unless another caller
+        already has.
+        """
+        async with self._restarting:
+            if self.process is not dead:
+                return
+            metrics.inc("worker_restarts")
+            if self.process is not None and self.process.returncode is None:
+                self.process.kill()
+                await self.process.wait()
+            if self._reader is not None:
+                self._reader.cancel()
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            await self.start()
+
+
+def _user_id(update: Update) -> int:
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:
+        # Update types aiogram does not know about
+        return 0
+    return user.id if user is not None else 0
+
+
+async def _route(workers: list[_Worker], update: Update) -> None:
+    worker = workers[_user_id(update) % len(workers)]
+    payload = update.model_dump(mode="json", exclude_unset=True, by_alias=True)
+    line = json.dumps({"update": payload}, ensure_ascii=False).encode() + b"\n"
+    process = worker.process
+    try:
+        await worker.send(line)
+    except (BrokenPipeError, ConnectionResetError):
+        logger.warning("Worker %d is gone, restarting it", worker.index)
+        try:
+            await worker.restart(process)
+            await worker.send(line)
+        except Exception:
+            # Polling goes on; the supervisor retries the restart
+            logger.exception(
+                "Worker %d failed again, dropping update %d", worker.index, update.update_id
+            )
+            metrics.inc("updates_dropped")
+            return
+    metrics.inc("updates_routed")
+
+
+async def _supervise(workers: list[_Worker]) -> None:
+    while True:
+        await asyncio.sleep(WORKER_PING_INTERVAL)
+        for worker in workers:
+            process = worker.process
+            try:
+                if not worker.alive:
+                    logger.warning("Worker %d is not responding, restarting it", worker.index)
+                    await worker.restart(process)
+                    continue
+                try:
+                    await worker.send(_PING)
+                except (BrokenPipeError, ConnectionResetError):
+                    await worker.restart(process)
+            except Exception:
+                logger.exception("Failed to restart worker %d", worker.index)
+
+
+async def run_front(bot: Bot) -> None:
+    """Poll Telegram and fan updates out to worker processes until cancelled.
+
+    Cancelling stops polling and waits for the workers to drain and exit.
+    """
+    workers = [_Worker(i) for i in range(settings.workers)]
+    for worker in workers:
+        await worker.start()
+    metrics.register_gauge("workers_alive", lambda: sum(w.alive for w in workers))
+    supervisor = asyncio.create_task(_supervise(workers))
+
+    offset: int | None = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=WORKER_POLL_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to fetch updates")
+                await asyncio.sleep(WORKER_RESTART_DELAY)
+                continue
+            for update in updates:
+                await _route(workers, update)
+                offset = update.update_id + 1
+    finally:
+        supervisor.cancel()
+        await asyncio.gather(*(w.stop() for w in workers), return_exceptions=True)
+
+
+async def _feed(dp: Dispatcher, bot: Bot, raw: dict) -> None:
+    try:
+        await dp.feed_raw_update(bot, raw)
+    except Exception:
+        logger.exception("Failed to process update %s", raw.get("update_id"))
+
+
+async def run_worker(index: int, bot: Bot, dp: Dispatcher) -> None:
+    """Process updates sent by the front process until stdin is closed."""
+    share = 1 / settings.workers
+    # The flood limits are per bot token, so every worker gets its share
+    outbox.set_global_share(share)
+    typing_indicator.max_rate = max(1.0, TYPING_MAX_RATE * share)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_LINE_LIMIT)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer
+    )
+
+    quota_task = asyncio.create_task(quota.quota_loop())
+    http_task = asyncio.create_task(keepalive_loop())
+
+    lifecycle.set_state(lifecycle.SERVING)
+    logger.info("Worker %d ready", index)
+    while line := await reader.readline():
+        message = json.loads(line)
+        if "ping" in message:
+            sys.stdout.buffer.write(_PONG)
+            sys.stdout.buffer.flush()
+            continue
+        lifecycle.track(asyncio.create_task(_feed(dp, bot, message["update"])))
+
+    logger.info("Worker %d stopping", index)
+    await lifecycle.drain(settings.shutdown_timeout)
+    quota_task.cancel()
+    http_task.cancel()
+    # The front process checkpoints once every worker is gone
+    await lifecycle.close(bot, checkpoint_wal=False)
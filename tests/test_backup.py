@@ -0,0 +1,62 @@
+"""Stepped backups finish while another connection keeps writing."""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from bot.db.backup import copy_database  # noqa: E402
+
+_ROWS = 5_000
+# Far more steps than an uninterrupted copy needs
+_MAX_STEPS = 1_000
+
+
+class BackupTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self._dir.name, "source.db")
+        # Written to from the copy's worker thread
+        self.writer = sqlite3.connect(
+            self.source, isolation_level=None, check_same_thread=False
+        )
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)")
+        self.writer.execute("BEGIN")
+        self.writer.executemany(
+            "INSERT INTO t (body) VALUES (?)", (("x" * 800,) for _ in range(_ROWS))
+        )
+        self.writer.execute("COMMIT")
+
+    def tearDown(self) -> None:
+        self.writer.close()
+        self._dir.cleanup()
+
+    def test_writes_between_steps(self) -> None:
+        steps = 0
+
+        def write_between_steps(copied: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            if steps > _MAX_STEPS:
+                raise AssertionError(f"no end to the copy at {copied} of {total} pages")
+            self.writer.execute("UPDATE t SET body = ? WHERE id = 1", (str(steps),))
+
+        dest = os.path.join(self._dir.name, "copy.db")
+        asyncio.run(copy_database(
+            dest, source=self.source, pages=50, max_restarts=3,
+            progress=write_between_steps,
+        ))
+        copy = sqlite3.connect(dest)
+        try:
+            self.assertEqual(copy.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            self.assertEqual(copy.execute("SELECT count(*) FROM t").fetchone()[0], _ROWS)
+        finally:
+            copy.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Query plan checks of bot.tools.querybench on a small generated database.
+
+    python -m unittest
+
+A schema or query change that makes a repository function scan, sort or
+miss its index fails here, in both storage layouts.
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from bot.config import replace_settings  # noqa: E402
+from bot.tools import datagen, querybench  # noqa: E402
+from bot.tools.reshard import reshard  # noqa: E402
+
+_USERS = 300
+_MESSAGES = 20_000
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        replace_settings(db_path=os.path.join(self._dir.name, "plans.db"), shards=0)
+        datagen.generate(_USERS, _MESSAGES, years=1, seed=1)
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def assert_plans(self) -> None:
+        results = asyncio.run(querybench.run(runs=1))
+        failed = [r for r in results if r.problems]
+        if failed:
+            self.fail("\n" + querybench.report(failed, verbose=False))
+
+    def test_plans(self) -> None:
+        self.assert_plans()
+        # The first run reset its users; the second must pick others
+        self.assert_plans()
+
+    def test_plans_sharded(self) -> None:
+        reshard(2)
+        replace_settings(shards=2)
+        self.assert_plans()
+
+
+if __name__ == "__main__":
+    unittest.main()
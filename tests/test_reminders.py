@@ -0,0 +1,98 @@
+"""The reminder scheduler keeps reminders it failed to claim or to notice."""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from bot.config import replace_settings  # noqa: E402
+from bot.db.engine import get_db, init_db  # noqa: E402
+from bot.db.repositories import reminders as repo  # noqa: E402
+from bot.db.repositories import user  # noqa: E402
+from bot.services import reminders  # noqa: E402
+
+_USER = 1
+
+
+class ReminderTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        replace_settings(db_path=os.path.join(self._dir.name, "reminders.db"), shards=0)
+        await init_db()
+        # Every test has a new database
+        user._known.clear()
+        self.now = int(time.time())
+        # Due a minute ago and last changed long before the last sync
+        self.due = self.now - 60
+        db = await get_db()
+        try:
+            await user.get_or_create_user(db, _USER)
+            await repo.set_reminder(db, _USER, _USER, 9 * 60, 0, self.now)
+            await db.execute(
+                "UPDATE reminders SET next_fire_at = ?, updated_at = ?",
+                (self.due, self.now - 3600),
+            )
+            await db.commit()
+        finally:
+            await db.close()
+        reminders._wheel = reminders.TimerWheel(self.now)
+        reminders._scheduled.clear()
+        reminders._loaded_until = self.now + 60
+        deliver = mock.patch.object(reminders, "_deliver", mock.AsyncMock())
+        self.deliver = deliver.start()
+        self.addCleanup(deliver.stop)
+
+    async def asyncTearDown(self) -> None:
+        reminders._wheel = None
+        self._dir.cleanup()
+
+    def fired(self) -> list[tuple[int, int]]:
+        return reminders._wheel.advance(int(time.time()))
+
+    async def test_sync_loads_overdue(self) -> None:
+        await reminders._sync(since=self.now)
+        self.assertEqual(self.fired(), [(self.due, _USER)])
+
+    async def test_failed_claim_is_retried(self) -> None:
+        claim = repo.claim_reminders
+        calls = []
+
+        async def locked_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return await claim(*args)
+
+        reminders._scheduled[_USER] = self.due
+        queue: asyncio.Queue = asyncio.Queue()
+        with mock.patch.object(reminders, "claim_reminders", locked_once):
+            sender = asyncio.create_task(reminders._send_batches(mock.Mock(), queue))
+            with self.assertLogs(reminders.logger, "ERROR"):
+                queue.put_nowait((_USER, self.due))
+                await asyncio.sleep(0.2)
+            self.assertEqual(self.fired(), [(self.due, _USER)])
+            self.deliver.assert_not_called()
+
+            queue.put_nowait((_USER, self.due))
+            await asyncio.sleep(0.2)
+            queue.put_nowait(None)
+            await sender
+
+        self.assertEqual(len(calls), 2)
+        self.deliver.assert_called_once()
+        self.assertEqual(reminders._scheduled, {})
+        db = await get_db()
+        try:
+            reminder = await repo.get_reminder(db, _USER)
+        finally:
+            await db.close()
+        self.assertGreater(reminder["next_fire_at"], self.now)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""bot.tools.reshard on a small generated database, with a run that dies
+while it puts the new shard files in place.
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from bot.config import replace_settings, settings  # noqa: E402
+from bot.db.engine import init_db  # noqa: E402
+from bot.db.shards import shard_files, shard_path  # noqa: E402
+from bot.tools import datagen, reshard  # noqa: E402
+
+
+def _user_ids(path: str) -> list[int]:
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT user_id FROM conversation_messages"
+        )]
+    finally:
+        conn.close()
+
+
+class ReshardTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        replace_settings(db_path=os.path.join(self._dir.name, "reshard.db"), shards=0)
+        datagen.generate(30, 2_000, years=1, seed=1)
+        self.users = _user_ids(settings.db_path)
+        reshard.reshard(2)
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def assert_layout(self, shards: int) -> None:
+        self.assertEqual(shard_files(), [shard_path(index) for index in range(shards)])
+        found = []
+        for index in range(shards):
+            users = _user_ids(shard_path(index))
+            self.assertTrue(all(user % shards == index for user in users), index)
+            found += users
+        self.assertCountEqual(found, self.users)
+
+    def test_interrupted_install(self) -> None:
+        replace = os.replace
+        calls = []
+
+        def crash_after_first(src: str, dst: str) -> None:
+            if calls:
+                raise KeyboardInterrupt
+            calls.append(dst)
+            replace(src, dst)
+
+        with mock.patch.object(reshard.os, "replace", crash_after_first):
+            with self.assertRaises(KeyboardInterrupt):
+                reshard.reshard(3)
+        self.assertTrue(os.path.exists(shard_path(1) + ".new"))
+
+        # The layout is recorded, but the files are not all there yet
+        replace_settings(shards=3)
+        with self.assertRaisesRegex(RuntimeError, "interrupted"):
+            asyncio.run(init_db())
+
+        reshard.reshard(3)
+        self.assertFalse(os.path.exists(shard_path(1) + ".new"))
+        self.assert_layout(3)
+        asyncio.run(init_db())
+
+    def test_back_to_one_file(self) -> None:
+        reshard.reshard(0)
+        self.assertEqual(shard_files(), [])
+        self.assertCountEqual(_user_ids(settings.db_path), self.users)
+
+
+if __name__ == "__main__":
+    unittest.main()
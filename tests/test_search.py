@@ -0,0 +1,95 @@
+"""/search finds a user's own messages, archived ones too, and nobody else's."""
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from bot.config import replace_settings  # noqa: E402
+from bot.db.engine import get_db, init_db  # noqa: E402
+from bot.db.repositories import archive, conversation, user  # noqa: E402
+from bot.db.repositories.search import MATCH_END, MATCH_START, search  # noqa: E402
+from bot.services.search import to_match_query  # noqa: E402
+
+_USER = 1
+_OTHER = 2
+
+
+class MatchQueryTest(unittest.TestCase):
+    def test_words_become_prefixes(self) -> None:
+        self.assertEqual(to_match_query("Поругалась с сестрой"), '"поругала"* "сестр"*')
+
+    def test_short_words_dropped_unless_alone(self) -> None:
+        self.assertEqual(to_match_query("я и он"), '"я"* "и"* "он"*')
+        self.assertEqual(to_match_query("кот и я"), '"кот"*')
+
+    def test_nothing_to_search(self) -> None:
+        self.assertIsNone(to_match_query(" ?! "))
+
+    def test_quotes_cannot_break_the_query(self) -> None:
+        self.assertEqual(to_match_query('сон" OR "работа'), '"сон"* "работ"*')
+
+
+class SearchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        replace_settings(db_path=os.path.join(self._dir.name, "search.db"), shards=0)
+        await init_db()
+        # Every test has a new database
+        user._known.clear()
+        self.db = await get_db()
+        for user_id in (_USER, _OTHER):
+            await user.get_or_create_user(self.db, user_id)
+            await conversation.add_message(self.db, user_id, "user", "Поссорилась с сестрой")
+            await conversation.add_message(self.db, user_id, "assistant", "Что случилось?")
+        self.live = await conversation.add_message(
+            self.db, _USER, "user", "Сестра позвонила и извинилась"
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.db.close()
+        self._dir.cleanup()
+
+    async def find(self, text: str, user_id: int = _USER) -> list[dict]:
+        return await search(self.db, user_id, to_match_query(text), 0, 10)
+
+    async def archive(self, user_id: int) -> None:
+        up_to = self.live - 1 if user_id == _USER else self.live
+        self.assertTrue(await archive.archive_block(self.db, user_id, up_to, 100))
+
+    async def test_own_messages_only(self) -> None:
+        hits = await self.find("сестра")
+        self.assertEqual(len(hits), 2)
+        self.assertTrue(all(h["kind"] == "message" and h["role"] == "user" for h in hits))
+        self.assertTrue(all(MATCH_START in h["snippet"] for h in hits))
+        self.assertEqual(len(await self.find("сестра", _OTHER)), 1)
+
+    async def test_archived_messages(self) -> None:
+        await self.archive(_USER)
+        await self.archive(_OTHER)
+        hits = await self.find("поссорилась")
+        self.assertEqual(len(hits), 1)
+        hit = hits[0]
+        self.assertEqual((hit["kind"], hit["role"]), ("message", "user"))
+        self.assertIn(f"{MATCH_START}Поссорилась{MATCH_END}", hit["snippet"])
+        self.assertRegex(hit["local_at"], r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$")
+        self.assertEqual(len(await self.find("сестра")), 2)
+
+    async def test_reset_hides_and_purge_unindexes(self) -> None:
+        await self.archive(_USER)
+        await self.archive(_OTHER)
+        await conversation.delete_messages(self.db, _USER)
+        self.assertEqual(await self.find("сестра"), [])
+        while await conversation.purge_step(self.db, 100, 10):
+            pass
+        cursor = await self.db.execute(
+            "SELECT count(*) FROM archive_fts WHERE archive_fts MATCH ?", (f'owner:"u{_USER}"',)
+        )
+        self.assertEqual((await cursor.fetchone())[0], 0)
+        await self.db.execute("INSERT INTO archive_fts (archive_fts) VALUES ('integrity-check')")
+        self.assertEqual(len(await self.find("поссорилась", _OTHER)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()